@@ -3,29 +3,62 @@
 import yaml
 
 from .inventory import Inventory  # noqa: F401
+from .lockfile import Lockfile  # noqa: F401
 from .playbook import Playbook  # noqa: F401
+from .role_store import DependencyResolver, RoleStore, requirement_key  # noqa: F401
+from ..utils.fingerprint import fingerprint_file
 
 
-def is_test_playbook_file(path):
+def is_test_playbook_file(path, collection_cache=None):
     has_test_prefix = path.basename.startswith('test_')
 
-    return has_test_prefix and is_playbook_file(path)
+    return has_test_prefix and is_playbook_file(path, collection_cache)
 
 
-def is_playbook_file(path):
+def is_playbook_file(path, collection_cache=None):
     is_yaml_file = path.ext == '.yml'
 
     if is_yaml_file:
-        yaml_file_content = yaml.safe_load(path.read())
-        yaml_file_is_ansible_playbook = is_playbook_content(yaml_file_content)
+        if collection_cache is None:
+            return is_playbook_yaml_file(path)
+
+        digest = fingerprint_file(path)
+        yaml_file_is_ansible_playbook = collection_cache.get_is_playbook(path, digest)
+
+        if yaml_file_is_ansible_playbook is None:
+            yaml_file_is_ansible_playbook = bool(is_playbook_yaml_file(path))
+            collection_cache.set_is_playbook(path, digest, yaml_file_is_ansible_playbook)
 
         return yaml_file_is_ansible_playbook
 
     return False
 
 
+def is_playbook_yaml_file(path):
+    yaml_file_content = yaml.safe_load(path.read())
+    yaml_file_is_ansible_playbook = is_playbook_content(yaml_file_content)
+
+    return yaml_file_is_ansible_playbook
+
+
 def is_playbook_content(content):
     return isinstance(content, list) \
         and len(content) \
         and isinstance(content[0], dict) \
         and (content[0].get('hosts') or content[0].get('include'))
+
+
+def role_meta_dependencies(role_path):
+    role_meta_path = role_path.join('meta', 'main.yml')
+    if not role_meta_path.check(file=True):
+        return []
+
+    role_meta_content = yaml.safe_load(role_meta_path.read()) or {}
+    return role_meta_content.get('dependencies') or []
+
+
+def role_dependency_name(dependency):
+    if isinstance(dependency, dict):
+        dependency = dependency.get('role') or dependency.get('name') or dependency.get('src', '')
+
+    return str(dependency).split(',')[0].strip()
@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 
 import json
+import os
+import struct
+import time
 
 from ansible.plugins.callback import CallbackBase
 
@@ -16,6 +19,11 @@ class CallbackModule(CallbackBase):
         self.previous_task = None
         self.previously_ended_task = None
         self.task = None
+        self.playbook_path = None
+
+        self.event_stream = open_event_stream()
+        self.event_sequence = 0
+        self.ack_stream = open_ack_stream()
 
         self.reset_per_host_outcomes()
 
@@ -42,13 +50,31 @@ class CallbackModule(CallbackBase):
         return task and getattr(task, 'name') and 'test' in task.tags
 
     def playbook_on_test_task_start(self, task):
+        if self.ack_stream is not None:
+            self.checkpoint(task)
+
         self.send_event('test-task-start', name=task.name)
 
+    def checkpoint(self, task):
+        # goodplay snapshots the hosts before the first test task is run,
+        # which continues as soon as goodplay acknowledges it
+        ack_stream, self.ack_stream = self.ack_stream, None
+
+        self.send_event('checkpoint', name=task.name)
+        ack_stream.readline()
+        ack_stream.close()
+
     def send_event(self, event_name, **kwargs):
-        event_line_prefix = 'GOODPLAY => '
-        event_json = json.dumps(dict(event_name=event_name, data=kwargs))
-        msg = event_line_prefix + event_json
-        self._display.display(msg)
+        if self.event_stream is None:
+            return
+
+        self.event_sequence += 1
+        payload = json.dumps(dict(
+            sequence=self.event_sequence, timestamp=time.time(),
+            event_name=event_name, data=dict(kwargs, playbook=self.playbook_path))).encode('utf-8')
+
+        self.event_stream.write(struct.pack('>I', len(payload)) + payload)
+        self.event_stream.flush()
 
     def playbook_on_task_end(self, task):
         if self.is_test_task(task):
@@ -63,6 +89,11 @@ class CallbackModule(CallbackBase):
     def v2_playbook_on_play_start(self, play):
         self.check_and_handle_playbook_on_task_end()
 
+        # tag events by the playbook the play originates from, as multiple
+        # playbooks can be run at once by including them in a batch playbook
+        self.playbook_path = play_source_path(play)
+        self.send_event('play-start')
+
     def v2_playbook_on_stats(self, stats):
         self.check_and_handle_playbook_on_task_end()
 
@@ -124,3 +155,24 @@ class CallbackModule(CallbackBase):
             self.add_per_host_outcome(host, outcome, res)
             return True
         return False
+
+
+def play_source_path(play):
+    ansible_pos = getattr(play.get_ds(), 'ansible_pos', None)
+
+    if ansible_pos and ansible_pos[0]:
+        return os.path.realpath(ansible_pos[0])
+
+
+def open_event_stream():
+    event_fd = os.environ.get('GOODPLAY_EVENT_FD')
+
+    if event_fd:
+        return os.fdopen(int(event_fd), 'wb')
+
+
+def open_ack_stream():
+    ack_fd = os.environ.get('GOODPLAY_ACK_FD')
+
+    if ack_fd:
+        return os.fdopen(int(ack_fd), 'rb')
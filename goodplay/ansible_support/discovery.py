@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+import contextlib
+
+import ansible.constants
+import ansible.errors
+import ansible.playbook
+import ansible.playbook.block
+import ansible.template
+import ansible.utils.unicode
+
+from .inventory import Inventory
+
+
+def discover_tasks(playbook_path, inventory_path, roles_path):
+    try:
+        return list(load_tasks(playbook_path, inventory_path, roles_path))
+    except ansible.errors.AnsibleError as e:
+        error_message = ansible_error_message(e)
+
+    # raised outside of the except clause to not chain the ansible error
+    # to it on python 3
+    raise Exception(error_message)
+
+
+def load_tasks(playbook_path, inventory_path, roles_path):
+    inventory = Inventory(inventory_path)
+
+    with ansible_roles_path(roles_path):
+        playbook = ansible.playbook.Playbook.load(
+            str(playbook_path), variable_manager=inventory.variable_manager,
+            loader=inventory.loader)
+        inventory.inventory.set_playbook_basedir(str(playbook_path.dirpath()))
+
+        for play in playbook.get_plays():
+            for task in play_tasks(inventory, playbook, play):
+                yield task
+
+
+def ansible_error_message(error):
+    # same message as printed by ansible-playbook, which prefixes it unless
+    # the ansible version at hand already includes the prefix in the message
+    message = to_str(error)
+
+    if not message.startswith('ERROR!'):
+        message = 'ERROR! {0}'.format(message)
+
+    return message
+
+
+def play_tasks(inventory, playbook, play):
+    loader = inventory.loader
+    loader.set_basedir(play._included_path or playbook._basedir)
+
+    all_vars = inventory.variable_manager.get_vars(loader=loader, play=play)
+    templar = ansible.template.Templar(loader=loader, variables=all_vars)
+    validated_play = play.copy()
+    validated_play.post_validate(templar)
+
+    play_tags = set(validated_play.tags)
+
+    for block in validated_play.compile():
+        for task in block_tasks(block):
+            yield task_name_and_tags(task, play_tags)
+
+
+def task_name_and_tags(task, play_tags):
+    name = task.get_name() if task.name else task.action
+    tags = sorted(play_tags.union(task.tags))
+
+    return to_str(name), [to_str(tag) for tag in tags]
+
+
+def to_str(value):
+    return ansible.utils.unicode.to_str(value)
+
+
+def block_tasks(block):
+    # tasks in rescue and always sections are not considered as these are
+    # only run conditionally
+    for task in block.block:
+        if isinstance(task, ansible.playbook.block.Block):
+            for nested_task in block_tasks(task):
+                yield nested_task
+        elif task.action != 'meta':
+            yield task
+
+
+@contextlib.contextmanager
+def ansible_roles_path(roles_path):
+    # roles path is kept as module state and can therefore only be
+    # overridden temporarily
+    default_roles_path = ansible.constants.DEFAULT_ROLES_PATH
+    ansible.constants.DEFAULT_ROLES_PATH = roles_path
+
+    try:
+        yield
+    finally:
+        ansible.constants.DEFAULT_ROLES_PATH = default_roles_path
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+
+import collections
+import fcntl
+import json
+import os
+import struct
+import threading
+
+EVENT_FD_ENV_NAME = 'GOODPLAY_EVENT_FD'
+ACK_FD_ENV_NAME = 'GOODPLAY_ACK_FD'
+
+# each frame consists of its payload's length followed by the JSON payload
+frame_header = struct.Struct('>I')
+
+
+class EventChannel(object):
+    def __init__(self):
+        read_fd, self.write_fd = os.pipe()
+
+        # only the write end is meant to be inherited by ansible-playbook
+        set_close_on_exec(read_fd)
+        set_inheritable(self.write_fd)
+
+        self.reader = os.fdopen(read_fd, 'rb')
+        self.last_sequence = 0
+
+    def env(self):
+        return {EVENT_FD_ENV_NAME: str(self.write_fd)}
+
+    def env_fds(self):
+        return {EVENT_FD_ENV_NAME: self.write_fd}
+
+    def close_write_end(self):
+        if self.write_fd is not None:
+            os.close(self.write_fd)
+            self.write_fd = None
+
+    def receive(self):
+        header = read_exactly(self.reader, frame_header.size)
+        if not header:
+            return
+
+        payload_size, = frame_header.unpack(header)
+        frame = json.loads(read_exactly(self.reader, payload_size).decode('utf-8'))
+
+        if frame['sequence'] != self.last_sequence + 1:
+            raise Exception(
+                'goodplay event out of sequence: expected {0}, got {1}'.format(
+                    self.last_sequence + 1, frame['sequence']))
+        self.last_sequence = frame['sequence']
+
+        return frame
+
+    def __iter__(self):
+        while True:
+            frame = self.receive()
+            if frame is None:
+                break
+            yield frame
+
+    def close(self):
+        self.close_write_end()
+        self.reader.close()
+
+
+# reverse direction of an event channel, used to let ansible-playbook
+# continue after it has been waiting for goodplay
+class AckChannel(object):
+    def __init__(self):
+        self.read_fd, write_fd = os.pipe()
+
+        # only the read end is meant to be inherited by ansible-playbook
+        set_close_on_exec(write_fd)
+        set_inheritable(self.read_fd)
+
+        self.writer = os.fdopen(write_fd, 'wb')
+
+    def env(self):
+        return {ACK_FD_ENV_NAME: str(self.read_fd)}
+
+    def env_fds(self):
+        return {ACK_FD_ENV_NAME: self.read_fd}
+
+    def close_read_end(self):
+        if self.read_fd is not None:
+            os.close(self.read_fd)
+            self.read_fd = None
+
+    def ack(self):
+        try:
+            self.writer.write(b'\n')
+            self.writer.flush()
+        except (IOError, OSError):
+            # ansible-playbook terminated in the meantime
+            pass
+
+    def close(self):
+        self.close_read_end()
+
+        try:
+            self.writer.close()
+        except (IOError, OSError):
+            pass
+
+
+class EventFuture(object):
+    def __init__(self):
+        self.resolved = threading.Event()
+        self.event = None
+
+    def resolve(self, event=None):
+        if not self.resolved.is_set():
+            self.event = event
+            self.resolved.set()
+
+    def result(self, timeout=None):
+        self.resolved.wait(timeout)
+
+        return self.event
+
+
+class EventDispatcher(object):
+    def __init__(self, event_channel):
+        self.event_channel = event_channel
+
+        self.futures = {}
+        self.received_events = []
+        self.errors = []
+        self.playbook_errors = collections.defaultdict(list)
+        self.finished = False
+        self.finished_playbooks = set()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.dispatch_events)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def join(self):
+        self._thread.join()
+
+    def future(self, event_name, name, playbook=None):
+        with self._condition:
+            key = (event_name, playbook, name)
+
+            if key not in self.futures:
+                self.futures[key] = EventFuture()
+                # events can no longer arrive once finished
+                if self.finished or playbook in self.finished_playbooks:
+                    self.futures[key].resolve()
+
+            return self.futures[key]
+
+    def wait(self, event_name, name, timeout=None, playbook=None):
+        return self.future(event_name, name, playbook).result(timeout)
+
+    def errors_of(self, playbook=None):
+        return self.errors + self.playbook_errors.get(playbook, [])
+
+    def iter_events(self, timeout=None):
+        index = 0
+
+        while True:
+            with self._condition:
+                if index == len(self.received_events) and not self.finished:
+                    self._condition.wait(timeout)
+
+                if index == len(self.received_events):
+                    # either finished or no event arrived within timeout
+                    return
+
+                event = self.received_events[index]
+            index += 1
+
+            yield event
+
+    def dispatch_events(self):
+        try:
+            for event in self.event_channel:
+                with self._condition:
+                    self.received_events.append(event)
+                    self._condition.notify_all()
+
+                self.dispatch_event(event)
+        except Exception as e:
+            self.errors.append(str(e))
+        finally:
+            self.finish()
+
+    def dispatch_event(self, event):
+        data = event['data']
+        playbook = data.get('playbook')
+
+        if event['event_name'] != 'error':
+            self.future(event['event_name'], data.get('name'), playbook).resolve(event)
+            # also resolves waiting for the first event of a name only
+            self.future(event['event_name'], None).resolve(event)
+        elif playbook is None:
+            self.errors.append(data['message'])
+            # stop waiting for any other event once an error occurred
+            self.finish()
+        else:
+            self.playbook_errors[playbook].append(data['message'])
+            # other playbooks of the same run are still waited for
+            self.finish_playbook(playbook)
+
+    def finish_playbook(self, playbook):
+        with self._condition:
+            self.finished_playbooks.add(playbook)
+
+            for key, future in self.futures.items():
+                if key[1] == playbook:
+                    future.resolve()
+
+    def finish(self):
+        with self._condition:
+            self.finished = True
+            self._condition.notify_all()
+
+            for future in self.futures.values():
+                future.resolve()
+
+
+def read_exactly(stream, size):
+    chunks = []
+    remaining = size
+
+    while remaining:
+        chunk = stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+
+    data = b''.join(chunks)
+    if data and remaining:
+        raise Exception('goodplay event channel closed in the middle of a frame')
+
+    return data
+
+
+def set_close_on_exec(fd):
+    flags = fcntl.fcntl(fd, fcntl.F_GETFD)
+    fcntl.fcntl(fd, fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
+
+
+def set_inheritable(fd):
+    # file descriptors are non-inheritable by default since Python 3.4
+    if hasattr(os, 'set_inheritable'):
+        os.set_inheritable(fd, True)
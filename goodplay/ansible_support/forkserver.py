@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+
+from distutils.spawn import find_executable
+import logging
+import multiprocessing.connection
+import multiprocessing.reduction
+import os
+import runpy
+import signal
+import subprocess
+import sys
+import threading
+import time
+import traceback
+
+import py.path
+
+from .events import set_close_on_exec
+from ..utils.subprocess import Capture, spawn_lock
+
+log = logging.getLogger(__name__)
+
+
+# client side, used by goodplay
+
+class ForkServer(object):
+    def __init__(self, startup_timeout=30):
+        self.startup_timeout = startup_timeout
+
+        self.process = None
+        self.temp_path = None
+        self.address = None
+
+    def start(self):
+        self.temp_path = py.path.local.mkdtemp()
+        self.address = str(self.temp_path.join('forkserver.sock'))
+
+        # forkserver terminates as soon as its stdin is closed, thus no other
+        # process must inherit it
+        with spawn_lock:
+            self.process = subprocess.Popen(
+                [sys.executable, '-m', 'goodplay.ansible_support.forkserver', self.address],
+                stdin=subprocess.PIPE, close_fds=True)
+            set_close_on_exec(self.process.stdin.fileno())
+
+        deadline = time.time() + self.startup_timeout
+        while not os.path.exists(self.address):
+            if self.process.poll() is not None or time.time() > deadline:
+                self.close()
+                raise Exception('forkserver failed to start')
+            time.sleep(0.01)
+
+        return self
+
+    def supports(self, executable, env):
+        # only python scripts can be run in the forkserver's interpreter
+        script_path = find_executable(executable, env.get('PATH'))
+
+        return bool(script_path) and is_python_script(script_path)
+
+    def run(self, argv, env, env_fds=None):
+        script_path = find_executable(argv[0], env.get('PATH'))
+
+        return ForkedProcess(self.address, [script_path] + list(argv[1:]), env, env_fds or {})
+
+    def close(self):
+        if self.process is not None:
+            self.process.stdin.close()
+            self.process.wait()
+            self.process = None
+
+        if self.temp_path is not None:
+            self.temp_path.remove(ignore_errors=True)
+            self.temp_path = None
+
+
+def is_python_script(path):
+    with open(path, 'rb') as script_file:
+        first_line = script_file.readline()
+
+    return first_line.startswith(b'#!') and b'python' in first_line
+
+
+# same interface as sarge pipelines as far as used by PlaybookRunner
+class ForkedProcess(object):
+    def __init__(self, address, argv, env, env_fds):
+        self.returncode = None
+        self.pid = None
+        self.stdout = Capture()
+        self.stderr = Capture()
+        self.commands = [self]
+
+        stdout_read_fd, stdout_write_fd = os.pipe()
+        stderr_read_fd, stderr_write_fd = os.pipe()
+
+        self.connection = multiprocessing.connection.Client(address)
+        try:
+            env_fd_names = sorted(env_fds)
+            self.connection.send(dict(
+                argv=argv, env=env, cwd=os.getcwd(), env_fd_names=env_fd_names))
+            for fd in [stdout_write_fd, stderr_write_fd] + [env_fds[n] for n in env_fd_names]:
+                multiprocessing.reduction.send_handle(self.connection, fd, None)
+
+            self.pid = self.connection.recv()
+        finally:
+            # forked child holds its own copies now
+            os.close(stdout_write_fd)
+            os.close(stderr_write_fd)
+
+        self.stdout.add_stream(os.fdopen(stdout_read_fd, 'rb'))
+        self.stderr.add_stream(os.fdopen(stderr_read_fd, 'rb'))
+
+        self._waiter = threading.Thread(target=self.receive_returncode)
+        self._waiter.daemon = True
+        self._waiter.start()
+
+    def receive_returncode(self):
+        try:
+            self.returncode = self.connection.recv()
+        except EOFError:  # pragma: no cover
+            self.returncode = -1
+        finally:
+            self.connection.close()
+
+    def wait_events(self):
+        pass
+
+    def wait(self):
+        self._waiter.join()
+
+        return self.returncode
+
+    def poll(self):
+        return self.returncode
+
+    def terminate(self):
+        if self.returncode is None:
+            try:
+                os.kill(self.pid, signal.SIGTERM)
+            except OSError:  # pragma: no cover
+                pass
+
+
+# server side, run as separate process
+
+def serve(address):
+    # import ansible including all its dependencies once, while ansible
+    # itself is imported afresh in each forked child, as it reads its
+    # configuration (environment, ansible.cfg) on import
+    import ansible.cli.playbook  # noqa: F401
+    import ansible.executor.playbook_executor  # noqa: F401
+
+    listener = multiprocessing.connection.Listener(address, family='AF_UNIX')
+
+    stdin_watcher = threading.Thread(target=exit_on_stdin_close)
+    stdin_watcher.daemon = True
+    stdin_watcher.start()
+
+    while True:
+        handle_request(listener.accept())
+
+
+def exit_on_stdin_close():
+    while sys.stdin.read(4096):
+        pass
+
+    os._exit(0)
+
+
+def handle_request(connection):
+    request = connection.recv()
+    fds = [multiprocessing.reduction.recv_handle(connection)
+           for _ in range(2 + len(request['env_fd_names']))]
+
+    pid = os.fork()
+    if pid == 0:
+        run_child(connection, request, fds)
+
+    for fd in fds:
+        os.close(fd)
+    connection.send(pid)
+
+    waiter = threading.Thread(target=send_returncode, args=(connection, pid))
+    waiter.daemon = True
+    waiter.start()
+
+
+def send_returncode(connection, pid):
+    _, status = os.waitpid(pid, 0)
+
+    if os.WIFSIGNALED(status):
+        returncode = -os.WTERMSIG(status)
+    else:
+        returncode = os.WEXITSTATUS(status)
+
+    connection.send(returncode)
+    connection.close()
+
+
+def run_child(connection, request, fds):
+    exit_code = 1
+
+    try:
+        connection.close()
+        prepare_child(request, fds)
+        runpy.run_path(request['argv'][0], run_name='__main__')
+        exit_code = 0
+    except SystemExit as e:
+        exit_code = exit_code_of(e)
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(exit_code)
+
+
+def prepare_child(request, fds):
+    devnull_fd = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull_fd, 0)
+    os.dup2(fds[0], 1)
+    os.dup2(fds[1], 2)
+
+    os.environ.clear()
+    os.environ.update(request['env'])
+    for name, fd in zip(request['env_fd_names'], fds[2:]):
+        os.environ[name] = str(fd)
+
+    os.chdir(request['cwd'])
+    sys.argv = list(request['argv'])
+
+    for module_name in list(sys.modules):
+        if module_name == 'ansible' or module_name.startswith('ansible.'):
+            del sys.modules[module_name]
+
+
+def exit_code_of(system_exit):
+    if system_exit.code is None:
+        return 0
+    elif isinstance(system_exit.code, int):
+        return system_exit.code
+
+    sys.stderr.write('{0}\n'.format(system_exit.code))
+    return 1
+
+
+if __name__ == '__main__':
+    serve(sys.argv[1])
@@ -14,13 +14,15 @@ class EmptyOptions(object):
 class Inventory(object):
     def __init__(self, inventory_path):
         self.inventory_path = inventory_path
+        self.loader = ansible.parsing.dataloader.DataLoader()
+        self.variable_manager = ansible.vars.VariableManager()
         self.inventory = self.build_inventory()
 
     def build_inventory(self):
         self.clear_host_caches()
 
-        loader = ansible.parsing.dataloader.DataLoader()
-        variable_manager = ansible.vars.VariableManager()
+        loader = self.loader
+        variable_manager = self.variable_manager
         variable_manager.extra_vars = ansible.utils.vars.load_extra_vars(
             loader=loader, options=EmptyOptions())
 
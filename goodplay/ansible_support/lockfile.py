@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import logging
+import os
+import tarfile
+import threading
+
+from cached_property import cached_property
+import yaml
+
+from .role_store import requirement_name
+
+log = logging.getLogger(__name__)
+
+
+class Lockfile(object):
+    def __init__(self, lockfile_path, archive_path):
+        self.lockfile_path = lockfile_path
+        self.archive_path = archive_path
+
+        self._lock = threading.Lock()
+        self.changed = False
+
+    @cached_property
+    def entries(self):
+        return self.load_entries()
+
+    def load_entries(self):
+        if not self.lockfile_path.check(file=True):
+            return {}
+
+        lockfile_content = yaml.safe_load(self.lockfile_path.read()) or {}
+        return lockfile_content.get('dependencies') or {}
+
+    def lock(self, key, requirement, installed_roles_path):
+        with self._lock:
+            entry = self.entries.get(key)
+
+            if entry and self.archive_path.join(entry['archive']).check(file=True):
+                return
+
+            archive_name = '{0}.tar.gz'.format(key)
+            log.info('locking %s into %s', requirement_name(requirement), archive_name)
+
+            archive_file_path = self.archive_path.ensure(dir=True).join(archive_name)
+            with tarfile.open(str(archive_file_path), 'w:gz') as archive:
+                for role_path in sorted(installed_roles_path.listdir()):
+                    archive.add(str(role_path), arcname=role_path.basename)
+
+            self.entries[key] = dict(
+                requirement=requirement,
+                roles=installed_role_versions(installed_roles_path),
+                archive=archive_name,
+                sha256=sha256sum(archive_file_path))
+            self.changed = True
+
+    def verify(self, key, requirement):
+        entry = self.entries.get(key)
+        if entry is None:
+            raise Exception(
+                "Dependency '{0}' is not locked in {1!s}".format(
+                    requirement_name(requirement), self.lockfile_path))
+
+        archive_file_path = self.archive_path.join(entry['archive'])
+        if not archive_file_path.check(file=True):
+            raise Exception(
+                "Archive of dependency '{0}' not found at {1!s}".format(
+                    requirement_name(requirement), archive_file_path))
+
+        if sha256sum(archive_file_path) != entry['sha256']:
+            raise Exception(
+                "Archive of dependency '{0}' at {1!s} does not match its checksum".format(
+                    requirement_name(requirement), archive_file_path))
+
+        return entry
+
+    def extract(self, key, requirement, roles_path):
+        archive_file_path = self.archive_path.join(self.verify(key, requirement)['archive'])
+
+        log.info('extracting %s from %s', requirement_name(requirement), archive_file_path)
+        roles_path.ensure(dir=True)
+        with tarfile.open(str(archive_file_path), 'r:gz') as archive:
+            archive.extractall(str(roles_path))
+
+    def save(self):
+        with self._lock:
+            if not self.changed:
+                return
+
+            # keep entries recorded in the meantime, e.g. by other xdist workers
+            entries = self.load_entries()
+            entries.update(self.entries)
+
+            temp_lockfile_path = self.lockfile_path.new(
+                basename='.{0}.{1}'.format(self.lockfile_path.basename, os.getpid()))
+            temp_lockfile_path.write(
+                yaml.safe_dump(dict(dependencies=entries), default_flow_style=False))
+            temp_lockfile_path.rename(self.lockfile_path)
+            self.changed = False
+
+
+def installed_role_versions(installed_roles_path):
+    role_versions = {}
+
+    for role_path in installed_roles_path.listdir(fil=lambda x: x.check(dir=True)):
+        install_info_path = role_path.join('meta', '.galaxy_install_info')
+        install_info = {}
+        if install_info_path.check(file=True):
+            install_info = yaml.safe_load(install_info_path.read()) or {}
+        role_versions[role_path.basename] = install_info.get('version')
+
+    return role_versions
+
+
+def sha256sum(path):
+    return hashlib.sha256(path.read_binary()).hexdigest()
@@ -3,87 +3,127 @@
 import collections
 import logging
 import os
-import re
+import threading
 
 from cached_property import cached_property
 import yaml
 
+from .discovery import discover_tasks
+from .role_store import requirement_name
 from .runner import PlaybookRunner
-from ..utils.subprocess import run
 
 log = logging.getLogger(__name__)
 
 
 class Playbook(object):
-    tagged_tasks_re = re.compile(r'''
-        (?:^\ {6})        # 6 spaces at the beginning of line
-        (?P<name>.*?)     # group: task name
-        (?:\t)            # 1 tab delimiter
-        TAGS:\ \[         # task tags prefix
-        (?P<tags>.+?)     # group: task tags
-        \]$               # task tags suffix at the end of line
-        ''', re.VERBOSE)
-
     def __init__(self, ctx):
         self.ctx = ctx
 
-        self.install_all_dependencies()
+        self.dependencies_installed = False
+        self._install_lock = threading.Lock()
 
     def install_all_dependencies(self):
-        self.install_role_dependencies()
-        self.install_soft_dependencies()
+        # environments of multiple platforms may be prepared concurrently
+        with self._install_lock:
+            if self.dependencies_installed:
+                return
+
+            # start installing all dependencies at once, they are linked in order below
+            self.prefetch_all_dependencies()
+
+            self.install_role_dependencies()
+            self.install_soft_dependencies()
+            self.dependencies_installed = True
+
+    def prefetch_all_dependencies(self):
+        self.ctx.session.dependency_resolver.prefetch(
+            self.role_dependencies + self.soft_dependencies)
+
+    @cached_property
+    def role_meta_path(self):
+        if self.ctx.is_role_playbook:
+            return self.ctx.role_path.join('meta', 'main.yml')
+
+    @cached_property
+    def role_dependencies(self):
+        if not self.role_meta_path:
+            return []
+
+        role_meta_content = yaml.safe_load(self.role_meta_path.read()) or {}
+        return role_meta_content.get('dependencies') or []
+
+    @cached_property
+    def soft_dependencies_path(self):
+        return self.ctx.playbook_path.dirpath('requirements.yml')
+
+    @cached_property
+    def soft_dependencies(self):
+        if self.soft_dependencies_path.check(file=True):
+            return yaml.safe_load(self.soft_dependencies_path.read()) or []
+
+        return []
 
     def install_role_dependencies(self):
         if not self.ctx.is_role_playbook:
             return
 
-        role_meta_path = self.ctx.role_path.join('meta', 'main.yml')
-        role_meta_content = yaml.safe_load(role_meta_path.read())
-        role_dependencies = role_meta_content.get('dependencies', [])
+        role_meta_path = self.role_meta_path
+        role_dependencies = self.role_dependencies
 
         if role_dependencies:
             log.info('role dependencies found in %s ... installing', role_meta_path)
-            requirements_path = self.ctx.installed_roles_path.join('requirements.yml')
-            requirements_path.write(yaml.dump(role_dependencies))
-
-            self.install_roles_from_requirements_file(requirements_path)
+            self.install_roles(role_dependencies)
         else:
             log.info('role dependencies not found in %s ... nothing to install',
                      role_meta_path)
 
     def install_soft_dependencies(self):
-        requirements_path = self.ctx.playbook_path.dirpath('requirements.yml')
+        requirements_path = self.soft_dependencies_path
 
         if requirements_path.check(file=True):
             log.info('soft dependencies found in %s ... installing', requirements_path)
-            self.install_roles_from_requirements_file(requirements_path)
+            self.install_roles(self.soft_dependencies)
         else:
             log.info('soft dependencies file not found at %s ... nothing to install',
                      requirements_path)
 
-    def install_roles_from_requirements_file(self, requirements_path):
-        process = run(
-            'ansible-galaxy install -vvvv --force '
-            '--role-file {0} --roles-path {1}',
-            requirements_path, self.ctx.installed_roles_path)
-
-        for line in process.stdout:
-            log.info(line[:-1])
+    def install_roles(self, requirements):
+        dependency_resolver = self.ctx.session.dependency_resolver
 
-        if process.returncode != 0:
-            raise Exception(process.stderr.readlines())  # pragma: no cover
+        for requirement in requirements:
+            dependency_resolver.link(requirement, self.ctx.installed_roles_path)
 
-    def env(self):
+    def roles_path(self, installed_roles_path=None):
         roles_path = []
         if self.ctx.role_path:
             role_base_path = self.ctx.role_path.dirpath()
             roles_path.append(str(role_base_path))
-        roles_path.append(str(self.ctx.installed_roles_path))
+        roles_path.append(str(installed_roles_path or self.ctx.installed_roles_path))
+
+        return os.pathsep.join(roles_path)
+
+    def listing_roles_path(self):
+        if self.dependencies_installed:
+            return self.roles_path()
 
-        return dict(ANSIBLE_ROLES_PATH=os.pathsep.join(roles_path))
+        # resolve dependencies to empty placeholder roles, so playbooks can be
+        # listed without installing their dependencies
+        placeholder_roles_path = self.ctx.placeholder_roles_path
 
-    def create_runner(self):
-        return PlaybookRunner(self.ctx)
+        for requirement in self.role_dependencies + self.soft_dependencies:
+            role_name = requirement_name(requirement)
+            placeholder_role_meta_path = placeholder_roles_path.join(role_name, 'meta', 'main.yml')
+
+            if not placeholder_role_meta_path.check():
+                placeholder_role_meta_path.write('dependencies: []\n', ensure=True)
+
+        return self.roles_path(placeholder_roles_path)
+
+    def env(self):
+        return dict(ANSIBLE_ROLES_PATH=self.roles_path())
+
+    def create_runner(self, extended_inventory_path=None, playbook_paths=None, **kwargs):
+        return PlaybookRunner(self.ctx, extended_inventory_path, playbook_paths, **kwargs)
 
     @cached_property
     def test_tasks(self):
@@ -104,22 +144,25 @@ class Playbook(object):
                 .format(self.ctx.playbook_path, non_unique_task_names[0]))
 
     def tasks(self):
-        process = run(
-            'ansible-playbook --list-tasks --list-tags -i {0} {1}',
-            self.ctx.inventory_path, self.ctx.playbook_path,
-            env=self.env())
+        collection_cache = self.ctx.session.collection_cache
+        cached_tasks = collection_cache.get_tasks(
+            self.ctx.playbook_path, self.ctx.collection_fingerprint)
+
+        if cached_tasks is not None:
+            log.info('using cached task listing of %s', self.ctx.playbook_path)
+            return [Task(name, tags) for name, tags in cached_tasks]
 
-        if process.returncode != 0:
-            raise Exception(process.stderr.read())
+        tasks = list(self.list_tasks())
+        collection_cache.set_tasks(self.ctx.playbook_path, self.ctx.collection_fingerprint, tasks)
 
-        for line in process.stdout:
-            match = self.tagged_tasks_re.match(line)
+        return tasks
 
-            if match:
-                name = match.group('name')
-                tags = [tag.strip() for tag in match.group('tags').split(',')]
+    def list_tasks(self):
+        tasks = discover_tasks(
+            self.ctx.playbook_path, self.ctx.inventory_path, self.listing_roles_path())
 
-                yield Task(name, tags)
+        for name, tags in tasks:
+            yield Task(name, tags)
 
 
 class Task(object):
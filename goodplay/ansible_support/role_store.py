@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import logging
+import multiprocessing.pool
+import tempfile
+import threading
+
+from ansible.playbook.role.requirement import RoleRequirement
+import py.path
+import yaml
+
+from ..utils.fingerprint import fingerprint_paths
+from ..utils.pool import SharedResult
+from ..utils.subprocess import log_lines, log_lines_in_background, run
+
+log = logging.getLogger(__name__)
+
+
+class RoleStore(object):
+    def __init__(self, store_path, max_size=None, lockfile=None, offline=False):
+        self.store_path = store_path
+        self.max_size = max_size
+        self.lockfile = lockfile
+        self.offline = offline
+
+    def key(self, requirement):
+        return requirement_key(requirement)
+
+    def entry_path(self, key, requirement):
+        if not self.offline:
+            return self.store_path.join(key)
+
+        # offline, only entries extracted from the very archive recorded in
+        # the lockfile are used, not ones installed or locked differently
+        checksum = self.lockfile.verify(key, requirement)['sha256']
+        return self.store_path.join('{0}-{1}'.format(key, checksum[:12]))
+
+    def install(self, requirement):
+        key = self.key(requirement)
+        entry_path = self.entry_path(key, requirement)
+
+        if entry_path.check(dir=True):
+            log.info('role %s found in role store ... skipping installation',
+                     requirement_name(requirement))
+        else:
+            self.install_entry(key, requirement, entry_path)
+
+        # mtime of an entry marks when it has been used last
+        entry_path.setmtime()
+
+        if self.lockfile is not None and not self.offline:
+            self.lockfile.lock(key, requirement, entry_path.join('roles'))
+
+        return entry_path.join('roles')
+
+    def install_entry(self, key, requirement, entry_path):
+        log.info('role %s not found in role store ... installing', requirement_name(requirement))
+
+        temp_entry_path = py.path.local(tempfile.mkdtemp(prefix='.tmp-', dir=str(self.store_path)))
+        try:
+            self.install_roles(key, requirement, temp_entry_path)
+
+            size = sum(path.size() for path in temp_entry_path.visit(fil=lambda x: x.check(
+                file=True, link=False)))
+            temp_entry_path.join('size').write(str(size))
+
+            try:
+                # rename is atomic, thus concurrent sessions never see partial entries
+                temp_entry_path.rename(entry_path)
+            except (OSError, py.error.Error):
+                if not entry_path.check(dir=True):
+                    raise  # pragma: no cover
+        finally:
+            if temp_entry_path.check():
+                temp_entry_path.remove(ignore_errors=True)
+
+    def install_roles(self, key, requirement, entry_path):
+        if self.offline:
+            self.lockfile.extract(key, requirement, entry_path.join('roles'))
+            return
+
+        requirements_path = entry_path.join('requirements.yml')
+        requirements_path.write(yaml.safe_dump([requirement]))
+
+        galaxy_install(requirements_path, entry_path.join('roles'))
+
+    def link(self, requirement, roles_path):
+        link_roles(self.install(requirement), roles_path)
+
+    def entries(self):
+        return [path for path in self.store_path.listdir(fil=lambda x: x.check(dir=True))
+                if not path.basename.startswith('.') and path.join('size').check(file=True)]
+
+    def evict(self):
+        if self.max_size is None:
+            return
+
+        entries = sorted(self.entries(), key=lambda x: x.mtime(), reverse=True)
+        total_size = 0
+
+        for entry_path in entries:
+            total_size += int(entry_path.join('size').read())
+
+            if total_size > self.max_size:
+                log.info('evicting %s from role store', entry_path)
+                entry_path.remove(ignore_errors=True)
+
+
+class DependencyResolver(object):
+    def __init__(self, role_store, workers=1):
+        self.role_store = role_store
+        self.workers = workers
+
+        self.installations = {}
+        self._lock = threading.Lock()
+        self._pool = None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = multiprocessing.pool.ThreadPool(processes=self.workers)
+
+        return self._pool
+
+    def prefetch(self, requirements):
+        with self._lock:
+            for requirement in requirements:
+                key = self.role_store.key(requirement)
+
+                if key not in self.installations:
+                    self.installations[key] = \
+                        SharedResult(self.pool, self.role_store.install, requirement)
+
+    def install(self, requirement):
+        self.prefetch([requirement])
+
+        return self.installations[self.role_store.key(requirement)].get()
+
+    def link(self, requirement, roles_path):
+        link_roles(self.install(requirement), roles_path)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+
+
+def link_roles(installed_roles_path, roles_path):
+    for role_path in installed_roles_path.listdir(fil=lambda x: x.check(dir=True)):
+        link_path = roles_path.join(role_path.basename)
+
+        # roles installed later take precedence, just like ansible-galaxy --force
+        if link_path.check(link=True) or link_path.check():
+            link_path.remove()
+        link_path.mksymlinkto(role_path)
+
+
+def requirement_name(requirement):
+    return RoleRequirement.role_yaml_parse(requirement)['name']
+
+
+def requirement_key(requirement):
+    role = RoleRequirement.role_yaml_parse(requirement)
+    key_parts = [role.get(part) or '' for part in ('src', 'scm', 'version', 'name')]
+
+    # local sources are addressed by their content
+    src_path = py.path.local(role['src'])
+    if src_path.check():
+        key_parts[0] = str(src_path)
+        key_parts.append(fingerprint_paths([src_path]))
+
+    return hashlib.sha1(json.dumps(key_parts).encode('utf-8')).hexdigest()
+
+
+def galaxy_install(requirements_path, roles_path):
+    process = run(
+        'ansible-galaxy install -vvvv --force '
+        '--role-file {0} --roles-path {1}',
+        requirements_path, roles_path, async=True)
+
+    stderr_lines = []
+    stderr_logger = log_lines_in_background(process.stderr, log, stderr_lines)
+    log_lines(process.stdout, log)
+    stderr_logger.join()
+    process.wait()
+
+    if process.returncode != 0:
+        raise Exception('ansible-galaxy failed to install {0!s}:\n{1}'.format(
+            requirements_path, b''.join(stderr_lines).decode('utf-8', 'replace').rstrip()))
@@ -1,25 +1,39 @@
 # -*- coding: utf-8 -*-
 
 import logging
-import json
+import os
+import tempfile
+import threading
 
 import py.path
+import yaml
 
-from ..utils.subprocess import run
+from .events import AckChannel, EventChannel, EventDispatcher
+from ..utils.subprocess import log_lines_in_background, run, spawn_lock
 
 log = logging.getLogger(__name__)
 
 
 class PlaybookRunner(object):
-    def __init__(self, ctx):
+    def __init__(self, ctx, extended_inventory_path=None, playbook_paths=None,
+                 start_at_task=None, on_checkpoint=None):
         self.ctx = ctx
+        self.extended_inventory_path = extended_inventory_path or ctx.extended_inventory_path
+        self.playbook_paths = playbook_paths or [ctx.playbook_path]
+        self.start_at_task = start_at_task
+        self.on_checkpoint = on_checkpoint
 
+        self.playbook_path = None
+        self.batch_playbook_path = None
         self.process = None
-        self.skip_wait = False
-        self.failures = []
-        self.all_test_tasks_skipped = True
-
-    def run_async(self):
+        self.event_channel = None
+        self.event_dispatcher = None
+        self.ack_channel = None
+        self.checkpoint_handler = None
+        self.output_loggers = []
+        self.playbooks_with_tests_run = set()
+
+    def start(self):
         this_path = py.path.local(__file__)
         callback_plugin_path = this_path.dirpath('callback_plugin')
 
@@ -28,64 +42,168 @@ class PlaybookRunner(object):
             PYTHONUNBUFFERED='1',
             ANSIBLE_CALLBACK_PLUGINS=str(callback_plugin_path),
             ANSIBLE_CALLBACK_WHITELIST='goodplay',
+            # retry files beside failed playbooks would be taken for changes
+            # of the playbooks' directories, e.g. by watch mode
+            ANSIBLE_RETRY_FILES_ENABLED='False',
         )
         env.update(additional_env)
 
-        self.process = run(
-            'ansible-playbook -vvv -i {0} {1}',
-            self.ctx.extended_inventory_path, self.ctx.playbook_path,
-            env=env, async=True)
+        self.playbook_path = self.playbook_paths[0]
+        if len(self.playbook_paths) > 1:
+            self.playbook_path = self.batch_playbook_path = self.create_batch_playbook()
+
+        # the channel ends of ansible-playbook are closed before any other
+        # process is started, thus the event channel is closed as soon as
+        # ansible-playbook terminates
+        with spawn_lock:
+            self.event_channel = EventChannel()
+            if self.on_checkpoint is not None:
+                self.ack_channel = AckChannel()
+            self.process = self.run_playbook(env)
+
+            self.event_channel.close_write_end()
+            if self.ack_channel is not None:
+                self.ack_channel.close_read_end()
+
+        # drain output continuously, so ansible-playbook never blocks on a full pipe
+        self.output_loggers = [
+            log_lines_in_background(self.process.stdout, log),
+            log_lines_in_background(self.process.stderr, log)]
+
+        self.event_dispatcher = EventDispatcher(self.event_channel)
+        self.event_dispatcher.start()
+
+        if self.ack_channel is not None:
+            self.checkpoint_handler = threading.Thread(target=self.handle_checkpoint)
+            self.checkpoint_handler.daemon = True
+            self.checkpoint_handler.start()
+
+        return self
+
+    def handle_checkpoint(self):
+        try:
+            # sent before the first test task run, which is not necessarily
+            # the first one listed, e.g. when its play matches no hosts
+            event = self.event_dispatcher.wait('checkpoint', None)
+            if event is not None:
+                self.on_checkpoint(event['data']['name'])
+        except Exception as e:
+            log.warning('failed to checkpoint %s: %s', self.ctx.playbook_path, e)
+        finally:
+            # ansible-playbook continues in any case
+            self.ack_channel.ack()
+
+    def create_batch_playbook(self):
+        # placed beside the batched playbooks, thus group_vars and host_vars
+        # beside them still apply, while being hidden from test collection
+        fd, batch_playbook_path = tempfile.mkstemp(
+            prefix='.goodplay-batch-', suffix='.yml', dir=str(self.ctx.playbook_path.dirpath()))
+        os.close(fd)
+
+        batch_playbook_path = py.path.local(batch_playbook_path)
+        batch_playbook_path.write(yaml.safe_dump(
+            [dict(include=str(playbook_path)) for playbook_path in self.playbook_paths],
+            default_flow_style=False))
+
+        return batch_playbook_path
+
+    def run_playbook(self, env):
+        fork_server = self.ctx.session.fork_server
+        argv = self.playbook_argv()
+
+        if fork_server is not None and fork_server.supports('ansible-playbook', env):
+            process_env = dict(os.environ)
+            process_env.update(env)
+
+            log.info('run process in forkserver: %s', ' '.join(argv))
+            return fork_server.run(argv, process_env, env_fds=self.channel_env(fds=True))
+
+        env.update(self.channel_env())
+
+        command = ' '.join('{{{0}}}'.format(index) for index in range(len(argv)))
+
+        return run(command, *argv, env=env, close_fds=False, async=True)
+
+    def playbook_argv(self):
+        argv = ['ansible-playbook', '-vvv', '-i', str(self.extended_inventory_path),
+                str(self.playbook_path)]
 
-        # wait for subprocess to be responsive
-        self.process.wait_events()
+        if self.start_at_task is not None:
+            argv.extend(['--start-at-task', self.start_at_task])
+
+        return argv
+
+    def channel_env(self, fds=False):
+        channels = [self.event_channel, self.ack_channel]
+        env = {}
+
+        for channel in channels:
+            if channel is not None:
+                env.update(channel.env_fds() if fds else channel.env())
+
+        return env
+
+    @property
+    def finished(self):
+        return self.event_dispatcher is not None and self.event_dispatcher.finished
+
+    def events(self, timeout=None):
+        return self.event_dispatcher.iter_events(timeout)
+
+    def terminate(self):
+        for command in self.process.commands:
+            if command.poll() is None:
+                command.terminate()
 
     def wait(self):
-        self.wait_for_event()
+        self.event_dispatcher.join()
 
-        for line in self.process.stdout:
-            log.info(line[:-1])
+        for output_logger in self.output_loggers:
+            output_logger.join()
 
         self.process.wait()
+        self.event_channel.close()
 
-        if self.all_test_tasks_skipped:
-            self.failures.append('all test tasks have been skipped')
-
-    def wait_for_event(self, event_name=None, **kwargs):
-        for event in self.receive_events():
-            if event['event_name'] == event_name \
-                    and set(kwargs.items()).issubset(set(event['data'].items())):
-                return event
-            elif event['event_name'] == 'error':
-                error_message = event['data']['message']
-                self.failures.append(error_message)
-                self.skip_wait = True
-                return
-            else:  # pragma: no cover
-                raise Exception('found unexpected goodplay event: {0!r}'.format(event))
-
-    def receive_events(self):
-        event_line_prefix = 'GOODPLAY => '
-        for line in self.process.stdout:
-            log.info(line[:-1])
-
-            if line.startswith(event_line_prefix):
-                event = json.loads(line[len(event_line_prefix):])
-                yield event
-
-    def wait_for_test_task(self, task):
-        if self.skip_wait:
-            return
+        if self.ack_channel is not None:
+            self.checkpoint_handler.join()
+            self.ack_channel.close()
 
-        self.wait_for_event('test-task-start', name=task.name)
+        if self.batch_playbook_path is not None:
+            self.batch_playbook_path.remove(ignore_errors=True)
 
-    def wait_for_test_task_outcome(self, task):
-        if self.skip_wait:
-            return
+    def failures(self, playbook_path=None):
+        playbook = self.playbook_key(playbook_path)
+        failures = self.event_dispatcher.errors_of(playbook)
 
-        event = self.wait_for_event('test-task-end', name=task.name)
-        outcome = event['data']['outcome'] if event else 'skipped'
+        if playbook not in self.playbooks_with_tests_run:
+            failures.append('all test tasks have been skipped')
+
+        return failures
+
+    def playbook_key(self, playbook_path=None):
+        # events are tagged with the real path of the playbook they originate from
+        return os.path.realpath(str(playbook_path or self.ctx.playbook_path))
+
+    def playbook_started(self, playbook_path=None, timeout=None):
+        event = self.event_dispatcher.wait(
+            'play-start', None, timeout, self.playbook_key(playbook_path))
+
+        return event is not None
+
+    def task_started(self, task, timeout=None, playbook_path=None):
+        event = self.event_dispatcher.wait(
+            'test-task-start', task.name, timeout, self.playbook_key(playbook_path))
+
+        return event is not None
+
+    def outcome(self, task, timeout=None, playbook_path=None):
+        playbook = self.playbook_key(playbook_path)
+        event = self.event_dispatcher.wait('test-task-end', task.name, timeout, playbook)
+        if event is None:
+            return
 
+        outcome = event['data']['outcome']
         if outcome != 'skipped':
-            self.all_test_tasks_skipped = False
+            self.playbooks_with_tests_run.add(playbook)
 
         return outcome
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+
+
+class MemoryCache(object):
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key, default):
+        return self.values.get(key, default)
+
+    def set(self, key, value):
+        self.values[key] = value
+
+
+class CollectionCache(object):
+    key_prefix = 'goodplay/collection/'
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def key(self, playbook_path):
+        return self.key_prefix + hashlib.sha1(str(playbook_path).encode('utf-8')).hexdigest()
+
+    def entry(self, playbook_path):
+        entry = self.cache.get(self.key(playbook_path), None)
+
+        return entry if isinstance(entry, dict) else {}
+
+    def update_entry(self, playbook_path, **values):
+        entry = self.entry(playbook_path)
+        entry.update(values)
+        self.cache.set(self.key(playbook_path), entry)
+
+    def get_is_playbook(self, playbook_path, digest):
+        entry = self.entry(playbook_path)
+
+        if entry.get('digest') == digest:
+            return entry.get('is_playbook')
+
+    def set_is_playbook(self, playbook_path, digest, is_playbook):
+        self.update_entry(playbook_path, digest=digest, is_playbook=is_playbook)
+
+    def get_tasks(self, playbook_path, fingerprint):
+        entry = self.entry(playbook_path)
+
+        if entry.get('fingerprint') == fingerprint:
+            return entry.get('tasks')
+
+    def get_fingerprint(self, playbook_path):
+        return self.entry(playbook_path).get('fingerprint')
+
+    def set_tasks(self, playbook_path, fingerprint, tasks):
+        self.update_entry(
+            playbook_path, fingerprint=fingerprint,
+            tasks=[[task.name, task.tags] for task in tasks])
+
+
+class ResultCache(object):
+    key_prefix = 'goodplay/results/'
+
+    def __init__(self, cache, rerun=False):
+        self.cache = cache
+        self.rerun = rerun
+
+    def key(self, playbook_path, platform):
+        run_id = '{0!s}::{1!s}'.format(playbook_path, platform)
+
+        return self.key_prefix + hashlib.sha1(run_id.encode('utf-8')).hexdigest()
+
+    def get_outcomes(self, playbook_path, platform, fingerprint):
+        if self.rerun or fingerprint is None:
+            return None
+
+        entry = self.cache.get(self.key(playbook_path, platform), None)
+
+        if isinstance(entry, dict) and entry.get('fingerprint') == fingerprint:
+            return entry.get('outcomes')
+
+    def set_outcomes(self, playbook_path, platform, fingerprint, outcomes):
+        if fingerprint is not None:
+            self.cache.set(
+                self.key(playbook_path, platform),
+                dict(fingerprint=fingerprint, outcomes=outcomes))
+
+    def discard(self, playbook_path, platform):
+        self.cache.set(self.key(playbook_path, platform), {})
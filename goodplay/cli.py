@@ -1,8 +1,12 @@
 # -*- coding: utf-8 -*-
 
+import sys
+
 import pytest
 
 from goodplay.ansible_support import is_test_playbook_file
+from goodplay.session import get_goodplay_session
+from goodplay.watch import Watch
 
 
 class CollectOnlyTestPlaybooks(object):
@@ -12,10 +16,16 @@ class CollectOnlyTestPlaybooks(object):
             return False
 
         # ignore everything else that is not a test playbook
-        return not is_test_playbook_file(path)
+        collection_cache = get_goodplay_session(config).collection_cache
+
+        return not is_test_playbook_file(path, collection_cache)
 
 
 def main():
-    additional_plugins = [CollectOnlyTestPlaybooks()]
+    args = sys.argv[1:]
+    watch = Watch(args, [CollectOnlyTestPlaybooks()])
+
+    if '--watch' in args:
+        raise SystemExit(watch.run())
 
-    raise SystemExit(pytest.main(plugins=additional_plugins))
+    raise SystemExit(pytest.main(args, watch.plugins))
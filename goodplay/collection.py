@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import multiprocessing
+
+import py.path
+
+from goodplay import ansible_support
+from goodplay.context import GoodplayContext
+from goodplay.utils.fingerprint import fingerprint_file
+
+log = logging.getLogger(__name__)
+
+
+def prefetch_collection(goodplay_session, args, norecursedirs, workers):
+    candidate_paths = list(find_candidate_paths(args, norecursedirs))
+    if not candidate_paths:
+        return
+
+    collection_cache = goodplay_session.collection_cache
+    prefetch_args = [
+        (str(path), collection_cache.get_fingerprint(path)) for path in candidate_paths]
+
+    log.info('prefetching collection of %d playbook candidates using %d workers',
+             len(prefetch_args), workers)
+
+    pool = multiprocessing.Pool(processes=min(workers, len(prefetch_args)))
+    try:
+        for result in pool.imap_unordered(prefetch_playbook, prefetch_args):
+            store_prefetch_result(goodplay_session, result)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def find_candidate_paths(args, norecursedirs):
+    def recurse(path):
+        return not any(path.check(fnmatch=pattern) for pattern in norecursedirs)
+
+    def is_candidate(path):
+        return path.check(file=True) and path.basename.startswith('test_') \
+            and path.ext == '.yml'
+
+    for arg in args:
+        path = py.path.local(str(arg).split('::')[0])
+
+        if path.check(dir=True):
+            for candidate_path in path.visit(fil=is_candidate, rec=recurse, sort=True):
+                yield candidate_path
+        elif is_candidate(path):
+            yield path
+
+
+def prefetch_playbook(prefetch_arg):
+    playbook_path, cached_fingerprint = prefetch_arg
+    playbook_path = py.path.local(playbook_path)
+    result = dict(playbook_path=str(playbook_path))
+
+    try:
+        result['digest'] = fingerprint_file(playbook_path)
+        result['is_playbook'] = bool(ansible_support.is_playbook_file(playbook_path))
+
+        if result['is_playbook']:
+            prefetch_playbook_tasks(playbook_path, cached_fingerprint, result)
+    except Exception:
+        # failures are reported when the playbook is collected regularly
+        log.exception('prefetching collection of %s failed', playbook_path)
+        result = dict(playbook_path=str(playbook_path))
+
+    return result
+
+
+def prefetch_playbook_tasks(playbook_path, cached_fingerprint, result):
+    ctx = GoodplayContext(playbook_path)
+
+    try:
+        if ctx.inventory_path:
+            fingerprint = ctx.collection_fingerprint
+
+            if fingerprint != cached_fingerprint:
+                result['tasks'] = list(ctx.playbook.list_tasks())
+
+            result['fingerprint'] = fingerprint
+    finally:
+        ctx.release()
+
+
+def store_prefetch_result(goodplay_session, result):
+    collection_cache = goodplay_session.collection_cache
+    playbook_path = py.path.local(result['playbook_path'])
+
+    if 'is_playbook' not in result:
+        return
+
+    collection_cache.set_is_playbook(playbook_path, result['digest'], result['is_playbook'])
+
+    fingerprint = result.get('fingerprint')
+    if fingerprint:
+        goodplay_session.collection_fingerprints[str(playbook_path)] = fingerprint
+
+        if 'tasks' in result:
+            collection_cache.set_tasks(playbook_path, fingerprint, result['tasks'])
@@ -4,13 +4,18 @@ from cached_property import cached_property
 import py.path
 import yaml
 
+import ansible
+import goodplay
 from goodplay import ansible_support
-from goodplay.config import get_goodplay_config
+from goodplay.config import find_config_path, get_goodplay_config
+from goodplay.session import GoodplaySession
+from goodplay.utils.fingerprint import fingerprint_paths
 
 
 class GoodplayContext(object):
-    def __init__(self, playbook_path):
+    def __init__(self, playbook_path, session=None):
         self.playbook_path = playbook_path
+        self.session = session or GoodplaySession()
 
         self._temp_paths = []
 
@@ -63,6 +68,9 @@ class GoodplayContext(object):
 
     @cached_property
     def extended_inventory_path(self):
+        return self.create_extended_inventory_path()
+
+    def create_extended_inventory_path(self):
         extended_inventory_path = self._create_temporary_dir()
 
         extended_inventory_path.join('inventory').mksymlinkto(self.inventory_path)
@@ -107,10 +115,85 @@ class GoodplayContext(object):
     def role_meta_info(self):
         return yaml.safe_load(self.role_path.join('meta', 'main.yml').read())
 
+    @cached_property
+    def dependent_role_paths(self):
+        if not self.is_role_playbook:
+            return []
+
+        dependent_role_paths = []
+        pending_role_paths = [self.role_path]
+
+        while pending_role_paths:
+            for role_path in self.sibling_role_dependency_paths(pending_role_paths.pop(0)):
+                if role_path not in dependent_role_paths + [self.role_path]:
+                    dependent_role_paths.append(role_path)
+                    pending_role_paths.append(role_path)
+
+        return dependent_role_paths
+
+    def sibling_role_dependency_paths(self, role_path):
+        role_base_path = self.role_path.dirpath()
+        dependency_paths = (
+            role_base_path.join(ansible_support.role_dependency_name(dependency))
+            for dependency in ansible_support.role_meta_dependencies(role_path))
+
+        return [path for path in dependency_paths if path.check(dir=True)]
+
+    @cached_property
+    def collection_input_paths(self):
+        input_paths = [self.playbook_path] + self.paths_beside_playbook()
+
+        config_path = find_config_path(self.playbook_path)
+        if config_path:
+            input_paths.append(config_path)
+
+        if self.is_role_playbook:
+            input_paths.append(self.role_path)
+            input_paths.extend(self.dependent_role_paths)
+
+        return input_paths
+
+    def paths_beside_playbook(self):
+        # files beside the playbook may be included by it, e.g. task files,
+        # vars files or templates, while other test playbooks and directories
+        # with an inventory of their own belong to other test playbooks
+        return [path for path in self.playbook_path.dirpath().listdir(sort=True)
+                if not path.basename.startswith('.') and not self.is_other_playbook_path(path)]
+
+    def is_other_playbook_path(self, path):
+        if path.check(dir=True):
+            return path.join('inventory').check()
+
+        return path != self.playbook_path and path.basename.startswith('test_') \
+            and path.ext == '.yml'
+
+    @cached_property
+    def collection_fingerprint(self):
+        prefetched_fingerprint = self.session.collection_fingerprints.get(str(self.playbook_path))
+        if prefetched_fingerprint:
+            return prefetched_fingerprint
+
+        return fingerprint_paths(
+            self.collection_input_paths, goodplay.__version__, ansible.__version__,
+            *self.requirement_keys())
+
+    def requirement_keys(self):
+        if not self.playbook:
+            return []
+
+        # keys change with the version of a requirement and the content of
+        # local sources
+        return [ansible_support.requirement_key(requirement) for requirement
+                in self.playbook.role_dependencies + self.playbook.soft_dependencies]
+
     @cached_property
     def installed_roles_path(self):
         return self._create_temporary_dir()
 
+    @cached_property
+    def placeholder_roles_path(self):
+        return self._create_temporary_dir()
+
     def release(self):
         for temp_path in reversed(self._temp_paths):
             temp_path.remove(ignore_errors=True)
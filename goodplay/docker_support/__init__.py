@@ -1,24 +1,67 @@
 # -*- coding: utf-8 -*-
 
+import collections
+import logging
+import multiprocessing.pool
+import threading
+import time
+import uuid
+
 from cached_property import cached_property
 
 import docker
 import docker.errors
 import docker.utils
 
+from goodplay.utils.pool import SharedResult
+
+log = logging.getLogger(__name__)
+
+PULL_POLICIES = ('missing', 'always')
+ISOLATION_POLICIES = ('fresh', 'recycle')
+# APIError is raised by the daemon, DockerException subclasses such as
+# InvalidVersion by docker-py itself when the daemon API is too old
+DOCKER_ERRORS = (docker.errors.APIError, docker.errors.DockerException)
+
+
+def create_client():
+    return docker.Client(
+        version='auto',
+        **docker.utils.kwargs_from_env(assert_hostname=False))
+
 
 class DockerRunner(object):
-    def __init__(self, ctx, default_platform=None):
+    def __init__(self, ctx, default_platform=None, extended_inventory_path=None):
         self.ctx = ctx
         self.default_platform = default_platform
+        self.extended_inventory_path = extended_inventory_path
 
         self.running_containers = []
+        self.host_containers = []
+        self.warm_keys = {}
+        self.pooled_keys = {}
+        self.checkpoint_images = {}
+        self.network = None
 
     @cached_property
     def client(self):
-        return docker.Client(
-            version='auto',
-            **docker.utils.kwargs_from_env(assert_hostname=False))
+        return create_client()
+
+    @cached_property
+    def image_manager(self):
+        return self.ctx.session.image_manager
+
+    @cached_property
+    def container_reaper(self):
+        return self.ctx.session.container_reaper
+
+    @cached_property
+    def container_pool(self):
+        return self.ctx.session.container_pool
+
+    @cached_property
+    def warm_containers(self):
+        return self.ctx.session.warm_containers
 
     def setup(self):
         self.pull_required_images()
@@ -36,9 +79,10 @@ class DockerRunner(object):
 
         inventory_content = '\n'.join(inventory_lines)
 
-        self.ctx.extended_inventory_path.join('goodplay').write(inventory_content)
+        extended_inventory_path = self.extended_inventory_path or self.ctx.extended_inventory_path
+        extended_inventory_path.join('goodplay').write(inventory_content)
 
-    def pull_required_images(self):
+    def required_images(self):
         required_images = set()
 
         for host in self.ctx.inventory.hosts():
@@ -47,12 +91,47 @@ class DockerRunner(object):
             if required_image:
                 required_images.add(required_image)
 
-        # TODO: define how to disable this caching and always pull latest
+        return sorted(required_images)
+
+    def pull_required_images(self):
+        required_images = self.required_images()
+
+        # images are most likely being pulled already since collection
+        self.image_manager.prefetch(required_images)
+
         for required_image in required_images:
+            self.image_manager.require(required_image)
+
+    def image_ids(self):
+        image_ids = []
+
+        for required_image in self.required_images():
             try:
-                self.client.inspect_image(required_image)
+                image_ids.append(self.client.inspect_image(required_image)['Id'])
             except docker.errors.NotFound:
-                self.client.pull(required_image)
+                # images not pulled yet cannot be identified
+                return None
+
+        return image_ids
+
+    def container_keys(self):
+        return [self.container_key(host) for host in self.ctx.inventory.hosts()
+                if self.get_docker_image_for_host(host)]
+
+    def container_key(self, host):
+        hostname = host.vars()['inventory_hostname']
+        image = self.checkpoint_images.get(hostname) or self.get_docker_image_for_host(host)
+
+        return image, hostname
+
+    def containers_by_hostname(self):
+        return dict((host.vars()['inventory_hostname'], container)
+                    for host, container in self.host_containers)
+
+    def has_containers_only(self):
+        container_keys = self.container_keys()
+
+        return bool(container_keys) and len(container_keys) == len(self.ctx.inventory.hosts())
 
     def get_docker_image_for_host(self, host):
         host_vars = host.vars()
@@ -74,39 +153,119 @@ class DockerRunner(object):
         return host_vars.get('goodplay_image')
 
     def start_containers(self):
-        for host in self.ctx.inventory.hosts():
-            if not self.get_docker_image_for_host(host):
+        hosts = [host for host in self.ctx.inventory.hosts()
+                 if self.get_docker_image_for_host(host)]
+
+        if not hosts:
+            return []
+
+        self.create_network()
+
+        # containers of all hosts are created and started at once
+        workers = self.ctx.session.getoption('goodplay_container_workers', 8)
+        pool = multiprocessing.pool.ThreadPool(processes=min(len(hosts), workers))
+
+        try:
+            acquisitions = [pool.apply_async(self.acquire_container, (host,)) for host in hosts]
+
+            return self.collect_containers(hosts, acquisitions)
+        finally:
+            pool.close()
+            pool.join()
+
+    def create_network(self):
+        # a network of its own per playbook run and platform, on which hosts
+        # resolve each other by their inventory hostname
+        try:
+            self.network = self.client.create_network(
+                'goodplay-{0}'.format(uuid.uuid4().hex[:12]), driver='bridge')['Id']
+        except DOCKER_ERRORS as e:
+            log.warning('failed to create docker network, hosts cannot resolve each other: %s', e)
+
+    def join_network(self, container, hostname):
+        # containers not started by this runner are still attached to none or
+        # another network
+        if self.network is None:
+            return
+
+        try:
+            self.client.connect_container_to_network(container, self.network, aliases=[hostname])
+        except DOCKER_ERRORS as e:
+            log.warning('failed to connect docker container %s: %s', container['Id'], e)
+
+    def leave_network(self, container):
+        if self.network is None:
+            return
+
+        try:
+            self.client.disconnect_container_from_network(container, self.network)
+        except DOCKER_ERRORS as e:
+            log.warning('failed to disconnect docker container %s: %s', container['Id'], e)
+
+    def collect_containers(self, hosts, acquisitions):
+        containers = []
+        errors = []
+
+        for host, acquisition in zip(hosts, acquisitions):
+            try:
+                container = acquisition.get()
+            except Exception as e:
+                errors.append(e)
                 continue
 
-            container = self.start_container(host)
+            # containers started successfully are removed on teardown, even
+            # when others failed to start
             self.running_containers.append(container)
+            containers.append((host, container))
 
-            yield host, container
+        self.host_containers.extend(containers)
 
-    def start_container(self, host):
-        hostname = host.vars()['inventory_hostname']
-        image = self.get_docker_image_for_host(host)
-
-        # host_config:
-        # probably create a new network stack for the first container
-        #   (network_mode='bridge')
-        # and then reuse this network stack for the other containers
-        #   (network_mode='container:[name|id]')
-        #
-        # cap_add probably needed when supporting KVM
-
-        container = self.client.create_container(
-            image=image,
-            hostname=hostname,
-            detach=True,
-            tty=True,
-            host_config=self.client.create_host_config()
-        )
+        if errors:
+            raise errors[0]
 
-        self.client.start(container)
+        return containers
+
+    def acquire_container(self, host):
+        container_key = self.container_key(host)
+
+        if self.warm_containers is None:
+            return self.new_container(container_key)
+
+        warm_key = (str(self.ctx.playbook_path), str(self.default_platform)) + container_key
+        container = self.reusable_container(warm_key)
+
+        if container is None:
+            container = self.new_container(container_key)
+        else:
+            self.join_network(container, container_key[1])
+        self.warm_keys[container['Id']] = warm_key
 
         return container
 
+    def new_container(self, container_key):
+        if self.container_pool is None:
+            return start_container(self.client, *container_key, network=self.network)
+
+        container = self.container_pool.acquire(container_key)
+        self.join_network(container, container_key[1])
+        self.pooled_keys[container['Id']] = container_key
+
+        return container
+
+    def reusable_container(self, warm_key):
+        container = self.warm_containers.take(warm_key)
+        if container is None:
+            return None
+
+        try:
+            if self.client.inspect_container(container)['State']['Running']:
+                return container
+
+            # container has been stopped in the meantime
+            self.client.remove_container(container, force=True)
+        except docker.errors.NotFound:
+            pass
+
     def additional_config_for_host(self, host, container):
         return dict(
             ansible_connection='docker',
@@ -114,6 +273,308 @@ class DockerRunner(object):
         )
 
     def teardown(self):
-        # kill and remove containers
-        for container in self.running_containers:
-            self.client.remove_container(container, force=True)
+        removals = [self.release_container(container) for container in self.running_containers]
+
+        if self.network is not None:
+            self.container_reaper.reap_network(
+                self.client, self.network, [removal for removal in removals if removal])
+
+    def release_container(self, container):
+        if container['Id'] in self.warm_keys:
+            # keep container running for the next test run
+            self.leave_network(container)
+            self.warm_containers.put(self.warm_keys[container['Id']], self.client, container)
+        elif container['Id'] in self.pooled_keys:
+            self.leave_network(container)
+            self.container_pool.release(self.pooled_keys[container['Id']], container)
+        else:
+            # kill and remove containers in the background
+            return self.container_reaper.reap(self.client, container)
+
+
+def start_container(client, image, hostname, network=None):
+    # cap_add probably needed when supporting KVM
+    try:
+        networking_config = create_networking_config(client, hostname, network)
+    except DOCKER_ERRORS as e:
+        log.warning('failed to attach docker container %s to network %s: %s', hostname, network, e)
+        network = networking_config = None
+
+    container = client.create_container(
+        image=image,
+        hostname=hostname,
+        detach=True,
+        tty=True,
+        host_config=client.create_host_config(network_mode=network),
+        networking_config=networking_config
+    )
+
+    client.start(container)
+
+    return container
+
+
+def create_networking_config(client, hostname, network):
+    if network is None:
+        return None
+
+    return client.create_networking_config(
+        {network: client.create_endpoint_config(aliases=[hostname])})
+
+
+# containers are removed in the background, thus tearing down a platform
+# does not hold up the next one, while all of them are gone by session end
+class ContainerReaper(object):
+    def __init__(self, workers=8):
+        self.workers = workers
+
+        self._pool = None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = multiprocessing.pool.ThreadPool(processes=self.workers)
+
+        return self._pool
+
+    def reap(self, client, container):
+        return self.pool.apply_async(remove_container, (client, container))
+
+    def reap_network(self, client, network, removals):
+        # as the network is reaped after its containers, their removals have
+        # already been picked up by other workers by the time it is removed
+        self.pool.apply_async(remove_network, (client, network, removals))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+
+
+def remove_container(client, container):
+    try:
+        client.remove_container(container, force=True)
+    except Exception as e:
+        log.warning('failed to remove docker container %s: %s', container['Id'], e)
+
+
+def remove_network(client, network, removals):
+    for removal in removals:
+        removal.wait()
+
+    try:
+        client.remove_network(network)
+    except Exception as e:
+        log.warning('failed to remove docker network %s: %s', network, e)
+
+
+# containers started ahead for the hosts of upcoming platforms, which are
+# either discarded after use or, with relaxed isolation, recycled by later
+# platforms using the same image and hostname
+class ContainerPool(object):
+    def __init__(self, image_manager, container_reaper, max_size=4, isolation='fresh',
+                 idle_timeout=600):
+        self.image_manager = image_manager
+        self.container_reaper = container_reaper
+        self.max_size = max_size
+        self.isolation = isolation
+        self.idle_timeout = idle_timeout
+
+        self.pooled = collections.defaultdict(list)
+        self.expected = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = None
+
+    @cached_property
+    def client(self):
+        return create_client()
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = multiprocessing.pool.ThreadPool(processes=self.max_size)
+
+        return self._pool
+
+    @property
+    def size(self):
+        return sum(len(pooled_containers) for pooled_containers in self.pooled.values())
+
+    def expect(self, container_keys):
+        with self._lock:
+            for container_key in container_keys:
+                self.expected[container_key] = self.expected.get(container_key, 0) + 1
+
+            self.replenish()
+
+    def acquire(self, container_key):
+        with self._lock:
+            if self.expected.get(container_key, 0) > 0:
+                self.expected[container_key] -= 1
+
+            pooled_containers = self.pooled[container_key]
+            pooled_container = pooled_containers.pop(0) if pooled_containers else None
+
+            self.evict_idle()
+            self.replenish()
+
+        # waits for the container in case it is still being started
+        container = pooled_container.get() if pooled_container else None
+
+        return container or start_container(self.client, *container_key)
+
+    def release(self, container_key, container):
+        with self._lock:
+            recycle = self.isolation == 'recycle' and self.size < self.max_size
+
+            if recycle:
+                self.pooled[container_key].append(PooledContainer(container=container))
+
+        if not recycle:
+            self.container_reaper.reap(self.client, container)
+
+    def replenish(self):
+        # containers are only started ahead for hosts which are yet to come
+        for container_key, expected_count in self.expected.items():
+            while len(self.pooled[container_key]) < expected_count \
+                    and self.size < self.max_size:
+                starting = self.pool.apply_async(self.start, (container_key,))
+                self.pooled[container_key].append(PooledContainer(starting=starting))
+
+    def start(self, container_key):
+        image, hostname = container_key
+        self.image_manager.require(image)
+
+        return start_container(self.client, image, hostname)
+
+    def evict_idle(self):
+        deadline = time.time() - self.idle_timeout
+
+        for pooled_containers in self.pooled.values():
+            for pooled_container in list(pooled_containers):
+                if pooled_container.is_idle_since(deadline):
+                    pooled_containers.remove(pooled_container)
+                    self.discard(pooled_container)
+
+    def discard(self, pooled_container):
+        container = pooled_container.get()
+
+        if container is not None:
+            self.container_reaper.reap(self.client, container)
+
+    def close(self):
+        with self._lock:
+            pooled, self.pooled = self.pooled, collections.defaultdict(list)
+            self.expected.clear()
+
+        # includes containers still being started
+        for pooled_containers in pooled.values():
+            for pooled_container in pooled_containers:
+                self.discard(pooled_container)
+
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+
+
+class PooledContainer(object):
+    def __init__(self, starting=None, container=None):
+        self.starting = starting
+        self.container = container
+        self.idle_since = time.time()
+
+    def is_idle_since(self, deadline):
+        is_started = self.starting is None or self.starting.ready()
+
+        return is_started and self.idle_since < deadline
+
+    def get(self):
+        if self.starting is not None:
+            starting, self.starting = self.starting, None
+
+            try:
+                self.container = starting.get()
+            except Exception as e:
+                log.warning('failed to start docker container ahead: %s', e)
+
+        return self.container
+
+
+# containers kept running across the test runs of a long-lived process, as
+# in watch mode, each one being reused by the same playbook and host
+class WarmContainers(object):
+    def __init__(self):
+        self.containers = {}
+        self._lock = threading.Lock()
+
+    def take(self, warm_key):
+        with self._lock:
+            client, container = self.containers.pop(warm_key, (None, None))
+
+        return container
+
+    def put(self, warm_key, client, container):
+        with self._lock:
+            self.containers[warm_key] = (client, container)
+
+    def remove_all(self):
+        with self._lock:
+            containers, self.containers = self.containers, {}
+
+        for client, container in containers.values():
+            client.remove_container(container, force=True)
+
+
+# images required by all selected platforms are pulled concurrently and at
+# most once per session, while each platform only waits for its own images
+class ImageManager(object):
+    def __init__(self, workers=4, pull_policy='missing'):
+        self.workers = workers
+        self.pull_policy = pull_policy
+
+        self.pulls = {}
+        self._lock = threading.Lock()
+        self._pool = None
+
+    @cached_property
+    def client(self):
+        return create_client()
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = multiprocessing.pool.ThreadPool(processes=self.workers)
+
+        return self._pool
+
+    def prefetch(self, images):
+        with self._lock:
+            for image in images:
+                if image not in self.pulls:
+                    self.pulls[image] = SharedResult(self.pool, self.ensure_present, image)
+
+    def require(self, image):
+        self.prefetch([image])
+
+        # re-raises errors occurred while pulling
+        return self.pulls[image].get()
+
+    def ensure_present(self, image):
+        if self.pull_policy == 'missing' and self.is_present(image):
+            return
+
+        log.info('pulling docker image %s ...', image)
+        self.client.pull(image)
+
+    def is_present(self, image):
+        try:
+            self.client.inspect_image(image)
+        except docker.errors.NotFound:
+            return False
+
+        return True
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
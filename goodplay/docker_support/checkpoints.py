@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import logging
+import time
+
+from cached_property import cached_property
+import docker.errors
+
+from goodplay.docker_support import create_client
+
+log = logging.getLogger(__name__)
+
+
+# states of the containers of a playbook run right before its first test
+# task, keyed by the fingerprint of everything run up to this point, while
+# the least recently used ones are evicted once exceeding the size limit
+class CheckpointStore(object):
+    cache_key = 'goodplay/checkpoints'
+    repository = 'goodplay-checkpoint'
+
+    def __init__(self, cache, max_size=None):
+        self.cache = cache
+        self.max_size = max_size
+
+    @cached_property
+    def client(self):
+        return create_client()
+
+    def entries(self):
+        entries = self.cache.get(self.cache_key, None)
+
+        return entries if isinstance(entries, dict) else {}
+
+    def save_entries(self, entries):
+        self.cache.set(self.cache_key, entries)
+
+    def get(self, fingerprint, hostnames):
+        entries = self.entries()
+        entry = entries.get(fingerprint)
+
+        if entry is None or sorted(entry['images']) != sorted(hostnames):
+            return None
+
+        if not all(self.is_present(image) for image in entry['images'].values()):
+            # images have been removed in the meantime
+            self.remove_entry(entries, fingerprint)
+            self.save_entries(entries)
+            return None
+
+        entry['last_used'] = time.time()
+        self.save_entries(entries)
+
+        return entry
+
+    def commit(self, fingerprint, task_name, containers):
+        images = {}
+        size = 0
+
+        for hostname, container in containers.items():
+            checkpoint_id = '{0}::{1}'.format(fingerprint, hostname)
+            tag = hashlib.sha1(checkpoint_id.encode('utf-8')).hexdigest()
+            self.client.commit(container, repository=self.repository, tag=tag)
+
+            images[hostname] = '{0}:{1}'.format(self.repository, tag)
+            size += self.layer_size(images[hostname])
+
+        log.info('checkpointed containers before task %s', task_name)
+
+        entries = self.entries()
+        entries[fingerprint] = dict(
+            task=task_name, images=images, size=size, last_used=time.time())
+        self.evict(entries)
+        self.save_entries(entries)
+
+    def layer_size(self, image):
+        # the size of an image includes its base layers, which are shared with
+        # the image the container has been started from, while a checkpoint
+        # only adds its topmost layer
+        history = self.client.history(image)
+
+        return history[0].get('Size', 0) if history else 0
+
+    def is_present(self, image):
+        try:
+            self.client.inspect_image(image)
+        except docker.errors.NotFound:
+            return False
+
+        return True
+
+    def evict(self, entries):
+        if self.max_size is None:
+            return
+
+        fingerprints = sorted(entries, key=lambda x: entries[x]['last_used'], reverse=True)
+        total_size = 0
+
+        for fingerprint in fingerprints:
+            total_size += entries[fingerprint]['size']
+
+            if total_size > self.max_size:
+                log.info('evicting checkpoint before task %s', entries[fingerprint]['task'])
+                self.remove_entry(entries, fingerprint)
+
+    def remove_entry(self, entries, fingerprint):
+        for image in entries.pop(fingerprint)['images'].values():
+            try:
+                self.client.remove_image(image, force=True)
+            except docker.errors.NotFound:
+                pass
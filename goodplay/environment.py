@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import multiprocessing.pool
+import threading
+
+from cached_property import cached_property
+
+from goodplay import docker_support, impact
+from goodplay.utils.fingerprint import fingerprint_contents, fingerprint_paths
+
+log = logging.getLogger(__name__)
+
+
+# a playbook run on a single platform, including its containers, which can
+# be shared by a batch of playbooks run by a single ansible-playbook process
+class GoodplayEnvironment(object):
+    def __init__(self, ctx, platform=None, batch=None):
+        self.ctx = ctx
+        self.platform = platform
+        self.batch = batch or [ctx]
+        self.remaining_members = len(self.batch)
+
+        self.docker_runner = None
+        self.checkpoint = None
+        self.playbook_runner = None
+        self.playbook_runners = {}
+        self.finished_runners = []
+        self.preparation = None
+        self.slots = None
+        self.slot_ticket = None
+        self.preparation_finished = False
+        self.cancelled = False
+        self._lock = threading.Lock()
+
+    @cached_property
+    def extended_inventory_path(self):
+        # each environment gets its own inventory, thus environments of
+        # different platforms can exist at the same time
+        return self.ctx.create_extended_inventory_path()
+
+    def container_keys(self):
+        return docker_support.DockerRunner(self.ctx, self.platform).container_keys()
+
+    def setup_platform(self):
+        if self.docker_runner is None:
+            self.docker_runner = docker_support.DockerRunner(
+                self.ctx, self.platform, self.extended_inventory_path)
+            self.restore_checkpoint()
+            self.docker_runner.setup()
+
+    @cached_property
+    def checkpoint_fingerprint(self):
+        if not self.is_checkpointable():
+            return None
+
+        try:
+            return result_fingerprint(self.ctx, self.platform)
+        except Exception as e:
+            log.warning('failed to fingerprint %s, it is not checkpointed: %s',
+                        self.ctx.playbook_path, e)
+
+    def is_checkpointable(self):
+        goodplay_session = self.ctx.session
+
+        # checkpoints capture the containers of a single playbook only
+        return goodplay_session.checkpoint_store is not None \
+            and self.docker_runner is not None \
+            and len(self.batch) == 1 \
+            and goodplay_session.warm_containers is None \
+            and self.docker_runner.has_containers_only()
+
+    def restore_checkpoint(self):
+        if self.checkpoint_fingerprint is None:
+            return
+
+        hostnames = [hostname for _, hostname in self.docker_runner.container_keys()]
+        self.checkpoint = self.ctx.session.checkpoint_store.get(
+            self.checkpoint_fingerprint, hostnames)
+
+        if self.checkpoint is not None:
+            log.info('resuming %s from checkpoint before task %s',
+                     self.ctx.playbook_path, self.checkpoint['task'])
+            self.docker_runner.checkpoint_images = self.checkpoint['images']
+
+    def commit_checkpoint(self, task_name):
+        self.ctx.session.checkpoint_store.commit(
+            self.checkpoint_fingerprint, task_name, self.docker_runner.containers_by_hostname())
+
+    def checkpoint_options(self):
+        if self.checkpoint is not None:
+            return dict(start_at_task=self.checkpoint['task'])
+        elif self.checkpoint_fingerprint is not None:
+            return dict(on_checkpoint=self.commit_checkpoint)
+
+        return {}
+
+    def start_playbook(self):
+        if self.playbook_runner is None:
+            self.ctx.playbook.install_all_dependencies()
+            self.run_playbooks(self.batch, **self.checkpoint_options())
+
+    def run_playbooks(self, contexts, **kwargs):
+        self.playbook_runner = self.ctx.playbook.create_runner(
+            self.extended_inventory_path, [ctx.playbook_path for ctx in contexts], **kwargs)
+        self.playbook_runner.start()
+
+        for ctx in contexts:
+            self.playbook_runners[ctx.playbook_path] = self.playbook_runner
+
+    def playbook_runner_for(self, ctx):
+        playbook_runner = self.playbook_runners[ctx.playbook_path]
+
+        # a failed host ends the ansible-playbook run of a whole batch, thus
+        # the playbooks it did not get to are continued by another run
+        if len(self.batch) > 1 and not playbook_runner.playbook_started(ctx.playbook_path):
+            self.continue_batch(playbook_runner)
+
+        return self.playbook_runners[ctx.playbook_path]
+
+    def continue_batch(self, playbook_runner):
+        remaining_batch = [ctx for ctx in self.batch
+                           if self.playbook_runners[ctx.playbook_path] is playbook_runner
+                           and not playbook_runner.playbook_started(ctx.playbook_path)]
+
+        # a run not getting to any of its playbooks, e.g. due to an ansible
+        # error, would not get any further when continued
+        if len(remaining_batch) < len(playbook_runner.playbook_paths):
+            self.wait_playbook_runner(playbook_runner)
+            self.run_playbooks(remaining_batch)
+
+    def prepare(self):
+        self.setup_platform()
+        self.start_playbook()
+
+    def prepare_platform(self):
+        # everything but starting the playbook run itself
+        self.setup_platform()
+        self.ctx.playbook.install_all_dependencies()
+
+    def prepare_platform_async(self, pool):
+        self.preparation = pool.apply_async(self.prepare_platform)
+
+    def prepare_async(self, pool, slots):
+        self.slots = slots
+        self.slot_ticket = slots.ticket()
+        self.preparation = pool.apply_async(self.prepare_in_slot)
+
+    def prepare_in_slot(self):
+        # a slot is held until the environment is torn down
+        self.slots.acquire(self.slot_ticket)
+
+        try:
+            if not self.cancelled:
+                self.prepare()
+        finally:
+            with self._lock:
+                self.preparation_finished = True
+                cancelled = self.cancelled
+
+            if cancelled:
+                self.shutdown()
+
+    def release_slot(self):
+        if self.slots is not None:
+            slots, self.slots = self.slots, None
+            slots.release()
+
+    def wait_prepared(self):
+        # re-raises errors occurred during asynchronous preparation
+        if self.preparation is not None:
+            self.preparation.get()
+
+    def finish_playbook(self, ctx):
+        if self.playbook_runner is None:
+            return []
+
+        playbook_runner = self.playbook_runner_for(ctx)
+        self.wait_playbook_runner(playbook_runner)
+
+        return playbook_runner.failures(ctx.playbook_path)
+
+    def wait_playbook_runner(self, playbook_runner):
+        if playbook_runner not in self.finished_runners:
+            self.finished_runners.append(playbook_runner)
+            playbook_runner.wait()
+
+    def teardown_platform(self):
+        # containers are kept until the last playbook of a batch is done
+        self.remaining_members -= 1
+
+        if self.remaining_members <= 0:
+            self.release_platform()
+
+    def release_platform(self):
+        try:
+            if self.docker_runner:
+                docker_runner, self.docker_runner = self.docker_runner, None
+                docker_runner.teardown()
+        finally:
+            self.release_slot()
+
+    def cancel(self):
+        # an environment is shut down by whoever comes last, either its
+        # ongoing preparation or the cancellation itself
+        with self._lock:
+            self.cancelled = True
+            prepared = self.preparation_finished
+
+        if prepared:
+            self.shutdown()
+
+    def abort(self):
+        if self.preparation is not None:
+            self.preparation.wait()
+
+        self.shutdown()
+
+    def shutdown(self):
+        if self.playbook_runner and self.playbook_runner not in self.finished_runners:
+            log.info('aborting playbook run of %s', self.ctx.playbook_path)
+            self.playbook_runner.terminate()
+            self.wait_playbook_runner(self.playbook_runner)
+
+        self.release_platform()
+
+
+class EnvironmentScheduler(object):
+    def __init__(self, workers=1, lookahead=0):
+        self.workers = workers
+        self.lookahead = lookahead
+
+        self.environments = []
+        self.slots = OrderedSlots(workers)
+        self._pool = None
+        self._lookahead_pool = None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = multiprocessing.pool.ThreadPool(processes=self.workers)
+
+        return self._pool
+
+    @property
+    def lookahead_pool(self):
+        if self._lookahead_pool is None:
+            self._lookahead_pool = multiprocessing.pool.ThreadPool(processes=self.lookahead)
+
+        return self._lookahead_pool
+
+    def schedule(self, environments):
+        for environment in environments:
+            if environment.preparation is None:
+                self.track(environment)
+                environment.prepare_async(self.pool, self.slots)
+
+    def prepare_platforms(self, upcoming_environments):
+        # platforms of the next environments are set up while the current
+        # one runs, their playbooks are still started one after another
+        for environment in upcoming_environments[:self.lookahead]:
+            if environment.preparation is None:
+                self.track(environment)
+                environment.prepare_platform_async(self.lookahead_pool)
+
+    def track(self, environment):
+        if environment not in self.environments:
+            self.environments.append(environment)
+
+    def close(self):
+        # environments which have not been run to completion, e.g. due to
+        # pytest's --exitfirst, are aborted
+        for environment in self.environments:
+            environment.abort()
+
+        for pool in (self._pool, self._lookahead_pool):
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+
+# slots are handed out in the order environments have been scheduled, not
+# to whichever pool thread asks first, thus an environment waited for is
+# never overtaken by one scheduled after it
+class OrderedSlots(object):
+    def __init__(self, size):
+        self.available = size
+        self.issued_tickets = 0
+        self.next_ticket = 0
+        self._condition = threading.Condition()
+
+    def ticket(self):
+        with self._condition:
+            ticket = self.issued_tickets
+            self.issued_tickets += 1
+
+        return ticket
+
+    def acquire(self, ticket):
+        with self._condition:
+            while ticket != self.next_ticket or self.available <= 0:
+                self._condition.wait()
+
+            self.next_ticket += 1
+            self.available -= 1
+            self._condition.notify_all()
+
+    def release(self):
+        with self._condition:
+            self.available += 1
+            self._condition.notify_all()
+
+
+def result_fingerprint(ctx, platform=None):
+    # image ids are only known once images have been pulled as required by
+    # the pull policy, and installed dependencies may change even though
+    # their requirements did not, e.g. roles without a pinned version
+    docker_runner = docker_support.DockerRunner(ctx, platform)
+    docker_runner.pull_required_images()
+    ctx.playbook.install_all_dependencies()
+
+    return fingerprint_paths(
+        impact.impact_paths(ctx), ctx.collection_fingerprint, platform,
+        fingerprint_contents(ctx.installed_roles_path), *docker_runner.image_ids())
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+from ansible.playbook.role.requirement import RoleRequirement
+import py.path
+import yaml
+
+from goodplay.ansible_support import role_dependency_name, role_meta_dependencies
+from goodplay.utils.subprocess import run
+
+
+def changed_paths_since(revision, cwd_path):
+    toplevel_path = py.path.local(git_output('rev-parse --show-toplevel', cwd_path)[0])
+
+    # changes to tracked files compared to the working tree, as well as new
+    # files, both relative to the top-level directory
+    rel_paths = git_output('diff --name-only {0}', cwd_path, revision) + \
+        git_output('ls-files --others --exclude-standard --full-name', cwd_path)
+
+    return [toplevel_path.join(rel_path) for rel_path in rel_paths]
+
+
+def changed_paths_from_file(file_name):
+    lines = py.path.local(file_name).read().splitlines()
+
+    return [py.path.local(line.strip()) for line in lines if line.strip()]
+
+
+def git_output(command, cwd_path, *args):
+    process = run('git ' + command, *args, cwd=str(cwd_path), async=True)
+
+    lines = [line.decode('utf-8').rstrip('\n') for line in process.stdout]
+    error_output = b''.join(process.stderr).decode('utf-8').strip()
+    process.wait()
+
+    if process.returncode != 0:
+        raise Exception('git {0} failed: {1}'.format(command.format(*args), error_output))
+
+    return lines
+
+
+def is_affected(ctx, changed_paths):
+    input_paths = impact_paths(ctx)
+
+    return any(is_within(changed_path, input_path)
+               for changed_path in changed_paths for input_path in input_paths)
+
+
+def is_within(path, base_path):
+    return path == base_path or bool(path.relto(base_path))
+
+
+def impact_paths(ctx):
+    # the collection inputs cover the playbook, the files beside it, config,
+    # the role under test and its sibling role dependencies
+    input_paths = list(ctx.collection_input_paths)
+
+    for role_path in used_role_paths(ctx):
+        if role_path not in input_paths:
+            input_paths.append(role_path)
+
+    input_paths.extend(local_requirement_paths(ctx))
+
+    return input_paths
+
+
+def used_role_paths(ctx):
+    search_paths = role_search_paths(ctx)
+    role_paths = []
+    pending_role_names = playbook_role_names(ctx.playbook_path)
+
+    while pending_role_names:
+        role_path = find_role(pending_role_names.pop(0), search_paths)
+
+        if role_path and role_path not in role_paths:
+            role_paths.append(role_path)
+            pending_role_names.extend(
+                role_dependency_name(dependency)
+                for dependency in role_meta_dependencies(role_path))
+
+    return role_paths
+
+
+def role_search_paths(ctx):
+    # same roles path as used when running the playbook, apart from the
+    # installed dependencies, which are not part of the tree
+    search_paths = [ctx.playbook_path.dirpath('roles')]
+
+    if ctx.is_role_playbook:
+        search_paths.append(ctx.role_path.dirpath())
+
+    return search_paths
+
+
+def find_role(role_name, search_paths):
+    for search_path in search_paths:
+        role_path = search_path.join(role_name)
+
+        if role_name and role_path.check(dir=True):
+            return role_path
+
+
+def playbook_role_names(playbook_path):
+    plays = yaml.safe_load(playbook_path.read()) or []
+    role_names = []
+
+    for play in plays:
+        role_names.extend(role_dependency_name(role) for role in play_roles(play))
+
+    return role_names
+
+
+def play_roles(play):
+    if isinstance(play, dict):
+        return play.get('roles') or []
+
+    return []
+
+
+def local_requirement_paths(ctx):
+    requirements = ctx.playbook.role_dependencies + ctx.playbook.soft_dependencies
+    requirement_paths = (
+        py.path.local(RoleRequirement.role_yaml_parse(requirement)['src'])
+        for requirement in requirements)
+
+    return [path for path in requirement_paths if path.check()]
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import collections
 import logging
 import sys
 
@@ -7,10 +8,15 @@ from cached_property import cached_property
 import pytest
 
 from goodplay import ansible_support, docker_support, junitxml
+from goodplay.collection import prefetch_collection
 from goodplay.context import GoodplayContext
+from goodplay.environment import GoodplayEnvironment, result_fingerprint
+from goodplay.session import get_goodplay_session
 
 junitxml.patch_mangle_testnames()
 
+log = logging.getLogger(__name__)
+
 
 # https://urllib3.readthedocs.org/en/latest/security.html#insecureplatformwarning
 logging.captureWarnings(True)
@@ -32,6 +38,317 @@ enable_logging_goodplay_info_to_stdout()
 #       - GoodplayTest (pytest.Item)
 
 
+def pytest_addoption(parser):
+    group = parser.getgroup('goodplay')
+    group.addoption(
+        '--goodplay-no-collection-cache', action='store_false',
+        dest='goodplay_collection_cache', default=True,
+        help='do not reuse test task listings of unchanged playbooks.')
+    group.addoption(
+        '--goodplay-collect-workers', action='store', type='int',
+        dest='goodplay_collect_workers', default=0, metavar='num',
+        help='prepare the collection of test playbooks in a pool of num '
+             'worker processes (default: 0, i.e. collect serially).')
+    group.addoption(
+        '--goodplay-no-role-cache', action='store_false',
+        dest='goodplay_role_cache', default=True,
+        help='do not reuse installed dependencies across test runs.')
+    group.addoption(
+        '--goodplay-role-cache-dir', action='store',
+        dest='goodplay_role_cache_dir', default=None, metavar='path',
+        help='directory to keep installed dependencies in '
+             '(default: inside pytest\'s cache directory).')
+    group.addoption(
+        '--goodplay-role-cache-size', action='store', type='int',
+        dest='goodplay_role_cache_size', default=1024, metavar='MB',
+        help='evict least recently used dependencies when the role cache '
+             'exceeds the given size (default: 1024).')
+    group.addoption(
+        '--goodplay-install-workers', action='store', type='int',
+        dest='goodplay_install_workers', default=4, metavar='num',
+        help='install up to num dependencies concurrently (default: 4).')
+    group.addoption(
+        '--goodplay-platform-workers', action='store', type='int',
+        dest='goodplay_platform_workers', default=1, metavar='num',
+        help='set up and run a test playbook on up to num platforms at once '
+             '(default: 1, i.e. one platform after another).')
+    group.addoption(
+        '--goodplay-changed-since', action='store',
+        dest='goodplay_changed_since', default=None, metavar='revision',
+        help='only run test playbooks affected by files changed since the '
+             'given git revision, including uncommitted and untracked files.')
+    group.addoption(
+        '--goodplay-changed-files', action='store',
+        dest='goodplay_changed_files', default=None, metavar='path',
+        help='only run test playbooks affected by the files listed in the '
+             'given file, one path per line.')
+    group.addoption(
+        '--goodplay-result-cache', action='store_true',
+        dest='goodplay_result_cache', default=False,
+        help='report outcomes of a previous fully passing run of a test '
+             'playbook instead of running it again, as long as none of its '
+             'inputs changed.')
+    group.addoption(
+        '--goodplay-rerun', action='store_true',
+        dest='goodplay_rerun', default=False,
+        help='run all test playbooks even when their outcomes could be '
+             'reused from the result cache.')
+    group.addoption(
+        '--goodplay-checkpoints', action='store_true',
+        dest='goodplay_checkpoints', default=False,
+        help='snapshot containers before the first test task and let later '
+             'runs of unchanged test playbooks start from there.')
+    group.addoption(
+        '--goodplay-checkpoint-cache-size', action='store', type='int',
+        dest='goodplay_checkpoint_cache_size', default=4096, metavar='MB',
+        help='remove least recently used checkpoint images when they exceed '
+             'the given size (default: 4096).')
+    group.addoption(
+        '--goodplay-lookahead', action='store', type='int',
+        dest='goodplay_lookahead', default=0, metavar='num',
+        help='set up platforms and install dependencies of the next num '
+             'test playbooks while the current one runs (default: 0).')
+    group.addoption(
+        '--goodplay-prestart', action='store_true',
+        dest='goodplay_prestart', default=False,
+        help='start setting up and running test playbooks while the '
+             'remaining tests are still being collected.')
+    group.addoption(
+        '--goodplay-batch', action='store_true',
+        dest='goodplay_batch', default=False,
+        help='run test playbooks of the same directory in a single '
+             'ansible-playbook process sharing the same containers.')
+    group.addoption(
+        '--goodplay-pull-policy', action='store',
+        dest='goodplay_pull_policy', default='missing',
+        choices=docker_support.PULL_POLICIES,
+        help='pull docker images only when missing, or always to get their '
+             'latest version once per test run (default: missing).')
+    group.addoption(
+        '--goodplay-pull-workers', action='store', type='int',
+        dest='goodplay_pull_workers', default=4, metavar='num',
+        help='pull up to num docker images concurrently (default: 4).')
+    group.addoption(
+        '--goodplay-container-workers', action='store', type='int',
+        dest='goodplay_container_workers', default=8, metavar='num',
+        help='start and remove up to num docker containers concurrently '
+             '(default: 8).')
+    group.addoption(
+        '--goodplay-container-pool', action='store', type='int',
+        dest='goodplay_container_pool', default=0, metavar='num',
+        help='keep up to num containers started ahead for the hosts of '
+             'upcoming test playbooks (default: 0, i.e. no pool).')
+    group.addoption(
+        '--goodplay-container-isolation', action='store',
+        dest='goodplay_container_isolation', default='fresh',
+        choices=docker_support.ISOLATION_POLICIES,
+        help='either give each test playbook fresh containers, or recycle '
+             'pooled containers of previous test playbooks using the same '
+             'image and hostname (default: fresh).')
+    group.addoption(
+        '--goodplay-container-idle-timeout', action='store', type='int',
+        dest='goodplay_container_idle_timeout', default=600, metavar='seconds',
+        help='remove pooled containers not used within the given time '
+             '(default: 600).')
+    group.addoption(
+        '--goodplay-forkserver', action='store_true',
+        dest='goodplay_forkserver', default=False,
+        help='fork ansible-playbook runs from a server process which has '
+             'imported Ansible already.')
+    group.addoption(
+        '--goodplay-lock', action='store_true',
+        dest='goodplay_lock', default=False,
+        help='record installed dependencies in a lockfile and archive them '
+             'for later offline runs.')
+    group.addoption(
+        '--goodplay-offline', action='store_true',
+        dest='goodplay_offline', default=False,
+        help='install dependencies strictly from the archives recorded in '
+             'the lockfile, without accessing the network.')
+    group.addoption(
+        '--goodplay-lockfile', action='store',
+        dest='goodplay_lockfile', default=None, metavar='path',
+        help='lockfile to record dependencies in (default: goodplay.lock '
+             'in the root directory).')
+    group.addoption(
+        '--goodplay-archive-dir', action='store',
+        dest='goodplay_archive_dir', default=None, metavar='path',
+        help='directory to keep dependency archives in (default: '
+             'goodplay-archives beside the lockfile).')
+
+
+def pytest_configure(config):
+    get_goodplay_session(config)
+
+    if config.pluginmanager.hasplugin('xdist'):
+        register_xdist_support(config)
+
+
+def register_xdist_support(config):
+    from goodplay import xdist_support
+
+    # custom schedulers are supported as of pytest-xdist 1.16
+    if hasattr(config.hook, 'pytest_xdist_make_scheduler'):
+        config.pluginmanager.register(xdist_support, 'goodplay_xdist_support')
+    elif config.getoption('dist') == 'load':
+        raise pytest.UsageError(
+            'goodplay requires pytest-xdist 1.16 or later for distributing tests')
+
+
+def pytest_unconfigure(config):
+    get_goodplay_session(config).release()
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_collection(session):
+    workers = session.config.getoption('goodplay_collect_workers')
+
+    if workers > 0:
+        prefetch_collection(
+            get_goodplay_session(session.config),
+            session.config.args,
+            session.config.getini('norecursedirs'),
+            workers)
+
+    yield
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_make_collect_report(collector):
+    outcome = yield
+
+    # tests of a playbook are known as soon as it is collected
+    if isinstance(collector, GoodplayPlaybook) and is_prestart_enabled(collector.config):
+        report = outcome.get_result()
+
+        if report.passed and report.result:
+            collector.prestart()
+
+
+def is_prestart_enabled(config):
+    goodplay_session = get_goodplay_session(config)
+
+    # with batches, environments are only known once collection is finished
+    return goodplay_session.getoption('goodplay_prestart') \
+        and not goodplay_session.getoption('goodplay_batch') \
+        and not config.option.collectonly \
+        and not goodplay_session.is_xdist_worker
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_collection_modifyitems(session, config, items):
+    goodplay_session = get_goodplay_session(config)
+
+    if config.option.collectonly:
+        return
+
+    if goodplay_session.getoption('goodplay_prestart'):
+        cancel_prestarted_environments(goodplay_session, runnable_platforms(items))
+
+    if goodplay_session.getoption('goodplay_batch'):
+        batch_platforms(goodplay_session, runnable_platforms(items))
+
+    # xdist workers only run a part of the collected items
+    if not goodplay_session.is_xdist_worker:
+        prefetch_containers(goodplay_session, runnable_platforms(items))
+        prefetch_dependencies(runnable_platforms(items))
+
+
+def prefetch_containers(goodplay_session, platforms):
+    container_keys = []
+
+    for environment in unique_environments(platforms):
+        try:
+            container_keys.extend(environment.container_keys())
+        except Exception:
+            # e.g. unknown platforms, which are reported on platform setup
+            continue
+
+    goodplay_session.image_manager.prefetch([image for image, _ in container_keys])
+
+    if goodplay_session.container_pool is not None:
+        goodplay_session.container_pool.expect(container_keys)
+
+
+def prefetch_dependencies(platforms):
+    contexts = []
+
+    # start installing dependencies of all selected test playbooks right away
+    for platform in platforms:
+        if platform.ctx not in contexts:
+            contexts.append(platform.ctx)
+            platform.ctx.playbook.prefetch_all_dependencies()
+
+
+def cancel_prestarted_environments(goodplay_session, platforms):
+    environment_scheduler = goodplay_session.environment_scheduler
+
+    # prestarted environments hold their slot until torn down, thus only the
+    # ones run next keep it, as pytest may have deselected or reordered items
+    next_environments = unique_environments(platforms)[:environment_scheduler.workers]
+
+    for environment in environment_scheduler.environments:
+        if environment not in next_environments:
+            environment.cancel()
+
+    for platform in platforms:
+        if platform.environment.cancelled:
+            platform.environment = GoodplayEnvironment(platform.ctx, platform.platform)
+
+
+def batch_platforms(goodplay_session, platforms):
+    # playbooks within the same directory share inventory, dependencies and
+    # roles path, thus they are compatible as long as no platform is selected
+    batches = collections.OrderedDict()
+
+    for platform in platforms:
+        if platform.platform is None:
+            batches.setdefault(platform.ctx.playbook_path.dirpath(), []).append(platform)
+
+    for batch in batches.values():
+        if len(batch) > 1:
+            share_environment(goodplay_session, batch)
+
+
+def share_environment(goodplay_session, platforms):
+    environment = GoodplayEnvironment(
+        platforms[0].ctx, batch=[platform.ctx for platform in platforms])
+
+    # ensure the shared environment is torn down even when not all of its
+    # playbooks are run, e.g. due to --exitfirst
+    goodplay_session.environment_scheduler.track(environment)
+
+    for platform in platforms:
+        platform.environment = environment
+
+
+def unique_platforms(items):
+    platforms = []
+
+    for item in items:
+        if isinstance(item, GoodplayTest) and item.parent.parent not in platforms:
+            platforms.append(item.parent.parent)
+
+    return platforms
+
+
+def unique_environments(platforms):
+    environments = []
+
+    # batched platforms share a single environment
+    for platform in platforms:
+        if platform.environment not in environments:
+            environments.append(platform.environment)
+
+    return environments
+
+
+def runnable_platforms(items):
+    # platforms with reused outcomes are not run at all
+    return [platform for platform in unique_platforms(items)
+            if platform.cached_outcomes is None]
+
+
 def pytest_collect_file(parent, path):
     return GoodplayPlaybookFile.consider_and_create(path, parent)
 
@@ -51,10 +368,12 @@ class GoodplayPlaybookFile(pytest.File):
 
     @classmethod
     def consider_and_create(cls, path, parent):
-        if ansible_support.is_test_playbook_file(path):
-            ctx = GoodplayContext(playbook_path=path)
+        goodplay_session = get_goodplay_session(parent.config)
 
-            if ctx.inventory_path:
+        if ansible_support.is_test_playbook_file(path, goodplay_session.collection_cache):
+            ctx = GoodplayContext(playbook_path=path, session=goodplay_session)
+
+            if ctx.inventory_path and goodplay_session.is_affected(ctx):
                 return GoodplayPlaybookFile(ctx, path, parent)
 
     def collect(self):
@@ -67,6 +386,19 @@ class GoodplayPlaybookFile(pytest.File):
             if self.config.option.collectonly:
                 self.ctx.release()
 
+    def setup(self):
+        goodplay_session = get_goodplay_session(self.config)
+
+        # with xdist, platforms are already distributed across workers
+        if goodplay_session.getoption('goodplay_platform_workers') > 1 \
+                and not goodplay_session.is_xdist_worker:
+            environments = [platform.environment for platform in self.selected_platforms()]
+            goodplay_session.environment_scheduler.schedule(environments)
+
+    def selected_platforms(self):
+        return [platform for platform in runnable_platforms(self.session.items)
+                if platform.parent is self]
+
     def teardown(self):
         self.ctx.release()
 
@@ -77,7 +409,41 @@ class GoodplayPlatform(GoodplayContextSupport, pytest.Collector):
         super(GoodplayPlatform, self).__init__(str(platform), parent, config, session)
         self.platform = platform
 
-        self.docker_runner = None
+    @cached_property
+    def environment(self):
+        return GoodplayEnvironment(self.ctx, self.platform)
+
+    @cached_property
+    def result_fingerprint(self):
+        try:
+            return result_fingerprint(self.ctx, self.platform)
+        except Exception as e:
+            log.warning('failed to fingerprint %s, its outcomes are not cached: %s',
+                        self.nodeid, e)
+
+    @cached_property
+    def cached_outcomes(self):
+        result_cache = get_goodplay_session(self.config).result_cache
+
+        if result_cache is not None:
+            cached_outcomes = result_cache.get_outcomes(
+                self.ctx.playbook_path, self.platform, self.result_fingerprint)
+
+            if cached_outcomes is not None:
+                log.info('reusing outcomes of previous run of %s', self.nodeid)
+            return cached_outcomes
+
+    def store_outcomes(self, outcomes, failures):
+        result_cache = get_goodplay_session(self.config).result_cache
+        if result_cache is None:
+            return
+
+        # only outcomes of fully passing runs are reused
+        if failures or not set(outcomes.values()) <= set(['passed', 'skipped']):
+            result_cache.discard(self.ctx.playbook_path, self.platform)
+        elif len(outcomes) == len(self.ctx.playbook.test_tasks):
+            result_cache.set_outcomes(
+                self.ctx.playbook_path, self.platform, self.result_fingerprint, outcomes)
 
     def _makeid(self):
         if not self.platform:
@@ -89,12 +455,35 @@ class GoodplayPlatform(GoodplayContextSupport, pytest.Collector):
         yield GoodplayPlaybook(self.parent.name, self, self.config, self.session)
 
     def setup(self):
-        self.docker_runner = docker_support.DockerRunner(self.ctx, self.platform)
-        self.docker_runner.setup()
+        if self.cached_outcomes is not None:
+            return
+
+        goodplay_session = get_goodplay_session(self.config)
+
+        # with xdist, the upcoming items of a worker are not known in advance
+        if goodplay_session.getoption('goodplay_lookahead') > 0 \
+                and not goodplay_session.is_xdist_worker:
+            goodplay_session.environment_scheduler.prepare_platforms(
+                self.upcoming_environments())
+
+        self.environment.wait_prepared()
+        self.environment.setup_platform()
+
+    def upcoming_environments(self):
+        platforms = unique_platforms(self.session.items)
+        upcoming_environments = []
+
+        for platform in platforms[platforms.index(self) + 1:]:
+            if platform.cached_outcomes is not None:
+                continue
+
+            if platform.environment not in upcoming_environments + [self.environment]:
+                upcoming_environments.append(platform.environment)
+
+        return upcoming_environments
 
     def teardown(self):
-        if self.docker_runner:
-            self.docker_runner.teardown()
+        self.environment.teardown_platform()
 
 
 # platform specific playbook preparations
@@ -102,25 +491,37 @@ class GoodplayPlaybook(GoodplayContextSupport, pytest.Collector):
     def __init__(self, name, parent=None, config=None, session=None):
         super(GoodplayPlaybook, self).__init__(name, parent, config, session)
 
-        self.playbook_runner = None
+        self.outcomes = {}
 
     def _makeid(self):
         return self.parent.nodeid
 
+    @property
+    def environment(self):
+        return self.parent.environment
+
     def collect(self):
         for task in self.ctx.playbook.test_tasks:
             yield GoodplayTest(task, self)
 
+    def prestart(self):
+        if self.parent.cached_outcomes is None:
+            goodplay_session = get_goodplay_session(self.config)
+            goodplay_session.environment_scheduler.schedule([self.environment])
+
     def setup(self):
-        self.playbook_runner = self.ctx.playbook.create_runner()
-        self.playbook_runner.run_async()
+        if self.parent.cached_outcomes is None:
+            self.environment.start_playbook()
 
     def teardown(self):
-        if self.playbook_runner:
-            self.playbook_runner.wait()
+        if self.parent.cached_outcomes is not None:
+            return
 
-            if self.playbook_runner.failures:
-                pytest.fail('\n'.join(self.playbook_runner.failures))
+        failures = self.environment.finish_playbook(self.ctx)
+        self.parent.store_outcomes(self.outcomes, failures)
+
+        if failures:
+            pytest.fail('\n'.join(failures))
 
 
 class GoodplayTest(GoodplayContextSupport, pytest.Item):
@@ -131,13 +532,23 @@ class GoodplayTest(GoodplayContextSupport, pytest.Item):
 
     @cached_property
     def playbook_runner(self):
-        return self.parent.playbook_runner
+        return self.parent.environment.playbook_runner_for(self.ctx)
+
+    @cached_property
+    def cached_outcome(self):
+        cached_outcomes = self.parent.parent.cached_outcomes
+
+        if cached_outcomes is not None:
+            return cached_outcomes.get(self.task.name)
 
     def setup(self):
-        self.playbook_runner.wait_for_test_task(self.task)
+        if self.cached_outcome is None:
+            self.playbook_runner.task_started(self.task, playbook_path=self.ctx.playbook_path)
 
     def runtest(self):
-        outcome = self.playbook_runner.wait_for_test_task_outcome(self.task)
+        outcome = self.cached_outcome or \
+            self.playbook_runner.outcome(self.task, playbook_path=self.ctx.playbook_path)
+        self.parent.outcomes[self.task.name] = outcome
 
         if outcome in ('skipped', None):
             pytest.skip()
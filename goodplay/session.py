@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+from cached_property import cached_property
+import py.path
+
+from goodplay import ansible_support, docker_support, impact
+from goodplay.ansible_support.forkserver import ForkServer
+from goodplay.cache import CollectionCache, MemoryCache, ResultCache
+from goodplay.docker_support.checkpoints import CheckpointStore
+from goodplay.environment import EnvironmentScheduler
+
+log = logging.getLogger(__name__)
+
+
+class GoodplaySession(object):
+    def __init__(self, config=None):
+        self.config = config
+
+        self.collection_fingerprints = {}
+        self.warm_containers = None
+        self._temp_paths = []
+
+    def getoption(self, name, default=None):
+        if self.config is None:
+            return default
+
+        return self.config.getoption(name, default)
+
+    @cached_property
+    def is_xdist_worker(self):
+        return hasattr(self.config, 'slaveinput') or hasattr(self.config, 'workerinput')
+
+    @cached_property
+    def cache(self):
+        return getattr(self.config, 'cache', None)
+
+    @cached_property
+    def collection_cache(self):
+        if self.cache is not None and self.getoption('goodplay_collection_cache', True):
+            return CollectionCache(self.cache)
+
+        # without a persistent cache results are still shared within the session
+        return CollectionCache(MemoryCache())
+
+    @cached_property
+    def changed_paths(self):
+        # None unless test playbooks are to be selected by changed paths
+        changed_since = self.getoption('goodplay_changed_since')
+        changed_files = self.getoption('goodplay_changed_files')
+
+        if changed_since is None and changed_files is None:
+            return None
+
+        changed_paths = []
+        if changed_since is not None:
+            changed_paths.extend(impact.changed_paths_since(changed_since, self.config.rootdir))
+        if changed_files is not None:
+            changed_paths.extend(impact.changed_paths_from_file(changed_files))
+
+        return changed_paths
+
+    def is_affected(self, ctx):
+        return self.changed_paths is None or impact.is_affected(ctx, self.changed_paths)
+
+    @cached_property
+    def result_cache(self):
+        # reusing results is opt-in, as not all inputs of a playbook run are
+        # known to goodplay, e.g. remote resources used by the playbook
+        if self.cache is not None and self.getoption('goodplay_result_cache', False):
+            return ResultCache(self.cache, rerun=self.getoption('goodplay_rerun', False))
+
+    @cached_property
+    def checkpoint_store(self):
+        # resuming from checkpoints is opt-in, as tasks run before the first
+        # test task are skipped, including their registered variables
+        if self.cache is not None and self.getoption('goodplay_checkpoints', False):
+            max_size = self.getoption('goodplay_checkpoint_cache_size', 4096) * 1024 * 1024
+
+            return CheckpointStore(self.cache, max_size=max_size)
+
+    @cached_property
+    def role_store(self):
+        role_store_path = self.getoption('goodplay_role_cache_dir')
+
+        if role_store_path:
+            role_store_path = py.path.local(role_store_path).ensure(dir=True)
+        elif self.cache is not None and self.getoption('goodplay_role_cache', True):
+            role_store_path = self.cache.makedir('goodplay-roles')
+        else:
+            # without a persistent cache roles are still shared within the session
+            role_store_path = py.path.local.mkdtemp()
+            self._temp_paths.append(role_store_path)
+
+        max_size = self.getoption('goodplay_role_cache_size', 1024) * 1024 * 1024
+
+        return ansible_support.RoleStore(
+            role_store_path, max_size=max_size,
+            lockfile=self.lockfile, offline=self.getoption('goodplay_offline', False))
+
+    @cached_property
+    def lockfile(self):
+        lock = self.getoption('goodplay_lock', False)
+        offline = self.getoption('goodplay_offline', False)
+
+        if not (lock or offline):
+            return None
+
+        lockfile_path = self.getoption('goodplay_lockfile')
+        if lockfile_path:
+            lockfile_path = py.path.local(lockfile_path)
+        else:
+            lockfile_path = self.config.rootdir.join('goodplay.lock')
+
+        archive_path = self.getoption('goodplay_archive_dir')
+        if archive_path:
+            archive_path = py.path.local(archive_path)
+        else:
+            archive_path = lockfile_path.dirpath('goodplay-archives')
+
+        return ansible_support.Lockfile(lockfile_path, archive_path)
+
+    @cached_property
+    def dependency_resolver(self):
+        workers = self.getoption('goodplay_install_workers', 4)
+
+        return ansible_support.DependencyResolver(self.role_store, workers=workers)
+
+    @cached_property
+    def environment_scheduler(self):
+        return EnvironmentScheduler(
+            workers=self.getoption('goodplay_platform_workers', 1),
+            lookahead=self.getoption('goodplay_lookahead', 0))
+
+    @cached_property
+    def image_manager(self):
+        return docker_support.ImageManager(
+            workers=self.getoption('goodplay_pull_workers', 4),
+            pull_policy=self.getoption('goodplay_pull_policy', 'missing'))
+
+    @cached_property
+    def container_pool(self):
+        max_size = self.getoption('goodplay_container_pool', 0)
+
+        if max_size > 0:
+            return docker_support.ContainerPool(
+                self.image_manager, self.container_reaper, max_size=max_size,
+                isolation=self.getoption('goodplay_container_isolation', 'fresh'),
+                idle_timeout=self.getoption('goodplay_container_idle_timeout', 600))
+
+    @cached_property
+    def container_reaper(self):
+        return docker_support.ContainerReaper(
+            workers=self.getoption('goodplay_container_workers', 8))
+
+    @cached_property
+    def fork_server(self):
+        if not self.getoption('goodplay_forkserver', False):
+            return None
+
+        try:
+            return ForkServer().start()
+        except Exception as e:
+            log.warning('%s ... falling back to running ansible-playbook as subprocess', e)
+            return None
+
+    def release(self):
+        # only release what has actually been used during the session
+        releases = (
+            ('environment_scheduler', 'close'),
+            ('container_pool', 'close'),
+            ('container_reaper', 'close'),
+            ('dependency_resolver', 'close'),
+            ('image_manager', 'close'),
+            ('lockfile', 'save'),
+            ('fork_server', 'close'),
+        )
+        for name, release_method_name in releases:
+            if self.__dict__.get(name) is not None:
+                getattr(self.__dict__[name], release_method_name)()
+
+        self.evict_role_store()
+
+        for temp_path in reversed(self._temp_paths):
+            temp_path.remove(ignore_errors=True)
+
+    def evict_role_store(self):
+        # role store is shared by xdist workers, thus it's evicted by the
+        # controller only, even if it hasn't been used by itself
+        if self.is_xdist_worker:
+            return
+
+        if 'role_store' in self.__dict__ or self.getoption('dist', 'no') != 'no':
+            self.role_store.evict()
+
+
+def get_goodplay_session(config):
+    goodplay_session = getattr(config, 'goodplay_session', None)
+
+    if goodplay_session is None:
+        goodplay_session = GoodplaySession(config)
+        config.goodplay_session = goodplay_session
+
+    return goodplay_session
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+
+
+def fingerprint_paths(paths, *extra):
+    digest = hashlib.sha1()
+
+    for value in extra:
+        digest.update(str(value).encode('utf-8'))
+
+    for path in paths:
+        digest.update(str(path).encode('utf-8'))
+        update_contents(digest, path)
+
+    return digest.hexdigest()
+
+
+def fingerprint_contents(path):
+    # unlike fingerprint_paths independent of where path is located, e.g.
+    # in a temporary directory
+    digest = hashlib.sha1()
+    update_contents(digest, path)
+
+    return digest.hexdigest()
+
+
+def update_contents(digest, path):
+    for file_path in iter_files(path):
+        digest.update(path.bestrelpath(file_path).encode('utf-8'))
+        digest.update(file_path.read_binary())
+
+
+def fingerprint_file(path):
+    return hashlib.sha1(path.read_binary()).hexdigest()
+
+
+def iter_files(path):
+    if path.check(file=True):
+        yield path
+    elif path.check(dir=True):
+        for file_path in path.visit(fil=is_visible_file, rec=is_visible_dir, sort=True):
+            yield file_path
+
+
+def is_visible_file(path):
+    return path.check(file=True) and not path.basename.startswith('.')
+
+
+def is_visible_dir(path):
+    return not path.basename.startswith('.')
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+
+# result of a function run in a pool, which unlike AsyncResult on Python 2
+# wakes up all threads waiting for it at once
+class SharedResult(object):
+    def __init__(self, pool, func, *args):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+        pool.apply_async(self.run, (func, args))
+
+    def run(self, func, args):
+        try:
+            self.value = func(*args)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done.set()
+
+    def get(self):
+        self.done.wait()
+
+        if self.error is not None:
+            raise self.error
+
+        return self.value
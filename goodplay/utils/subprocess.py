@@ -1,32 +1,114 @@
 # -*- coding: utf-8 -*-
 
 import logging
+import threading
+
 import sarge
 
+try:
+    import queue
+except ImportError:  # pragma: no cover
+    import Queue as queue
+
 log = logging.getLogger(__name__)
 
+# processes inherit all inheritable file descriptors, including pipe ends
+# meant for another process started at the same time, which would delay
+# the end of file on these pipes until both processes have terminated,
+# thus processes are started one at a time
+spawn_lock = threading.RLock()
+
 
 def run(command, *args, **kwargs):
     command = sarge.shell_format(command, *args)
     log.info('run process: %s', command)
 
-    return sarge.run(command, stdout=Capture(), stderr=Capture(), **kwargs)
+    is_async = kwargs.pop('async', False)
+
+    # without async, output is only consumed once the process has terminated,
+    # thus it must be captured in full
+    max_lines = Capture.default_max_lines if is_async else 0
+
+    with spawn_lock:
+        process = sarge.run(
+            command, stdout=Capture(max_lines), stderr=Capture(max_lines), async=True, **kwargs)
+        process.wait_events()
+
+    if not is_async:
+        process.wait()
+
+    return process
 
 
 class Capture(sarge.Capture):
-    def __iter__(self):
-        # override default Capture to read lines as long as streams are open,
-        # thus iteration is not being stopped by large pauses between lines
-        # being available
-        while self.streams_open():
-            line = self.readline()
-            if not line:
-                continue
-            yield line
+    # override default Capture to block on reading lines instead of polling,
+    # and to hold at most max_lines unconsumed lines (reader threads, and thus
+    # the subprocess writing to the pipe, wait while the buffer is full),
+    # unless max_lines is 0
+    default_max_lines = 10000
+
+    def __init__(self, max_lines=default_max_lines):
+        super(Capture, self).__init__(buffer_size=-1)
+
+        self.buffer = queue.Queue(maxsize=max_lines)
+        self.finished_streams = 0
+
+    def reader(self, stream, ready):
+        ready.set()
+
+        try:
+            for line in iter(stream.readline, b''):
+                self.buffer.put(line)
+        finally:
+            stream.close()
+            # mark end of stream
+            self.buffer.put(None)
 
-        # ensure remaining buffered lines are consumed (original code)
-        while True:
-            line = self.readline()
+    def readline(self, size=-1, block=True, timeout=None):
+        # returns an empty string once all streams are finished and raises
+        # queue.Empty if no line became available within timeout
+        while self.finished_streams < len(self.streams):
+            line = self.buffer.get(block, timeout)
+
+            if line is None:
+                self.finished_streams += 1
+            else:
+                return line
+
+        return b''
+
+    def readlines(self, sizehint=-1, block=True, timeout=None):
+        # stops at end of file, once sizehint bytes were read or when no
+        # further line became available within timeout
+        lines = []
+        size = 0
+
+        while sizehint <= 0 or size < sizehint:
+            try:
+                line = self.readline(block=block, timeout=timeout)
+            except queue.Empty:
+                break
             if not line:
                 break
-            yield line
+            lines.append(line)
+            size += len(line)
+
+        return lines
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+
+def log_lines_in_background(capture, logger, lines=None):
+    thread = threading.Thread(target=log_lines, args=(capture, logger, lines))
+    thread.daemon = True
+    thread.start()
+
+    return thread
+
+
+def log_lines(capture, logger, lines=None):
+    for line in capture:
+        logger.info(line.rstrip(b'\n'))
+        if lines is not None:
+            lines.append(line)
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+
+import py.path
+import pytest
+
+from goodplay.docker_support import WarmContainers
+from goodplay.session import get_goodplay_session
+from goodplay.utils.fingerprint import iter_files
+
+log = logging.getLogger(__name__)
+
+# pytest's exit code when interrupted via Ctrl+C
+EXIT_INTERRUPTED = 2
+
+
+class FileWatcher(object):
+    def __init__(self, watched_path, interval=1.0):
+        self.watched_path = watched_path
+        self.interval = interval
+
+    def snapshot(self):
+        snapshot = {}
+
+        for file_path in iter_files(self.watched_path):
+            try:
+                stat = file_path.stat()
+            except py.error.ENOENT:
+                continue
+            snapshot[str(file_path)] = (stat.mtime, stat.size)
+
+        return snapshot
+
+    def wait_for_changes(self, previous_snapshot):
+        while True:
+            snapshot = self.snapshot()
+            changed_paths = changed_paths_between(previous_snapshot, snapshot)
+
+            if changed_paths:
+                return snapshot, changed_paths
+
+            time.sleep(self.interval)
+
+
+def changed_paths_between(previous_snapshot, snapshot):
+    # modified, added and removed files
+    file_names = set(previous_snapshot) | set(snapshot)
+
+    return [py.path.local(file_name) for file_name in sorted(file_names)
+            if previous_snapshot.get(file_name) != snapshot.get(file_name)]
+
+
+# pytest plugin spanning all test runs of a watch mode session
+class Watch(object):
+    def __init__(self, args, plugins, watcher=None):
+        self.args = args
+        self.plugins = plugins + [self]
+        self.watcher = watcher or FileWatcher(py.path.local())
+
+        self.warm_containers = WarmContainers()
+        self.temp_path = None
+        self.interrupted = False
+
+    def pytest_addoption(self, parser):
+        group = parser.getgroup('goodplay')
+        group.addoption(
+            '--watch', action='store_true',
+            dest='goodplay_watch', default=False,
+            help='keep running and re-run test playbooks affected by changed '
+                 'files, while keeping their containers running in between.')
+
+    def pytest_configure(self, config):
+        if config.getoption('goodplay_watch'):
+            get_goodplay_session(config).warm_containers = self.warm_containers
+
+    def pytest_keyboard_interrupt(self, excinfo):
+        # other errors, e.g. a playbook failing to be collected, only end a
+        # single test run
+        self.interrupted = True
+
+    def run(self):
+        self.temp_path = py.path.local.mkdtemp()
+
+        try:
+            return self.run_until_interrupted()
+        except KeyboardInterrupt:
+            return EXIT_INTERRUPTED
+        finally:
+            self.warm_containers.remove_all()
+            self.temp_path.remove(ignore_errors=True)
+
+    def run_until_interrupted(self):
+        snapshot = self.watcher.snapshot()
+        exit_code = pytest.main(self.args, self.plugins)
+
+        while not self.interrupted:
+            log.info('watching for changes ...')
+            snapshot, changed_paths = self.watcher.wait_for_changes(snapshot)
+            exit_code = self.run_affected(changed_paths)
+
+        return exit_code
+
+    def run_affected(self, changed_paths):
+        log.info('%d changed files ... re-running affected test playbooks', len(changed_paths))
+
+        changed_files_path = self.temp_path.join('changed_files')
+        changed_files_path.write('\n'.join(str(path) for path in changed_paths))
+
+        return pytest.main(
+            self.args + ['--goodplay-changed-files', str(changed_files_path)], self.plugins)
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+import posixpath
+
+import pytest
+
+try:
+    from xdist.scheduler import LoadScheduling
+except ImportError:  # pragma: no cover
+    # pytest-xdist < 1.19
+    from xdist.dsession import LoadScheduling
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_xdist_make_scheduler(config, log):
+    if config.getoption('dist') == 'load':
+        return GoodplayScheduling(config, log)
+
+
+# all tests of a playbook on a platform share a single playbook run and are
+# therefore sent to the same node as a whole, while nodes pick up the next
+# group as soon as they are about to run out of tests
+# (LoadScheduling is an old-style class on Python 2, thus no super())
+class GoodplayScheduling(LoadScheduling):
+    def __init__(self, config, log=None):
+        LoadScheduling.__init__(self, config, log)
+
+        # batched playbooks of a directory share a single playbook run
+        self.batch = config.getoption('goodplay_batch')
+
+    def schedule(self):
+        if self.collection is not None:
+            return LoadScheduling.schedule(self)
+
+        if not self._check_nodes_have_same_collection():
+            self.log('**Different tests collected, aborting run**')
+            return
+
+        self.collection = list(self.node2collection.values())[0]
+        self.pending[:] = range(len(self.collection))
+        self.distribute_initial_groups()
+
+    def distribute_initial_groups(self):
+        for node in self.nodes:
+            self._send_tests(node, 1)
+
+        if not self.pending:
+            for node in self.nodes:
+                node.shutdown()
+
+    def check_schedule(self, node, duration=0):
+        if node.shutting_down:
+            return
+
+        # the last pending test of a node is only run once the node knows
+        # about its successor, thus the next group is sent right away
+        if self.pending and len(self.node2pending[node]) < 2:
+            self._send_tests(node, 1)
+
+    def _send_tests(self, node, num):
+        tests_per_node = []
+
+        for _ in range(num):
+            tests_per_node.extend(self.pop_pending_group())
+
+        if tests_per_node:
+            self.node2pending[node].extend(tests_per_node)
+            node.send_runtest_some(tests_per_node)
+
+    def pop_pending_group(self):
+        if not self.pending:
+            return []
+
+        group_key = scope_of(self.collection[self.pending[0]], self.batch)
+        group_size = 1
+        while group_size < len(self.pending) and \
+                scope_of(self.collection[self.pending[group_size]], self.batch) == group_key:
+            group_size += 1
+
+        group = self.pending[:group_size]
+        del self.pending[:group_size]
+
+        return group
+
+
+def scope_of(nodeid, batch=False):
+    parts = nodeid.split('::')
+
+    if not parts[0].endswith(('.yml', '.yaml')):
+        # tests not provided by goodplay are distributed one by one
+        return nodeid
+
+    # node id is either path::task or path::platform::task, with platform
+    # being formatted as name:version
+    if len(parts) > 2 and ':' in parts[1]:
+        return '::'.join(parts[:2])
+
+    if batch:
+        return posixpath.dirname(parts[0])
+
+    return parts[0]
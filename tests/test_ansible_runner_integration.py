@@ -4,6 +4,7 @@ import logging
 
 import pytest
 
+from goodplay.context import GoodplayContext
 from goodplay_helpers import smart_create
 
 pytestmark = pytest.mark.integration
@@ -439,3 +440,368 @@ def test_ansible_stdout_is_fully_consumed(testdir, capsys):
     stdout, _ = capsys.readouterr()
     ansible_play_recap_part = 'failed=1'
     assert ansible_play_recap_part in stdout
+
+
+def test_multiple_playbook_runners_are_driven_concurrently(tmpdir):
+    smart_create(tmpdir, '''
+    ## inventory
+    127.0.0.1 ansible_connection=local
+
+    ## test_playbook1.yml
+    - hosts: 127.0.0.1
+      gather_facts: no
+      tasks:
+        - name: task1
+          ping:
+          tags: test
+
+    ## test_playbook2.yml
+    - hosts: 127.0.0.1
+      gather_facts: no
+      tasks:
+        - name: task2
+          ping:
+          tags: test
+          changed_when: True
+    ''')
+
+    first_ctx = GoodplayContext(tmpdir.join('test_playbook1.yml'))
+    second_ctx = GoodplayContext(tmpdir.join('test_playbook2.yml'))
+    first_runner = first_ctx.playbook.create_runner().start()
+    second_runner = second_ctx.playbook.create_runner().start()
+
+    second_outcome = second_runner.outcome(second_ctx.playbook.test_tasks[0])
+    first_outcome = first_runner.outcome(first_ctx.playbook.test_tasks[0])
+    first_runner.wait()
+    second_runner.wait()
+    first_ctx.release()
+    second_ctx.release()
+
+    assert (first_outcome, second_outcome) == ('passed', 'failed')
+    assert [event['event_name'] for event in first_runner.events()] == \
+        ['play-start', 'test-task-start', 'test-task-end']
+    assert first_runner.finished and second_runner.finished
+
+
+def test_failed_playbook_run_leaves_no_retry_file(testdir):
+    smart_create(testdir.tmpdir, '''
+    ## inventory
+    127.0.0.1 ansible_connection=local
+
+    ## test_playbook.yml
+    - hosts: 127.0.0.1
+      gather_facts: no
+      tasks:
+        - name: retry files disabled
+          assert:
+            that: "lookup('env', 'ANSIBLE_RETRY_FILES_ENABLED') == 'False'"
+          tags: test
+
+        - name: task1
+          fail:
+          tags: test
+    ''')
+
+    result = testdir.inline_run('-s')
+
+    passed, _, failed = result.listoutcomes()
+    assert [report.nodeid for report in passed] == ['test_playbook.yml::retry files disabled']
+    assert [report.nodeid for report in failed] == ['test_playbook.yml::task1']
+    assert testdir.tmpdir.listdir('*.retry') == []
+
+
+def test_batched_playbooks_are_run_by_single_ansible_playbook_process(testdir, caplog):
+    smart_create(testdir.tmpdir, '''
+    ## inventory
+    127.0.0.1 ansible_connection=local
+
+    ## test_playbook1.yml
+    - hosts: 127.0.0.1
+      gather_facts: no
+      tasks:
+        - name: task1
+          ping:
+          tags: test
+
+    ## test_playbook2.yml
+    - hosts: 127.0.0.1
+      gather_facts: no
+      tasks:
+        - name: task1
+          ping:
+          tags: test
+          changed_when: True
+    ''')
+
+    result = testdir.inline_run('-s', '--goodplay-batch')
+
+    passed, _, failed = result.listoutcomes()
+    assert [report.nodeid for report in passed] == ['test_playbook1.yml::task1']
+    assert [report.nodeid for report in failed] == ['test_playbook2.yml::task1']
+    assert len([record for record in caplog.record_tuples
+                if record[2].startswith('PLAY RECAP')]) == 1
+    assert testdir.tmpdir.listdir('.goodplay-batch-*') == []
+
+
+def test_batched_playbook_failures_are_reported_by_source_playbook(testdir):
+    smart_create(testdir.tmpdir, '''
+    ## inventory
+    127.0.0.1 ansible_connection=local
+
+    ## test_playbook1.yml
+    - hosts: 127.0.0.1
+      gather_facts: no
+      tasks:
+        - name: task1
+          ping:
+          tags: test
+
+    ## test_playbook2.yml
+    - hosts: 127.0.0.1
+      gather_facts: no
+      tasks:
+        - name: task2
+          ping:
+          tags: test
+
+        - name: intentionally failed task
+          ping:
+          failed_when: True
+    ''')
+
+    result = testdir.inline_run('-s', '--goodplay-batch')
+
+    passed, _, failed = result.listoutcomes()
+    assert len(passed) == 2
+    assert [report.nodeid for report in failed] == ['test_playbook2.yml::task2']
+
+
+def test_batched_playbooks_are_run_after_failed_test_task(testdir):
+    smart_create(testdir.tmpdir, '''
+    ## inventory
+    127.0.0.1 ansible_connection=local
+
+    ## test_playbook1.yml
+    - hosts: 127.0.0.1
+      gather_facts: no
+      tasks:
+        - name: task1
+          fail:
+          tags: test
+
+    ## test_playbook2.yml
+    - hosts: 127.0.0.1
+      gather_facts: no
+      tasks:
+        - name: task2
+          ping:
+          tags: test
+
+    ## test_playbook3.yml
+    - hosts: 127.0.0.1
+      gather_facts: no
+      tasks:
+        - name: task3
+          ping:
+          tags: test
+    ''')
+
+    result = testdir.inline_run('-s', '--goodplay-batch')
+
+    passed, _, failed = result.listoutcomes()
+    assert [report.nodeid for report in passed] == \
+        ['test_playbook2.yml::task2', 'test_playbook3.yml::task3']
+    assert [report.nodeid for report in failed] == ['test_playbook1.yml::task1']
+    assert testdir.tmpdir.listdir('.goodplay-batch-*') == []
+
+
+def test_prestarted_playbooks_are_run_once_selected(testdir):
+    smart_create(testdir.tmpdir, '''
+    ## inventory
+    127.0.0.1 ansible_connection=local
+
+    ## test_playbook1.yml
+    - hosts: 127.0.0.1
+      gather_facts: no
+      tasks:
+        - name: task1
+          ping:
+          tags: test
+
+    ## test_playbook2.yml
+    - hosts: 127.0.0.1
+      gather_facts: no
+      tasks:
+        - name: task2
+          ping:
+          tags: test
+
+    ## test_playbook3.yml
+    - hosts: 127.0.0.1
+      gather_facts: no
+      tasks:
+        - name: task3
+          ping:
+          tags: test
+    ''')
+
+    result = testdir.inline_run('-s', '--goodplay-prestart', '-k', 'not task2')
+
+    result.assertoutcome(passed=2)
+
+
+def test_prestarted_playbooks_are_run_in_reordered_sequence(testdir):
+    smart_create(testdir.tmpdir, '''
+    ## inventory
+    127.0.0.1 ansible_connection=local
+
+    ## test_playbook1.yml
+    - hosts: 127.0.0.1
+      gather_facts: no
+      tasks:
+        - name: task1
+          ping:
+          tags: test
+
+    ## test_playbook2.yml
+    - hosts: 127.0.0.1
+      gather_facts: no
+      tasks:
+        - name: task2
+          ping:
+          tags: test
+          changed_when: True
+    ''')
+
+    testdir.inline_run('-s')
+    result = testdir.inline_run('-s', '--ff', '--goodplay-prestart')
+
+    passed, _, failed = result.listoutcomes()
+    assert [report.nodeid for report in failed] == ['test_playbook2.yml::task2']
+    assert [report.nodeid for report in passed] == ['test_playbook1.yml::task1']
+
+
+def test_playbooks_are_run_with_platforms_prepared_ahead(testdir):
+    smart_create(testdir.tmpdir, '''
+    ## inventory
+    127.0.0.1 ansible_connection=local
+
+    ## test_playbook1.yml
+    - hosts: 127.0.0.1
+      gather_facts: no
+      tasks:
+        - name: task1
+          ping:
+          tags: test
+
+    ## test_playbook2.yml
+    - hosts: 127.0.0.1
+      gather_facts: no
+      tasks:
+        - name: task2
+          ping:
+          tags: test
+          changed_when: True
+
+    ## test_playbook3.yml
+    - hosts: 127.0.0.1
+      gather_facts: no
+      tasks:
+        - name: task3
+          ping:
+          tags: test
+    ''')
+
+    result = testdir.inline_run('-s', '--goodplay-lookahead', '2')
+
+    result.assertoutcome(passed=2, failed=1)
+
+
+def test_playbook_run_waits_for_checkpoint_before_first_test_task(tmpdir):
+    smart_create(tmpdir, '''
+    ## inventory
+    127.0.0.1 ansible_connection=local
+
+    ## test_playbook.yml
+    - hosts: 127.0.0.1
+      gather_facts: no
+      tasks:
+        - name: converge
+          file: path={{ playbook_dir }}/converged state=touch
+        - name: task1
+          file: path={{ playbook_dir }}/converged state=file
+          tags: test
+    ''')
+    checkpoints = []
+
+    def on_checkpoint(task_name):
+        started_test_tasks = [event for event in runner.events(timeout=0)
+                              if event['event_name'] == 'test-task-start']
+        checkpoints.append((task_name, tmpdir.join('converged').check(), started_test_tasks))
+
+    ctx = GoodplayContext(tmpdir.join('test_playbook.yml'))
+    runner = ctx.playbook.create_runner(on_checkpoint=on_checkpoint).start()
+    outcome = runner.outcome(ctx.playbook.test_tasks[0])
+    runner.wait()
+    ctx.release()
+
+    assert outcome == 'passed'
+    assert checkpoints == [('task1', True, [])]
+
+
+def test_playbook_run_checkpoints_first_test_task_run(tmpdir):
+    smart_create(tmpdir, '''
+    ## inventory
+    127.0.0.1 ansible_connection=local
+
+    ## test_playbook.yml
+    - hosts: unknown
+      gather_facts: no
+      tasks:
+        - name: task1
+          ping:
+          tags: test
+
+    - hosts: 127.0.0.1
+      gather_facts: no
+      tasks:
+        - name: task2
+          ping:
+          tags: test
+    ''')
+    checkpoints = []
+
+    ctx = GoodplayContext(tmpdir.join('test_playbook.yml'))
+    runner = ctx.playbook.create_runner(on_checkpoint=checkpoints.append).start()
+    outcome = runner.outcome(ctx.playbook.test_tasks[1])
+    runner.wait()
+    ctx.release()
+
+    assert outcome == 'passed'
+    assert checkpoints == ['task2']
+
+
+def test_playbook_run_starts_at_given_task(tmpdir):
+    smart_create(tmpdir, '''
+    ## inventory
+    127.0.0.1 ansible_connection=local
+
+    ## test_playbook.yml
+    - hosts: 127.0.0.1
+      gather_facts: no
+      tasks:
+        - name: converge
+          fail: msg="already converged"
+        - name: task1
+          ping:
+          tags: test
+    ''')
+
+    ctx = GoodplayContext(tmpdir.join('test_playbook.yml'))
+    runner = ctx.playbook.create_runner(start_at_task='task1').start()
+    outcome = runner.outcome(ctx.playbook.test_tasks[0])
+    runner.wait()
+    ctx.release()
+
+    assert outcome == 'passed'
+    assert runner.failures() == []
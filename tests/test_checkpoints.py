@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+import docker.errors
+import pytest
+
+from goodplay.cache import MemoryCache
+from goodplay.docker_support.checkpoints import CheckpointStore
+
+
+@pytest.fixture
+def client(mocker):
+    client = mocker.patch('docker.Client', autospec=True).return_value
+    client.inspect_image.return_value = dict(Size=1100)
+    client.history.return_value = [dict(Size=100), dict(Size=1000)]
+
+    return client
+
+
+def test_committed_checkpoint_is_found_by_fingerprint(client):
+    checkpoint_store = CheckpointStore(MemoryCache())
+    checkpoint_store.commit('fingerprint1', 'task1', dict(host1=dict(Id='container1')))
+
+    checkpoint = checkpoint_store.get('fingerprint1', ['host1'])
+
+    assert checkpoint['task'] == 'task1'
+    assert checkpoint['images']['host1'].startswith('goodplay-checkpoint:')
+    client.commit.assert_called_once_with(
+        dict(Id='container1'), repository='goodplay-checkpoint',
+        tag=checkpoint['images']['host1'].split(':')[1])
+
+
+def test_checkpoint_size_counts_committed_layer_only(client):
+    checkpoint_store = CheckpointStore(MemoryCache())
+    checkpoint_store.commit(
+        'fingerprint1', 'task1', dict(host1=dict(Id='container1'), host2=dict(Id='container2')))
+
+    assert checkpoint_store.entries()['fingerprint1']['size'] == 200
+
+
+def test_checkpoint_of_other_fingerprint_or_hosts_is_not_found(client):
+    checkpoint_store = CheckpointStore(MemoryCache())
+    checkpoint_store.commit('fingerprint1', 'task1', dict(host1=dict(Id='container1')))
+
+    assert checkpoint_store.get('fingerprint2', ['host1']) is None
+    assert checkpoint_store.get('fingerprint1', ['host1', 'host2']) is None
+
+
+def test_checkpoint_with_removed_images_is_discarded(client):
+    checkpoint_store = CheckpointStore(MemoryCache())
+    checkpoint_store.commit('fingerprint1', 'task1', dict(host1=dict(Id='container1')))
+    client.inspect_image.side_effect = \
+        docker.errors.NotFound('image not found', None, explanation='simulate removed image')
+
+    assert checkpoint_store.get('fingerprint1', ['host1']) is None
+    assert checkpoint_store.entries() == {}
+
+
+def test_least_recently_used_checkpoints_are_evicted(client):
+    checkpoint_store = CheckpointStore(MemoryCache(), max_size=250)
+    checkpoint_store.commit('fingerprint1', 'task1', dict(host1=dict(Id='container1')))
+    checkpoint_store.commit('fingerprint2', 'task1', dict(host1=dict(Id='container2')))
+    first_image = checkpoint_store.get('fingerprint1', ['host1'])['images']['host1']
+    second_image = checkpoint_store.entries()['fingerprint2']['images']['host1']
+
+    checkpoint_store.commit('fingerprint3', 'task1', dict(host1=dict(Id='container3')))
+
+    assert sorted(checkpoint_store.entries()) == ['fingerprint1', 'fingerprint3']
+    client.remove_image.assert_called_once_with(second_image, force=True)
+    assert first_image != second_image
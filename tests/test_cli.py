@@ -69,3 +69,36 @@ def test_goodplay_cli_forwards_pytest_returncode(tmpdir):
         ['goodplay'], cwd=str(tmpdir))
 
     assert goodplay_returncode == EXIT_NOTESTSCOLLECTED
+
+
+def test_goodplay_cli_selects_playbooks_affected_by_changed_files(tmpdir):
+    smart_create(tmpdir, '''
+    ## first/inventory
+    127.0.0.1 ansible_connection=local
+
+    ## first/test_playbook.yml
+    - hosts: 127.0.0.1
+      tasks:
+        - name: task1
+          ping:
+          tags: test
+
+    ## second/inventory
+    127.0.0.1 ansible_connection=local
+
+    ## second/test_playbook.yml
+    - hosts: 127.0.0.1
+      tasks:
+        - name: task2
+          ping:
+          tags: test
+    ''')
+
+    tmpdir.join('changed_files').write('second/inventory\n')
+
+    stdout = subprocess.check_output(
+        ['goodplay', '--collect-only', '--goodplay-changed-files', 'changed_files'],
+        cwd=str(tmpdir))
+
+    assert "<GoodplayTest 'task1'>" not in stdout
+    assert "<GoodplayTest 'task2'>" in stdout
@@ -21,8 +21,9 @@ def test_ansible_error_message_is_forwarded(testdir):
 
     assert result.getfailures()[0].__class__.__name__ == 'CollectReport'
 
-    assert 'Exception: ERROR! no action detected in task' \
-        in str(result.getfailures()[0].longrepr)
+    longrepr = str(result.getfailures()[0].longrepr)
+    assert 'Exception: ERROR! no action detected in task' in longrepr
+    assert longrepr.count('no action detected in task') == 1
 
 
 def test_nothing_collected_when_inventory_missing(testdir):
@@ -658,3 +659,198 @@ def test_ignore_test_tasks_in_always_block(testdir):
     items, result = testdir.inline_genitems()
     result.assertoutcome()
     assert len(items) == 0
+
+
+def test_task_listing_of_unchanged_playbook_is_reused(testdir, mocker):
+    smart_create(testdir.tmpdir, '''
+    ## inventory
+    127.0.0.1 ansible_connection=local
+
+    ## test_playbook.yml
+    - hosts: 127.0.0.1
+      tasks:
+        - name: task1
+          ping:
+          tags: test
+    ''')
+
+    items, result = testdir.inline_genitems()
+    assert [item.name for item in items] == ['task1']
+
+    list_tasks_mock = mocker.patch('goodplay.ansible_support.Playbook.list_tasks')
+
+    items, result = testdir.inline_genitems()
+    result.assertoutcome()
+    assert [item.name for item in items] == ['task1']
+    assert not list_tasks_mock.called
+
+
+def test_task_listing_of_changed_playbook_is_not_reused(testdir):
+    smart_create(testdir.tmpdir, '''
+    ## inventory
+    127.0.0.1 ansible_connection=local
+
+    ## test_playbook.yml
+    - hosts: 127.0.0.1
+      tasks:
+        - name: task1
+          ping:
+          tags: test
+    ''')
+
+    items, result = testdir.inline_genitems()
+    assert [item.name for item in items] == ['task1']
+
+    testdir.tmpdir.join('test_playbook.yml').write('''
+- hosts: 127.0.0.1
+  tasks:
+    - name: task2
+      ping:
+      tags: test
+''')
+
+    items, result = testdir.inline_genitems()
+    result.assertoutcome()
+    assert [item.name for item in items] == ['task2']
+
+
+def test_task_listing_is_not_reused_without_collection_cache(testdir, mocker):
+    smart_create(testdir.tmpdir, '''
+    ## inventory
+    127.0.0.1 ansible_connection=local
+
+    ## test_playbook.yml
+    - hosts: 127.0.0.1
+      tasks:
+        - name: task1
+          ping:
+          tags: test
+    ''')
+
+    testdir.inline_genitems()
+
+    list_tasks_mock = mocker.patch('goodplay.ansible_support.Playbook.list_tasks')
+    list_tasks_mock.return_value = []
+
+    items, result = testdir.inline_genitems('--goodplay-no-collection-cache')
+    result.assertoutcome()
+    assert len(items) == 0
+    assert list_tasks_mock.called
+
+
+def test_test_tasks_of_role_under_test_are_collected(testdir):
+    smart_create(testdir.tmpdir, '''
+    ## role1/meta/main.yml
+    dependencies: []
+
+    ## role1/tasks/main.yml
+    - name: role task
+      ping:
+
+    - name: role test task
+      ping:
+      tags: test
+
+    ## role1/tests/inventory
+    127.0.0.1 ansible_connection=local
+
+    ## role1/tests/test_playbook.yml
+    - hosts: 127.0.0.1
+      roles:
+        - role: role1
+      tasks:
+        - name: playbook test task
+          ping:
+          tags: test
+    ''')
+
+    items, result = testdir.inline_genitems()
+    result.assertoutcome()
+    assert [item.name for item in items] == ['role1 : role test task', 'playbook test task']
+
+
+def test_collection_with_worker_pool_keeps_order(testdir):
+    smart_create(testdir.tmpdir, '''
+    ## dir1/inventory
+    127.0.0.1 ansible_connection=local
+
+    ## dir1/test_playbook.yml
+    - hosts: 127.0.0.1
+      tasks:
+        - name: task1
+          ping:
+          tags: test
+
+    ## dir2/inventory
+    127.0.0.1 ansible_connection=local
+
+    ## dir2/test_playbook.yml
+    - hosts: 127.0.0.1
+      tasks:
+        - name: task2
+          ping:
+          tags: test
+
+        - name: task3
+          ping:
+          tags: test
+
+    ## dir2/test_no_playbook.yml
+    key: value
+    ''')
+
+    items, result = testdir.inline_genitems('--goodplay-collect-workers=2')
+    result.assertoutcome()
+    assert [item.name for item in items] == ['task1', 'task2', 'task3']
+
+
+def test_collection_with_worker_pool_reports_errors(testdir):
+    smart_create(testdir.tmpdir, '''
+    ## inventory
+    127.0.0.1 ansible_connection=local
+
+    ## test_playbook.yml
+    - hosts: 127.0.0.1
+      tasks:
+        - name: task1
+          unknownmodule:
+          tags: test
+    ''')
+
+    items, result = testdir.inline_genitems('--goodplay-collect-workers=2')
+    result.assertoutcome(failed=1)
+    assert len(items) == 0
+
+
+def test_dependencies_are_not_installed_during_collection(testdir, mocker):
+    install_mock = mocker.patch(
+        'goodplay.ansible_support.Playbook.install_roles')
+
+    smart_create(testdir.tmpdir, '''
+    ## role2/meta/main.yml
+    dependencies:
+      - name: role1
+        src: https://example.com/role1.tar.gz
+
+    ## role2/tests/inventory
+    127.0.0.1 ansible_connection=local
+
+    ## role2/tests/requirements.yml
+    - src: https://example.com/role3.tar.gz
+
+    ## role2/tests/test_playbook.yml
+    - hosts: 127.0.0.1
+      roles:
+        - role: role1
+        - role: role2
+        - role: role3
+      tasks:
+        - name: task1
+          ping:
+          tags: test
+    ''')
+
+    items, result = testdir.inline_genitems()
+    result.assertoutcome()
+    assert [item.name for item in items] == ['task1']
+    assert not install_mock.called
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+from goodplay.collection import find_candidate_paths, prefetch_playbook
+
+
+def test_find_candidate_paths_in_directory(tmpdir):
+    tmpdir.join('test_playbook1.yml').ensure()
+    tmpdir.join('sub_dir', 'test_playbook2.yml').ensure()
+    tmpdir.join('sub_dir', 'playbook3.yml').ensure()
+    tmpdir.join('sub_dir', 'test_playbook4.yaml').ensure()
+
+    candidate_paths = list(find_candidate_paths([tmpdir], norecursedirs=[]))
+
+    assert candidate_paths == [
+        tmpdir.join('sub_dir', 'test_playbook2.yml'),
+        tmpdir.join('test_playbook1.yml'),
+    ]
+
+
+def test_find_candidate_paths_skips_norecursedirs(tmpdir):
+    tmpdir.join('test_playbook1.yml').ensure()
+    tmpdir.join('.hidden', 'test_playbook2.yml').ensure()
+
+    candidate_paths = list(find_candidate_paths([tmpdir], norecursedirs=['.*']))
+
+    assert candidate_paths == [tmpdir.join('test_playbook1.yml')]
+
+
+def test_find_candidate_paths_with_file_and_node_id(tmpdir):
+    playbook_path = tmpdir.join('test_playbook.yml').ensure()
+
+    candidate_paths = list(find_candidate_paths(
+        ['{0!s}::task1'.format(playbook_path)], norecursedirs=[]))
+
+    assert candidate_paths == [playbook_path]
+
+
+def test_prefetch_playbook_lists_tasks(tmpdir):
+    tmpdir.join('inventory').write('127.0.0.1 ansible_connection=local')
+    playbook_path = tmpdir.join('test_playbook.yml')
+    playbook_path.write('''---
+- hosts: 127.0.0.1
+  tasks:
+    - name: task1
+      ping:
+      tags: test
+''')
+
+    result = prefetch_playbook((str(playbook_path), None))
+
+    assert result['is_playbook'] is True
+    assert result['fingerprint']
+    assert [(task.name, task.tags) for task in result['tasks']] == [('task1', ['test'])]
+
+
+def test_prefetch_playbook_skips_listing_when_fingerprint_unchanged(tmpdir):
+    tmpdir.join('inventory').write('127.0.0.1 ansible_connection=local')
+    playbook_path = tmpdir.join('test_playbook.yml')
+    playbook_path.write('''---
+- hosts: 127.0.0.1
+  tasks:
+    - name: task1
+      ping:
+      tags: test
+''')
+
+    fingerprint = prefetch_playbook((str(playbook_path), None))['fingerprint']
+    result = prefetch_playbook((str(playbook_path), fingerprint))
+
+    assert result['fingerprint'] == fingerprint
+    assert 'tasks' not in result
+
+
+def test_prefetch_playbook_of_non_playbook(tmpdir):
+    playbook_path = tmpdir.join('test_playbook.yml')
+    playbook_path.write('key: value')
+
+    result = prefetch_playbook((str(playbook_path), None))
+
+    assert result['is_playbook'] is False
+    assert 'fingerprint' not in result
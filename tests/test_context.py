@@ -424,3 +424,126 @@ def test_platform_manager_select_platform_by_name_and_version_ignores_non_availa
     platform_manager.select_platform_by_name_and_version('ubuntu', 'precise')
 
     assert len(platform_manager.selected_platforms) == 0
+
+
+# collection_fingerprint
+
+def test_collection_fingerprint_changes_when_playbook_changes(tmpdir):
+    playbook_path = tmpdir.join('test_playbook.yml')
+    playbook_path.write('- hosts: host1', ensure=True)
+
+    first_fingerprint = GoodplayContext(playbook_path).collection_fingerprint
+
+    playbook_path.write('- hosts: host2')
+
+    assert GoodplayContext(playbook_path).collection_fingerprint != first_fingerprint
+
+
+def test_collection_fingerprint_changes_when_config_changes(tmpdir):
+    playbook_path = tmpdir.join('playbooks', 'test_playbook.yml')
+    playbook_path.write('- hosts: host1', ensure=True)
+    config_path = tmpdir.join('.goodplay.yml')
+    config_path.write('platforms: []')
+
+    first_fingerprint = GoodplayContext(playbook_path).collection_fingerprint
+
+    config_path.write('platforms: [{name: EL, version: 7, image: centos:centos7}]')
+
+    assert GoodplayContext(playbook_path).collection_fingerprint != first_fingerprint
+
+
+def test_collection_fingerprint_changes_when_dependent_role_beside_changes(tmpdir):
+    tmpdir.join('role1', 'meta', 'main.yml').write('dependencies: []', ensure=True)
+    tasks_path = tmpdir.join('role1', 'tasks', 'main.yml')
+    tasks_path.write('- ping:', ensure=True)
+    tmpdir.join('role2', 'meta', 'main.yml').write('dependencies: [role1]', ensure=True)
+
+    playbook_path = tmpdir.join('role2', 'tests', 'test_playbook.yml')
+    playbook_path.write('- hosts: host1', ensure=True)
+
+    ctx = GoodplayContext(playbook_path)
+    assert ctx.dependent_role_paths == [tmpdir.join('role1')]
+    first_fingerprint = ctx.collection_fingerprint
+
+    tasks_path.write('- command: /bin/true')
+
+    assert GoodplayContext(playbook_path).collection_fingerprint != first_fingerprint
+
+
+def test_collection_fingerprint_ignores_hidden_files(tmpdir):
+    playbook_path = tmpdir.join('test_playbook.yml')
+    playbook_path.write('- hosts: host1', ensure=True)
+
+    first_fingerprint = GoodplayContext(playbook_path).collection_fingerprint
+
+    tmpdir.join('.role1.run').ensure()
+
+    assert GoodplayContext(playbook_path).collection_fingerprint == first_fingerprint
+
+
+def test_collection_fingerprint_ignores_other_playbooks_beside(tmpdir):
+    playbook_path = tmpdir.join('test_playbook.yml')
+    playbook_path.write('- hosts: host1', ensure=True)
+    other_playbook_path = tmpdir.join('test_other_playbook.yml')
+    other_playbook_path.write('- hosts: host1')
+
+    first_fingerprint = GoodplayContext(playbook_path).collection_fingerprint
+
+    other_playbook_path.write('- hosts: host2')
+
+    assert GoodplayContext(playbook_path).collection_fingerprint == first_fingerprint
+
+
+def test_collection_fingerprint_changes_when_included_file_changes(tmpdir):
+    playbook_path = tmpdir.join('test_playbook.yml')
+    playbook_path.write('- hosts: host1\n  tasks:\n    - include: tasks/converge.yml', ensure=True)
+    included_path = tmpdir.join('tasks', 'converge.yml')
+    included_path.write('- ping:', ensure=True)
+
+    first_fingerprint = GoodplayContext(playbook_path).collection_fingerprint
+
+    included_path.write('- ping:\n- fail:\n  tags: test')
+
+    assert GoodplayContext(playbook_path).collection_fingerprint != first_fingerprint
+
+
+def test_collection_fingerprint_ignores_playbook_directories_beside(tmpdir):
+    playbook_path = tmpdir.join('test_playbook.yml')
+    playbook_path.write('- hosts: host1', ensure=True)
+    other_inventory_path = tmpdir.join('other', 'inventory')
+    other_inventory_path.write('host1', ensure=True)
+
+    first_fingerprint = GoodplayContext(playbook_path).collection_fingerprint
+
+    other_inventory_path.write('host2')
+
+    assert GoodplayContext(playbook_path).collection_fingerprint == first_fingerprint
+
+
+def test_collection_fingerprint_changes_when_group_vars_change(tmpdir):
+    playbook_path = tmpdir.join('test_playbook.yml')
+    playbook_path.write('- hosts: host1', ensure=True)
+    group_vars_path = tmpdir.join('group_vars', 'all.yml')
+    group_vars_path.write('var: value1', ensure=True)
+
+    first_fingerprint = GoodplayContext(playbook_path).collection_fingerprint
+
+    group_vars_path.write('var: value2')
+
+    assert GoodplayContext(playbook_path).collection_fingerprint != first_fingerprint
+
+
+def test_collection_fingerprint_changes_when_requirement_version_changes(tmpdir):
+    requirements_path = tmpdir.join('playbooks', 'requirements.yml')
+    requirements_path.write('- src: user.role1\n  version: v1', ensure=True)
+    playbook_path = tmpdir.join('playbooks', 'test_playbook.yml')
+    playbook_path.write('- hosts: host1')
+    tmpdir.join('playbooks', 'inventory').write('host1')
+
+    ctx = GoodplayContext(playbook_path)
+    first_fingerprint = ctx.collection_fingerprint
+    ctx.release()
+
+    requirements_path.write('- src: user.role1\n  version: v2')
+
+    assert GoodplayContext(playbook_path).collection_fingerprint != first_fingerprint
@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 
+import threading
+
+import docker.errors
 import pytest
 
-from goodplay.docker_support import DockerRunner
+from goodplay.docker_support import ContainerPool, ContainerReaper, DockerRunner, ImageManager
 
 
 @pytest.fixture
@@ -52,3 +55,316 @@ def test_client_is_cached(mocker):
 
     assert id(docker_runner.client) == id(first_result)
     assert client_mock.call_count == 1
+
+
+@pytest.fixture
+def image_client(mocker):
+    client = mocker.patch('docker.Client', autospec=True).return_value
+    client.inspect_image.side_effect = \
+        docker.errors.NotFound('image not found', None, explanation='simulate missing image')
+
+    return client
+
+
+def test_image_manager_pulls_missing_images_concurrently(image_client):
+    pulls_started = dict((image, threading.Event()) for image in ('first:1', 'second:1'))
+
+    def pull(image):
+        pulls_started[image].set()
+        # each pull only finishes once the other one has started as well
+        for pull_started in pulls_started.values():
+            assert pull_started.wait(5)
+    image_client.pull.side_effect = pull
+
+    image_manager = ImageManager(workers=2)
+    image_manager.prefetch(['first:1', 'second:1'])
+    image_manager.require('second:1')
+    image_manager.require('first:1')
+    image_manager.close()
+
+    assert image_client.pull.call_count == 2
+
+
+def test_image_manager_pulls_each_image_once(image_client):
+    image_manager = ImageManager()
+    image_manager.prefetch(['busybox:latest', 'busybox:latest'])
+    image_manager.require('busybox:latest')
+    image_manager.close()
+
+    image_client.inspect_image.assert_called_once_with('busybox:latest')
+    image_client.pull.assert_called_once_with('busybox:latest')
+
+
+def test_image_manager_wakes_up_all_threads_requiring_same_image(image_client):
+    image_manager = ImageManager()
+    requirements = [threading.Thread(target=image_manager.require, args=('busybox:latest',))
+                    for _ in range(3)]
+
+    for requirement in requirements:
+        requirement.daemon = True
+        requirement.start()
+    for requirement in requirements:
+        requirement.join(5)
+    image_manager.close()
+
+    assert not any(requirement.is_alive() for requirement in requirements)
+    image_client.pull.assert_called_once_with('busybox:latest')
+
+
+def test_image_manager_does_not_pull_present_images(image_client):
+    image_client.inspect_image.side_effect = None
+
+    image_manager = ImageManager()
+    image_manager.require('busybox:latest')
+    image_manager.close()
+
+    assert not image_client.pull.called
+
+
+def test_image_manager_always_pulls_images_with_always_policy(image_client):
+    image_client.inspect_image.side_effect = None
+
+    image_manager = ImageManager(pull_policy='always')
+    image_manager.require('busybox:latest')
+    image_manager.close()
+
+    assert not image_client.inspect_image.called
+    image_client.pull.assert_called_once_with('busybox:latest')
+
+
+def test_image_manager_reraises_pull_errors_on_require(image_client):
+    image_client.pull.side_effect = Exception('pull failed')
+
+    image_manager = ImageManager()
+    image_manager.prefetch(['busybox:latest'])
+
+    with pytest.raises(Exception) as excinfo:
+        image_manager.require('busybox:latest')
+    image_manager.close()
+
+    assert 'pull failed' in str(excinfo.value)
+
+
+@pytest.fixture
+def docker_ctx(mocker):
+    ctx = mocker.Mock()
+    ctx.session.getoption.side_effect = lambda name, default=None: default
+    ctx.session.warm_containers = None
+    ctx.session.container_pool = None
+    ctx.session.container_reaper = ContainerReaper()
+
+    hosts = []
+    for hostname in ('host1', 'host2'):
+        host = mocker.Mock()
+        host.vars.return_value = dict(inventory_hostname=hostname, goodplay_image='centos:7')
+        hosts.append(host)
+    ctx.inventory.hosts.return_value = hosts
+
+    return ctx
+
+
+def test_docker_runner_starts_containers_concurrently(image_client, docker_ctx):
+    creations_started = dict((hostname, threading.Event()) for hostname in ('host1', 'host2'))
+
+    def create_container(image, hostname, **kwargs):
+        creations_started[hostname].set()
+        # each creation only finishes once the other one has started as well
+        for creation_started in creations_started.values():
+            assert creation_started.wait(5)
+        return dict(Id=hostname)
+    image_client.create_container.side_effect = create_container
+
+    docker_runner = DockerRunner(docker_ctx)
+    containers = docker_runner.start_containers()
+
+    assert [container for _, container in containers] == [dict(Id='host1'), dict(Id='host2')]
+    assert image_client.start.call_count == 2
+
+
+def test_docker_runner_removes_started_containers_when_others_fail(image_client, docker_ctx):
+    def create_container(image, hostname, **kwargs):
+        if hostname == 'host2':
+            raise Exception('create failed')
+        return dict(Id=hostname)
+    image_client.create_container.side_effect = create_container
+
+    docker_runner = DockerRunner(docker_ctx)
+    with pytest.raises(Exception):
+        docker_runner.start_containers()
+    docker_runner.teardown()
+    docker_ctx.session.container_reaper.close()
+
+    image_client.remove_container.assert_called_once_with(dict(Id='host1'), force=True)
+
+
+def test_container_reaper_logs_failed_removals(mocker, caplog):
+    client = mocker.Mock()
+    client.remove_container.side_effect = Exception('removal failed')
+
+    container_reaper = ContainerReaper()
+    container_reaper.reap(client, dict(Id='container1'))
+    container_reaper.close()
+
+    assert any('removal failed' in record[2] for record in caplog.record_tuples)
+
+
+@pytest.fixture
+def container_client(image_client):
+    image_client.inspect_image.side_effect = None
+    image_client.create_container.side_effect = \
+        lambda image, hostname, **kwargs: dict(Id='{0}-{1}'.format(
+            hostname, image_client.create_container.call_count))
+
+    return image_client
+
+
+def test_container_pool_starts_expected_containers_ahead(container_client):
+    container_pool = ContainerPool(ImageManager(), ContainerReaper(), max_size=2)
+    container_pool.expect([('centos:7', 'host1'), ('centos:7', 'host2'), ('centos:7', 'host3')])
+    container_pool.close()
+
+    # the pool is limited to its size, thus host3 has not been started ahead
+    started_hostnames = [
+        call[1]['hostname'] for call in container_client.create_container.call_args_list]
+    assert sorted(started_hostnames) == ['host1', 'host2']
+
+
+def test_container_pool_discards_used_containers_by_default(container_client):
+    container_reaper = ContainerReaper()
+    container_pool = ContainerPool(ImageManager(), container_reaper)
+    container_pool.expect([('centos:7', 'host1')])
+
+    container = container_pool.acquire(('centos:7', 'host1'))
+    container_pool.release(('centos:7', 'host1'), container)
+    container_pool.close()
+    container_reaper.close()
+
+    container_client.remove_container.assert_called_once_with(container, force=True)
+
+
+def test_container_pool_recycles_used_containers(container_client):
+    container_reaper = ContainerReaper()
+    container_pool = ContainerPool(ImageManager(), container_reaper, isolation='recycle')
+
+    first_container = container_pool.acquire(('centos:7', 'host1'))
+    container_pool.release(('centos:7', 'host1'), first_container)
+    second_container = container_pool.acquire(('centos:7', 'host1'))
+    container_pool.release(('centos:7', 'host1'), second_container)
+
+    assert second_container == first_container
+    assert container_client.create_container.call_count == 1
+    assert not container_client.remove_container.called
+
+    container_pool.close()
+    container_reaper.close()
+
+    container_client.remove_container.assert_called_once_with(first_container, force=True)
+
+
+def test_container_pool_evicts_idle_containers(container_client):
+    container_reaper = ContainerReaper()
+    container_pool = ContainerPool(
+        ImageManager(), container_reaper, isolation='recycle', idle_timeout=-1)
+
+    first_container = container_pool.acquire(('centos:7', 'host1'))
+    container_pool.release(('centos:7', 'host1'), first_container)
+    second_container = container_pool.acquire(('centos:7', 'host2'))
+    container_reaper.close()
+
+    container_client.remove_container.assert_called_once_with(first_container, force=True)
+    assert second_container != first_container
+
+
+def test_docker_runner_starts_containers_within_network_of_its_own(image_client, docker_ctx):
+    image_client.create_network.return_value = dict(Id='network1')
+    image_client.create_container.side_effect = \
+        lambda image, hostname, **kwargs: dict(Id=hostname)
+
+    docker_runner = DockerRunner(docker_ctx)
+    docker_runner.start_containers()
+    docker_runner.teardown()
+    docker_ctx.session.container_reaper.close()
+
+    assert image_client.create_network.call_count == 1
+    image_client.create_host_config.assert_called_with(network_mode='network1')
+    image_client.create_endpoint_config.assert_any_call(aliases=['host1'])
+    image_client.create_endpoint_config.assert_any_call(aliases=['host2'])
+    assert image_client.remove_container.call_count == 2
+    image_client.remove_network.assert_called_once_with('network1')
+
+
+def test_docker_runner_falls_back_to_default_network(image_client, docker_ctx):
+    image_client.create_network.side_effect = \
+        docker.errors.APIError('networks not supported', None, explanation='simulate old daemon')
+    image_client.create_container.side_effect = \
+        lambda image, hostname, **kwargs: dict(Id=hostname)
+
+    docker_runner = DockerRunner(docker_ctx)
+    docker_runner.start_containers()
+    docker_runner.teardown()
+    docker_ctx.session.container_reaper.close()
+
+    image_client.create_host_config.assert_called_with(network_mode=None)
+    assert not image_client.remove_network.called
+
+
+def test_docker_runner_falls_back_to_default_network_on_old_api(image_client, docker_ctx):
+    image_client.create_network.side_effect = \
+        docker.errors.InvalidVersion('create_network is not available for API version < 1.21')
+    image_client.create_container.side_effect = \
+        lambda image, hostname, **kwargs: dict(Id=hostname)
+
+    docker_runner = DockerRunner(docker_ctx)
+    docker_runner.start_containers()
+    docker_runner.teardown()
+    docker_ctx.session.container_reaper.close()
+
+    image_client.create_host_config.assert_called_with(network_mode=None)
+    assert not image_client.remove_network.called
+
+
+def test_docker_runner_starts_containers_without_aliases_support(image_client, docker_ctx):
+    image_client.create_network.return_value = dict(Id='network1')
+    image_client.create_endpoint_config.side_effect = \
+        docker.errors.InvalidVersion('aliases is not supported for API version < 1.22')
+    image_client.create_container.side_effect = \
+        lambda image, hostname, **kwargs: dict(Id=hostname)
+
+    docker_runner = DockerRunner(docker_ctx)
+    containers = [container for _, container in docker_runner.start_containers()]
+    docker_runner.teardown()
+    docker_ctx.session.container_reaper.close()
+
+    assert len(containers) == 2
+    image_client.create_host_config.assert_called_with(network_mode=None)
+
+
+def test_docker_runner_connects_pooled_containers_to_its_network(container_client, docker_ctx):
+    container_client.create_network.return_value = dict(Id='network1')
+    docker_ctx.session.container_pool = ContainerPool(
+        ImageManager(), docker_ctx.session.container_reaper, isolation='recycle')
+
+    docker_runner = DockerRunner(docker_ctx)
+    containers = [container for _, container in docker_runner.start_containers()]
+    docker_runner.teardown()
+
+    container_client.connect_container_to_network.assert_any_call(
+        containers[0], 'network1', aliases=['host1'])
+    container_client.disconnect_container_from_network.assert_any_call(
+        containers[0], 'network1')
+    assert not container_client.remove_container.called
+
+
+def test_docker_runner_uses_pooled_containers_failing_to_join_network(
+        container_client, docker_ctx):
+    container_client.create_network.return_value = dict(Id='network1')
+    container_client.connect_container_to_network.side_effect = \
+        docker.errors.InvalidVersion('aliases is not supported for API version < 1.22')
+    docker_ctx.session.container_pool = ContainerPool(
+        ImageManager(), docker_ctx.session.container_reaper, isolation='recycle')
+
+    docker_runner = DockerRunner(docker_ctx)
+    containers = [container for _, container in docker_runner.start_containers()]
+    docker_runner.teardown()
+
+    assert len(containers) == 2
@@ -437,3 +437,48 @@ def test_role_with_goodplay_platform_wildcard(testdir, docker_client):
     assert kwargs['image'] == 'centos:centos7'
 
     assert docker_client.start.call_count == 2
+
+
+def test_role_with_goodplay_platform_wildcard_on_concurrent_platforms(testdir, docker_client):
+    smart_create(testdir.tmpdir, '''
+    ## local-role-base/role1/meta/main.yml
+    galaxy_info:
+      author: John Doe
+      platforms:
+        - name: EL
+          versions:
+            - 6
+            - 7
+    dependencies: []
+
+    ## local-role-base/role1/tasks/main.yml
+    - ping:
+
+    ## local-role-base/role1/tests/.goodplay.yml
+    platforms:
+      - name: EL
+        version: 6
+        image: centos:centos6
+
+      - name: EL
+        version: 7
+        image: centos:centos7
+
+    ## local-role-base/role1/tests/inventory
+    default goodplay_platform=*
+
+    ## local-role-base/role1/tests/test_playbook.yml
+    - hosts: default
+      gather_facts: no
+      tasks:
+        - name: host is reachable
+          ping:
+          tags: test
+    ''')
+
+    result = testdir.inline_run('-s', '--goodplay-platform-workers=2')
+    result.assertoutcome(passed=2)
+
+    images = set(kwargs['image'] for _, _, kwargs in docker_client.create_container.mock_calls)
+    assert images == set(['centos:centos6', 'centos:centos7'])
+    assert docker_client.remove_container.call_count == 2
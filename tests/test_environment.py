@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+from goodplay.cache import MemoryCache
+from goodplay.context import GoodplayContext
+from goodplay.docker_support import DockerRunner
+from goodplay.docker_support.checkpoints import CheckpointStore
+from goodplay.environment import EnvironmentScheduler, GoodplayEnvironment, result_fingerprint
+from goodplay.session import GoodplaySession
+
+
+class FakeEnvironment(GoodplayEnvironment):
+    def __init__(self):
+        super(FakeEnvironment, self).__init__(ctx=None)
+
+        self.prepared = threading.Event()
+        self.platform_prepared = threading.Event()
+
+    def prepare(self):
+        self.prepared.set()
+
+    def prepare_platform(self):
+        self.platform_prepared.set()
+
+
+def test_scheduler_prepares_environments_concurrently():
+    scheduler = EnvironmentScheduler(workers=2)
+    environments = [FakeEnvironment(), FakeEnvironment()]
+
+    scheduler.schedule(environments)
+
+    assert all(environment.prepared.wait(5) for environment in environments)
+    scheduler.close()
+
+
+def test_scheduler_limits_environments_existing_at_once():
+    scheduler = EnvironmentScheduler(workers=1)
+    first_environment, second_environment = FakeEnvironment(), FakeEnvironment()
+
+    scheduler.schedule([first_environment, second_environment])
+    first_environment.wait_prepared()
+
+    assert not second_environment.prepared.wait(0.1)
+
+    first_environment.teardown_platform()
+
+    assert second_environment.prepared.wait(5)
+    scheduler.close()
+
+
+def test_scheduler_hands_out_slots_in_scheduling_order():
+    scheduler = EnvironmentScheduler(workers=2)
+    environments = [FakeEnvironment() for _ in range(4)]
+
+    scheduler.schedule(environments[:2])
+    environments[0].wait_prepared()
+    environments[1].wait_prepared()
+    scheduler.schedule(environments[2:])
+    environments[1].teardown_platform()
+
+    assert environments[2].prepared.wait(5)
+    assert not environments[3].prepared.wait(0.1)
+
+    environments[0].teardown_platform()
+
+    assert environments[3].prepared.wait(5)
+    scheduler.close()
+
+
+def test_scheduler_skips_environments_cancelled_while_waiting():
+    scheduler = EnvironmentScheduler(workers=1)
+    first_environment, second_environment, third_environment = \
+        FakeEnvironment(), FakeEnvironment(), FakeEnvironment()
+
+    scheduler.schedule([first_environment, second_environment, third_environment])
+    first_environment.wait_prepared()
+    second_environment.cancel()
+    first_environment.teardown_platform()
+
+    assert third_environment.prepared.wait(5)
+    assert not second_environment.prepared.is_set()
+    scheduler.close()
+
+
+def test_cancelling_prepared_environment_releases_its_slot():
+    scheduler = EnvironmentScheduler(workers=1)
+    first_environment, second_environment = FakeEnvironment(), FakeEnvironment()
+
+    scheduler.schedule([first_environment, second_environment])
+    first_environment.wait_prepared()
+    first_environment.cancel()
+
+    assert second_environment.prepared.wait(5)
+    scheduler.close()
+
+
+def test_scheduler_prepares_platforms_of_upcoming_environments_only():
+    scheduler = EnvironmentScheduler(lookahead=2)
+    environments = [FakeEnvironment(), FakeEnvironment(), FakeEnvironment()]
+
+    scheduler.prepare_platforms(environments)
+
+    assert all(environment.platform_prepared.wait(5) for environment in environments[:2])
+    assert environments[2].preparation is None
+    assert not any(environment.prepared.is_set() for environment in environments)
+    scheduler.close()
+
+
+def test_result_fingerprint_changes_when_installed_role_changes(tmpdir):
+    tmpdir.join('inventory').write('127.0.0.1 ansible_connection=local')
+    playbook_path = tmpdir.join('test_playbook.yml')
+    playbook_path.write('- hosts: 127.0.0.1\n  tasks: []')
+    ctx = GoodplayContext(playbook_path)
+
+    try:
+        first_fingerprint = result_fingerprint(ctx)
+        ctx.installed_roles_path.join('role1', 'tasks', 'main.yml').write('- ping:', ensure=True)
+
+        assert result_fingerprint(ctx) != first_fingerprint
+    finally:
+        ctx.release()
+
+
+def restored_environment(playbook_path, goodplay_session):
+    environment = GoodplayEnvironment(GoodplayContext(playbook_path, session=goodplay_session))
+    environment.docker_runner = DockerRunner(environment.ctx)
+    environment.restore_checkpoint()
+
+    return environment
+
+
+def test_checkpoint_is_not_resumed_once_included_converge_changes(tmpdir, mocker):
+    mocker.patch.object(GoodplayEnvironment, 'is_checkpointable', return_value=True)
+    tmpdir.join('inventory').write('127.0.0.1 ansible_connection=local')
+    playbook_path = tmpdir.join('test_playbook.yml')
+    playbook_path.write('- hosts: 127.0.0.1\n  tasks:\n    - include: converge.yml\n')
+    converge_path = tmpdir.join('converge.yml')
+    converge_path.write('- ping:\n')
+    goodplay_session = GoodplaySession()
+    goodplay_session.checkpoint_store = CheckpointStore(MemoryCache())
+
+    environments = [restored_environment(playbook_path, goodplay_session)]
+    environments[0].commit_checkpoint('task1')
+    environments.append(restored_environment(playbook_path, goodplay_session))
+    converge_path.write('- ping:\n- ping:\n')
+    environments.append(restored_environment(playbook_path, goodplay_session))
+
+    try:
+        assert environments[1].checkpoint_options() == dict(start_at_task='task1')
+        assert 'on_checkpoint' in environments[2].checkpoint_options()
+    finally:
+        for environment in environments:
+            environment.ctx.release()
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+
+import pytest
+
+from goodplay.ansible_support.events import EventChannel, EventDispatcher, frame_header
+
+
+def write_frame(channel, **frame):
+    payload = json.dumps(frame).encode('utf-8')
+    os.write(channel.write_fd, frame_header.pack(len(payload)) + payload)
+
+
+def test_event_channel_receives_frames_until_closed():
+    channel = EventChannel()
+    write_frame(channel, sequence=1, timestamp=1.0, event_name='test-task-start',
+                data=dict(name='task1'))
+    write_frame(channel, sequence=2, timestamp=2.0, event_name='test-task-end',
+                data=dict(name='task1', outcome='passed'))
+    channel.close_write_end()
+
+    events = list(channel)
+    channel.close()
+
+    assert [event['event_name'] for event in events] == ['test-task-start', 'test-task-end']
+    assert events[1]['data'] == dict(name='task1', outcome='passed')
+
+
+def test_event_channel_detects_lost_frames():
+    channel = EventChannel()
+    write_frame(channel, sequence=2, timestamp=1.0, event_name='test-task-start', data={})
+    channel.close_write_end()
+
+    with pytest.raises(Exception) as excinfo:
+        channel.receive()
+    channel.close()
+
+    assert 'goodplay event out of sequence: expected 1, got 2' in str(excinfo.value)
+
+
+def test_event_channel_detects_truncated_frames():
+    channel = EventChannel()
+    os.write(channel.write_fd, frame_header.pack(100) + b'{"sequence"')
+    channel.close_write_end()
+
+    with pytest.raises(Exception) as excinfo:
+        channel.receive()
+    channel.close()
+
+    assert 'closed in the middle of a frame' in str(excinfo.value)
+
+
+def test_event_dispatcher_resolves_events_in_any_order():
+    channel = EventChannel()
+    write_frame(channel, sequence=1, timestamp=1.0, event_name='test-task-end',
+                data=dict(name='task2', outcome='failed'))
+    write_frame(channel, sequence=2, timestamp=2.0, event_name='test-task-end',
+                data=dict(name='task1', outcome='passed'))
+    channel.close_write_end()
+
+    dispatcher = EventDispatcher(channel)
+    dispatcher.start()
+
+    assert dispatcher.wait('test-task-end', 'task1')['data']['outcome'] == 'passed'
+    assert dispatcher.wait('test-task-end', 'task2')['data']['outcome'] == 'failed'
+    assert dispatcher.wait('test-task-end', 'task3') is None
+    dispatcher.join()
+    channel.close()
+
+    assert dispatcher.errors == []
+
+
+def test_event_dispatcher_stops_waiting_on_error():
+    channel = EventChannel()
+    write_frame(channel, sequence=1, timestamp=1.0, event_name='error',
+                data=dict(message='task failed'))
+
+    dispatcher = EventDispatcher(channel)
+    dispatcher.start()
+
+    assert dispatcher.wait('test-task-start', 'task1') is None
+    assert dispatcher.errors == ['task failed']
+    channel.close_write_end()
+    dispatcher.join()
+    channel.close()
+
+
+def test_event_dispatcher_resolves_events_by_playbook():
+    channel = EventChannel()
+    write_frame(channel, sequence=1, timestamp=1.0, event_name='test-task-end',
+                data=dict(name='task1', outcome='failed', playbook='playbook2.yml'))
+    write_frame(channel, sequence=2, timestamp=2.0, event_name='test-task-end',
+                data=dict(name='task1', outcome='passed', playbook='playbook1.yml'))
+    channel.close_write_end()
+
+    dispatcher = EventDispatcher(channel)
+    dispatcher.start()
+
+    assert dispatcher.wait('test-task-end', 'task1', playbook='playbook1.yml')['data'][
+        'outcome'] == 'passed'
+    assert dispatcher.wait('test-task-end', 'task1', playbook='playbook2.yml')['data'][
+        'outcome'] == 'failed'
+    dispatcher.join()
+    channel.close()
+
+
+def test_event_dispatcher_stops_waiting_for_playbook_on_its_error():
+    channel = EventChannel()
+    write_frame(channel, sequence=1, timestamp=1.0, event_name='error',
+                data=dict(message='task failed', playbook='playbook1.yml'))
+
+    dispatcher = EventDispatcher(channel)
+    dispatcher.start()
+
+    assert dispatcher.wait('test-task-start', 'task1', playbook='playbook1.yml') is None
+    assert dispatcher.errors_of('playbook1.yml') == ['task failed']
+    assert dispatcher.errors_of('playbook2.yml') == []
+    assert not dispatcher.wait('test-task-start', 'task1', 0.1, 'playbook2.yml')
+    channel.close_write_end()
+    dispatcher.join()
+    channel.close()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import pytest
+
+from goodplay.ansible_support.forkserver import ForkServer
+from goodplay_helpers import smart_create
+
+
+@pytest.fixture
+def fork_server(request):
+    fork_server = ForkServer().start()
+    request.addfinalizer(fork_server.close)
+
+    return fork_server
+
+
+def test_forked_process_receives_argv_env_and_fds(tmpdir, fork_server):
+    script_path = tmpdir.join('script')
+    script_path.write(
+        '#!/usr/bin/env python\n'
+        'import os, sys\n'
+        'print(" ".join(sys.argv[1:]))\n'
+        'os.write(int(os.environ["EXTRA_FD"]), os.environ["GREETING"].encode("utf-8"))\n'
+        'sys.exit(3)\n')
+    script_path.chmod(0o755)
+    extra_read_fd, extra_write_fd = os.pipe()
+    env = dict(os.environ, PATH=str(tmpdir), GREETING='hello')
+
+    process = fork_server.run(
+        ['script', 'arg1', 'arg2'], env, env_fds=dict(EXTRA_FD=extra_write_fd))
+    os.close(extra_write_fd)
+
+    assert process.stdout.readlines() == [b'arg1 arg2\n']
+    assert os.read(extra_read_fd, 100) == b'hello'
+    assert process.wait() == 3
+    os.close(extra_read_fd)
+
+
+def test_forkserver_supports_python_scripts_only(tmpdir, fork_server):
+    tmpdir.join('python-script').write('#!/usr/bin/python\n')
+    tmpdir.join('shell-script').write('#!/bin/sh\n')
+    for name in ('python-script', 'shell-script'):
+        tmpdir.join(name).chmod(0o755)
+    env = dict(PATH=str(tmpdir))
+
+    assert fork_server.supports('python-script', env)
+    assert not fork_server.supports('shell-script', env)
+    assert not fork_server.supports('missing-script', env)
+
+
+@pytest.mark.integration
+def test_playbook_is_run_in_forkserver(testdir, capfd):
+    smart_create(testdir.tmpdir, '''
+    ## inventory
+    127.0.0.1 ansible_connection=local
+
+    ## test_playbook.yml
+    - hosts: 127.0.0.1
+      gather_facts: no
+      tasks:
+        - name: task1
+          ping:
+          tags: test
+        - name: task2
+          ping:
+          tags: test
+          changed_when: True
+    ''')
+
+    result = testdir.inline_run('-s', '--goodplay-forkserver')
+
+    result.assertoutcome(passed=1, failed=1)
+    stdout, _ = capfd.readouterr()
+    assert 'run process in forkserver: ansible-playbook' in stdout
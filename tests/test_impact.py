@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+import subprocess
+
+import pytest
+
+from goodplay_helpers import smart_create
+
+
+@pytest.fixture
+def role_tree(testdir):
+    smart_create(testdir.tmpdir, '''
+    ## role1/meta/main.yml
+    dependencies:
+      - role: role2
+
+    ## role1/tasks/main.yml
+    - name: role1 task
+      ping:
+
+    ## role1/tests/inventory
+    127.0.0.1 ansible_connection=local
+
+    ## role1/tests/test_playbook.yml
+    - hosts: 127.0.0.1
+      roles:
+        - role: role1
+      tasks:
+        - name: role1 test task
+          ping:
+          tags: test
+
+    ## role2/meta/main.yml
+    dependencies: []
+
+    ## role2/tasks/main.yml
+    - name: role2 task
+      ping:
+
+    ## role3/meta/main.yml
+    dependencies: []
+
+    ## role3/tasks/main.yml
+    - name: role3 task
+      ping:
+
+    ## role3/tests/inventory
+    127.0.0.1 ansible_connection=local
+
+    ## role3/tests/test_playbook.yml
+    - hosts: 127.0.0.1
+      roles:
+        - role: role3
+      tasks:
+        - name: role3 test task
+          ping:
+          tags: test
+
+    ## playbooks/inventory
+    127.0.0.1 ansible_connection=local
+
+    ## playbooks/roles/role4/tasks/main.yml
+    - name: role4 task
+      ping:
+
+    ## playbooks/test_playbook.yml
+    - hosts: 127.0.0.1
+      roles:
+        - role4
+      tasks:
+        - name: playbook test task
+          ping:
+          tags: test
+    ''')
+
+    return testdir.tmpdir
+
+
+def collected_names_with_changed_files(testdir, *rel_paths):
+    testdir.tmpdir.join('changed_files').write(
+        '\n'.join(str(testdir.tmpdir.join(rel_path)) for rel_path in rel_paths))
+
+    items, result = testdir.inline_genitems('--goodplay-changed-files', 'changed_files')
+    result.assertoutcome()
+
+    return [item.name for item in items]
+
+
+@pytest.mark.parametrize('changed_path,collected_names', [
+    ('role1/tasks/main.yml', ['role1 test task']),
+    ('role2/tasks/main.yml', ['role1 test task']),
+    ('role3/tests/test_playbook.yml', ['role3 test task']),
+    ('playbooks/roles/role4/tasks/main.yml', ['playbook test task']),
+    ('README.md', []),
+])
+def test_only_playbooks_affected_by_changed_files_are_collected(
+        testdir, role_tree, changed_path, collected_names):
+    assert collected_names_with_changed_files(testdir, changed_path) == collected_names
+
+
+def test_all_playbooks_are_collected_without_impact_selection(testdir, role_tree):
+    items, result = testdir.inline_genitems()
+
+    assert [item.name for item in items] == \
+        ['playbook test task', 'role1 test task', 'role3 test task']
+
+
+def git_commit_all(path):
+    git = ['git', '-c', 'user.name=goodplay', '-c', 'user.email=goodplay@example.com']
+    subprocess.check_call(git + ['init', '-q'], cwd=str(path))
+    subprocess.check_call(git + ['add', '.'], cwd=str(path))
+    subprocess.check_call(git + ['commit', '-q', '-m', 'initial'], cwd=str(path))
+
+
+def test_playbooks_affected_by_changes_since_git_revision_are_collected(testdir, role_tree):
+    git_commit_all(role_tree)
+
+    role_tree.join('role2', 'tasks', 'main.yml').write('- name: changed role2 task\n  ping:\n')
+    role_tree.join('role3', 'defaults', 'main.yml').write('var: value\n', ensure=True)
+
+    items, result = testdir.inline_genitems('--goodplay-changed-since', 'HEAD')
+
+    assert [item.name for item in items] == ['role1 test task', 'role3 test task']
+
+
+def test_changes_since_git_revision_are_found_from_subdirectory(
+        testdir, role_tree, monkeypatch):
+    git_commit_all(role_tree)
+
+    role_tree.join('role3', 'defaults', 'main.yml').write('var: value\n', ensure=True)
+    monkeypatch.chdir(role_tree.join('role3'))
+
+    items, result = testdir.inline_genitems('--goodplay-changed-since', 'HEAD')
+
+    assert [item.name for item in items] == ['role3 test task']
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from goodplay.cache import MemoryCache, ResultCache
+from goodplay_helpers import smart_create
+
+
+def test_result_cache_reuses_outcomes_of_same_fingerprint_only():
+    result_cache = ResultCache(MemoryCache())
+    result_cache.set_outcomes('test_playbook.yml', None, 'fingerprint1', dict(task1='passed'))
+
+    assert result_cache.get_outcomes('test_playbook.yml', None, 'fingerprint1') == \
+        dict(task1='passed')
+    assert result_cache.get_outcomes('test_playbook.yml', None, 'fingerprint2') is None
+    assert result_cache.get_outcomes('test_playbook.yml', 'EL:7', 'fingerprint1') is None
+
+
+def test_result_cache_does_not_reuse_outcomes_on_rerun():
+    cache = MemoryCache()
+    ResultCache(cache).set_outcomes('test_playbook.yml', None, 'fingerprint1', {})
+
+    assert ResultCache(cache, rerun=True).get_outcomes(
+        'test_playbook.yml', None, 'fingerprint1') is None
+
+
+def test_result_cache_discards_outcomes():
+    result_cache = ResultCache(MemoryCache())
+    result_cache.set_outcomes('test_playbook.yml', None, 'fingerprint1', dict(task1='passed'))
+    result_cache.discard('test_playbook.yml', None)
+
+    assert result_cache.get_outcomes('test_playbook.yml', None, 'fingerprint1') is None
+
+
+def create_counting_playbook(base_path, test_task_options=''):
+    smart_create(base_path, '''
+    ## tests/inventory
+    127.0.0.1 ansible_connection=local
+
+    ## tests/test_playbook.yml
+    - hosts: 127.0.0.1
+      gather_facts: no
+      tasks:
+        - name: count run
+          shell: echo run >> {{ playbook_dir }}/../runs
+
+        - name: task1
+          ping:
+          tags: test
+          ''' + test_task_options + '''
+    ''')
+
+
+def run_count(base_path):
+    return len(base_path.join('runs').readlines())
+
+
+@pytest.mark.integration
+def test_outcomes_of_unchanged_passing_playbook_are_reused(testdir):
+    create_counting_playbook(testdir.tmpdir)
+
+    testdir.inline_run('--goodplay-result-cache').assertoutcome(passed=1)
+    testdir.inline_run('--goodplay-result-cache').assertoutcome(passed=1)
+
+    assert run_count(testdir.tmpdir) == 1
+
+
+@pytest.mark.integration
+def test_changed_playbook_is_run_again(testdir):
+    create_counting_playbook(testdir.tmpdir)
+    testdir.inline_run('--goodplay-result-cache').assertoutcome(passed=1)
+
+    testdir.tmpdir.join('tests', 'inventory').write(
+        '127.0.0.1 ansible_connection=local ansible_python_interpreter=python2\n')
+    testdir.inline_run('--goodplay-result-cache').assertoutcome(passed=1)
+
+    assert run_count(testdir.tmpdir) == 2
+
+
+@pytest.mark.integration
+def test_playbook_is_run_again_when_included_file_changes(testdir):
+    create_counting_playbook(testdir.tmpdir)
+    testdir.tmpdir.join('tests', 'test_playbook.yml').write(
+        '    - include: tasks/extra.yml\n', mode='a')
+    extra_tasks_path = testdir.tmpdir.join('tests', 'tasks', 'extra.yml')
+    extra_tasks_path.write('- ping:\n', ensure=True)
+    testdir.inline_run('--goodplay-result-cache').assertoutcome(passed=1)
+
+    extra_tasks_path.write('- ping:\n- ping:\n')
+    testdir.inline_run('--goodplay-result-cache').assertoutcome(passed=1)
+
+    assert run_count(testdir.tmpdir) == 2
+
+
+@pytest.mark.integration
+def test_playbook_is_run_again_on_rerun(testdir):
+    create_counting_playbook(testdir.tmpdir)
+
+    testdir.inline_run('--goodplay-result-cache').assertoutcome(passed=1)
+    testdir.inline_run('--goodplay-result-cache', '--goodplay-rerun').assertoutcome(passed=1)
+
+    assert run_count(testdir.tmpdir) == 2
+
+
+@pytest.mark.integration
+def test_outcomes_of_failing_playbook_are_not_reused(testdir):
+    create_counting_playbook(testdir.tmpdir, test_task_options='changed_when: True')
+
+    testdir.inline_run('--goodplay-result-cache').assertoutcome(failed=1)
+    testdir.inline_run('--goodplay-result-cache').assertoutcome(failed=1)
+
+    assert run_count(testdir.tmpdir) == 2
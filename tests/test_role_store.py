@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+import pytest
+
+from goodplay.ansible_support import DependencyResolver, Lockfile, RoleStore
+from goodplay.ansible_support.role_store import galaxy_install
+
+
+@pytest.fixture
+def galaxy_install_mock(mocker):
+    def galaxy_install(requirements_path, roles_path):
+        requirement = requirements_path.read()
+        role_name = 'role1' if 'role1' in requirement else 'role2'
+        roles_path.join(role_name, 'meta', 'main.yml').write(requirement, ensure=True)
+
+    return mocker.patch(
+        'goodplay.ansible_support.role_store.galaxy_install', side_effect=galaxy_install)
+
+
+@pytest.fixture
+def role_store(tmpdir):
+    return RoleStore(tmpdir.join('store').ensure(dir=True))
+
+
+@pytest.fixture
+def lockfile(tmpdir):
+    return Lockfile(tmpdir.join('goodplay.lock'), tmpdir.join('archives'))
+
+
+def offline_role_store(tmpdir, lockfile_path):
+    return RoleStore(
+        tmpdir.join('offline-store').ensure(dir=True),
+        lockfile=Lockfile(lockfile_path, tmpdir.join('archives')), offline=True)
+
+
+def test_install_is_reused(role_store, galaxy_install_mock):
+    requirement = dict(src='user.role1', version='v1')
+
+    first_result = role_store.install(requirement)
+    second_result = role_store.install(requirement)
+
+    assert first_result == second_result
+    assert first_result.join('role1', 'meta', 'main.yml').check(file=True)
+    assert galaxy_install_mock.call_count == 1
+
+
+def test_install_of_different_version_is_not_reused(role_store, galaxy_install_mock):
+    first_result = role_store.install(dict(src='user.role1', version='v1'))
+    second_result = role_store.install(dict(src='user.role1', version='v2'))
+
+    assert first_result != second_result
+    assert galaxy_install_mock.call_count == 2
+
+
+def test_failed_galaxy_install_reports_galaxy_errors(tmpdir):
+    requirements_path = tmpdir.join('requirements.yml')
+    requirements_path.write(
+        '- src: {0!s}\n  name: missing\n'.format(tmpdir.join('missing.tar.gz')))
+
+    with pytest.raises(Exception) as excinfo:
+        galaxy_install(requirements_path, tmpdir.join('roles'))
+
+    assert 'ansible-galaxy failed to install' in str(excinfo.value)
+    assert 'ERROR!' in str(excinfo.value)
+
+
+def test_key_of_local_source_depends_on_content(tmpdir, role_store):
+    archive_path = tmpdir.join('role1.tar.gz')
+    archive_path.write('content1')
+    requirement = dict(src=str(archive_path), name='role1')
+
+    first_key = role_store.key(requirement)
+    archive_path.write('content2')
+
+    assert role_store.key(requirement) != first_key
+
+
+def test_link_makes_installed_roles_available(tmpdir, role_store, galaxy_install_mock):
+    roles_path = tmpdir.join('roles').ensure(dir=True)
+
+    role_store.link(dict(src='user.role1'), roles_path)
+
+    assert roles_path.join('role1').check(link=True)
+    assert roles_path.join('role1', 'meta', 'main.yml').check(file=True)
+
+
+def test_link_later_requirement_takes_precedence(tmpdir, role_store, galaxy_install_mock):
+    roles_path = tmpdir.join('roles').ensure(dir=True)
+
+    role_store.link(dict(src='user.role1', version='v1'), roles_path)
+    role_store.link(dict(src='user.role1', version='v2'), roles_path)
+
+    assert 'v2' in roles_path.join('role1', 'meta', 'main.yml').read()
+
+
+def test_evict_removes_least_recently_used_entries(role_store, galaxy_install_mock):
+    first_entry = role_store.install(dict(src='user.role1')).dirpath()
+    second_entry = role_store.install(dict(src='user.role2')).dirpath()
+    first_entry.setmtime(1000)
+    second_entry.setmtime(2000)
+
+    role_store.max_size = int(second_entry.join('size').read())
+    role_store.evict()
+
+    assert not first_entry.check()
+    assert second_entry.check(dir=True)
+
+
+def test_evict_without_max_size_keeps_entries(role_store, galaxy_install_mock):
+    entry = role_store.install(dict(src='user.role1')).dirpath()
+
+    role_store.evict()
+
+    assert entry.check(dir=True)
+
+
+def test_resolver_installs_shared_requirement_once(tmpdir, role_store, galaxy_install_mock):
+    resolver = DependencyResolver(role_store, workers=2)
+    first_roles_path = tmpdir.join('roles1').ensure(dir=True)
+    second_roles_path = tmpdir.join('roles2').ensure(dir=True)
+    requirement = dict(src='user.role1')
+
+    resolver.prefetch([requirement, dict(src='user.role2')])
+    resolver.prefetch([requirement])
+    resolver.link(requirement, first_roles_path)
+    resolver.link(requirement, second_roles_path)
+    resolver.close()
+
+    assert galaxy_install_mock.call_count == 2
+    assert first_roles_path.join('role1', 'meta', 'main.yml').check(file=True)
+    assert second_roles_path.join('role1', 'meta', 'main.yml').check(file=True)
+
+
+def test_resolver_wakes_up_all_threads_installing_same_requirement(
+        tmpdir, role_store, galaxy_install_mock):
+    resolver = DependencyResolver(role_store, workers=2)
+    installations = []
+
+    for _ in range(3):
+        installation = threading.Thread(target=resolver.install, args=(dict(src='user.role1'),))
+        installation.daemon = True
+        installation.start()
+        installations.append(installation)
+    for installation in installations:
+        installation.join(5)
+        assert not installation.is_alive()
+    resolver.close()
+
+    assert galaxy_install_mock.call_count == 1
+
+
+def test_resolver_links_in_requirement_order(tmpdir, role_store, galaxy_install_mock):
+    resolver = DependencyResolver(role_store, workers=2)
+    roles_path = tmpdir.join('roles').ensure(dir=True)
+    requirements = [dict(src='user.role1', version='v1'), dict(src='user.role1', version='v2')]
+
+    resolver.prefetch(requirements)
+    for requirement in requirements:
+        resolver.link(requirement, roles_path)
+    resolver.close()
+
+    assert 'v2' in roles_path.join('role1', 'meta', 'main.yml').read()
+
+
+def test_locked_dependency_is_installed_offline(tmpdir, lockfile, galaxy_install_mock):
+    requirement = dict(src='user.role1', version='v1')
+    RoleStore(tmpdir.join('store').ensure(dir=True), lockfile=lockfile).install(requirement)
+    lockfile.save()
+    galaxy_install_mock.reset_mock()
+
+    role_store = offline_role_store(tmpdir, lockfile.lockfile_path)
+    installed_roles_path = role_store.install(requirement)
+
+    assert 'v1' in installed_roles_path.join('role1', 'meta', 'main.yml').read()
+    assert galaxy_install_mock.call_count == 0
+
+
+def test_locked_dependency_given_by_name_is_installed_offline(
+        tmpdir, lockfile, galaxy_install_mock):
+    RoleStore(tmpdir.join('store').ensure(dir=True), lockfile=lockfile).install('user.role1')
+    lockfile.save()
+
+    role_store = offline_role_store(tmpdir, lockfile.lockfile_path)
+    installed_roles_path = role_store.install('user.role1')
+
+    assert installed_roles_path.join('role1', 'meta', 'main.yml').check(file=True)
+    assert galaxy_install_mock.call_count == 1
+
+
+def test_offline_install_of_unlocked_dependency_fails(tmpdir, galaxy_install_mock):
+    role_store = offline_role_store(tmpdir, tmpdir.join('goodplay.lock'))
+
+    with pytest.raises(Exception) as excinfo:
+        role_store.install(dict(src='user.role1'))
+
+    assert "Dependency 'user.role1' is not locked in" in str(excinfo.value)
+    assert galaxy_install_mock.call_count == 0
+
+
+def test_offline_install_of_tampered_archive_fails(tmpdir, lockfile, galaxy_install_mock):
+    requirement = dict(src='user.role1')
+    RoleStore(tmpdir.join('store').ensure(dir=True), lockfile=lockfile).install(requirement)
+    lockfile.save()
+    for archive_file_path in lockfile.archive_path.listdir():
+        archive_file_path.write('tampered')
+
+    role_store = offline_role_store(tmpdir, lockfile.lockfile_path)
+
+    with pytest.raises(Exception) as excinfo:
+        role_store.install(requirement)
+
+    assert 'does not match its checksum' in str(excinfo.value)
+
+
+def test_offline_install_of_unlocked_dependency_in_role_store_fails(
+        tmpdir, role_store, galaxy_install_mock):
+    role_store.install(dict(src='user.role1'))
+    role_store.offline = True
+    role_store.lockfile = Lockfile(tmpdir.join('goodplay.lock'), tmpdir.join('archives'))
+
+    with pytest.raises(Exception) as excinfo:
+        role_store.install(dict(src='user.role1'))
+
+    assert "Dependency 'user.role1' is not locked in" in str(excinfo.value)
+
+
+def test_offline_install_uses_locked_archive_over_role_store_entry(
+        tmpdir, role_store, lockfile, galaxy_install_mock):
+    requirement = dict(src='user.role1')
+    role_store.lockfile = lockfile
+    role_store.install(requirement)
+    lockfile.save()
+    role_store.install(requirement).join('role1', 'meta', 'main.yml').write('changed')
+
+    role_store.offline = True
+    role_store.lockfile = Lockfile(lockfile.lockfile_path, lockfile.archive_path)
+    installed_roles_path = role_store.install(requirement)
+
+    assert installed_roles_path.join('role1', 'meta', 'main.yml').read() != 'changed'
+    assert galaxy_install_mock.call_count == 1
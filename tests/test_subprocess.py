@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+import pytest
+
+from goodplay.utils.subprocess import Capture, queue, run, spawn_lock
+
+
+def test_output_exceeding_capture_buffer_is_fully_read():
+    process = run('seq 1 {0}', 100, async=True)
+    process.wait_events()
+    process.stdout.buffer.maxsize = 10
+
+    lines = list(process.stdout)
+    process.wait()
+
+    assert lines == [b'%d\n' % number for number in range(1, 101)]
+    assert process.returncode == 0
+
+
+def test_output_exceeding_capture_buffer_is_kept_when_run_synchronously():
+    process = run('seq 1 {0}', Capture.default_max_lines + 100000)
+
+    assert process.returncode == 0
+    assert len(process.stdout.readlines()) == Capture.default_max_lines + 100000
+
+
+def test_readline_times_out_while_process_is_quiet():
+    process = run('sh -c {0}', 'sleep 1; echo done', async=True)
+    process.wait_events()
+
+    with pytest.raises(queue.Empty):
+        process.stdout.readline(timeout=0.01)
+
+    assert process.stdout.readline() == b'done\n'
+    assert process.stdout.readline() == b''
+    process.wait()
+
+
+def test_readlines_stops_once_sizehint_is_reached():
+    process = run('seq 1 {0}', 5, async=True)
+    process.wait_events()
+
+    assert process.stdout.readlines(3) == [b'1\n', b'2\n']
+    assert process.stdout.readlines() == [b'3\n', b'4\n', b'5\n']
+    process.wait()
+
+
+def test_readlines_returns_lines_read_until_timeout():
+    process = run('sh -c {0}', 'echo first; sleep 1; echo second', async=True)
+    process.wait_events()
+
+    assert process.stdout.readlines(timeout=0.5) == [b'first\n']
+    assert process.stdout.readlines() == [b'second\n']
+    process.wait()
+
+
+def test_readline_without_streams_returns_empty_string():
+    assert Capture().readline() == b''
+
+
+def test_processes_are_started_one_at_a_time():
+    processes = []
+    starter = threading.Thread(target=lambda: processes.append(run('true', async=True)))
+    starter.daemon = True
+
+    with spawn_lock:
+        starter.start()
+        starter.join(0.1)
+        started_while_locked = bool(processes)
+    starter.join(5)
+    processes[0].wait()
+
+    assert not started_while_locked
+    assert processes[0].returncode == 0
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+import py.path
+
+from goodplay.docker_support import DockerRunner, WarmContainers
+from goodplay.watch import FileWatcher, Watch, changed_paths_between
+
+
+def test_changed_paths_between_snapshots():
+    previous_snapshot = dict(unchanged=(1, 10), modified=(1, 10), removed=(1, 10))
+    snapshot = dict(unchanged=(1, 10), modified=(2, 10), added=(1, 10))
+
+    assert changed_paths_between(previous_snapshot, snapshot) == \
+        [py.path.local(name) for name in ('added', 'modified', 'removed')]
+
+
+def test_file_watcher_ignores_hidden_files(tmpdir):
+    tmpdir.join('test_playbook.yml').write('')
+    tmpdir.join('.cache', 'v', 'entry').write('', ensure=True)
+
+    assert list(FileWatcher(tmpdir).snapshot()) == [str(tmpdir.join('test_playbook.yml'))]
+
+
+def test_file_watcher_waits_for_changes(tmpdir):
+    playbook_path = tmpdir.join('test_playbook.yml')
+    playbook_path.write('')
+    watcher = FileWatcher(tmpdir, interval=0.01)
+    snapshot = watcher.snapshot()
+
+    playbook_path.write('- hosts: all\n')
+    _, changed_paths = watcher.wait_for_changes(snapshot)
+
+    assert changed_paths == [playbook_path]
+
+
+class FakeWatcher(object):
+    def __init__(self, changed_paths):
+        self.changed_paths = changed_paths
+
+    def snapshot(self):
+        return {}
+
+    def wait_for_changes(self, previous_snapshot):
+        return {}, self.changed_paths
+
+
+def test_watch_reruns_playbooks_affected_by_changes(mocker):
+    watch = Watch(['-v'], [], watcher=FakeWatcher([py.path.local('/roles/role1/tasks/main.yml')]))
+    changed_files = []
+
+    def fake_main(args, plugins):
+        if '--goodplay-changed-files' in args:
+            changed_files.append(py.path.local(args[-1]).read())
+            watch.interrupted = True
+        return 0
+
+    main_mock = mocker.patch('pytest.main', side_effect=fake_main)
+
+    watch.run()
+
+    assert [call[0][0][:1] for call in main_mock.call_args_list] == [['-v'], ['-v']]
+    assert changed_files == ['/roles/role1/tasks/main.yml']
+
+
+def test_warm_containers_are_removed(mocker):
+    client = mocker.Mock()
+    warm_containers = WarmContainers()
+    warm_containers.put('key', client, dict(Id='container1'))
+
+    warm_containers.remove_all()
+
+    client.remove_container.assert_called_once_with(dict(Id='container1'), force=True)
+    assert warm_containers.take('key') is None
+
+
+def test_docker_runner_reuses_warm_containers(mocker):
+    client = mocker.patch('docker.Client', autospec=True).return_value
+    client.create_container.return_value = dict(Id='container1')
+    client.inspect_container.return_value = dict(State=dict(Running=True))
+
+    ctx = mocker.Mock()
+    ctx.session.getoption.side_effect = lambda name, default=None: default
+    ctx.session.warm_containers = WarmContainers()
+    ctx.session.container_pool = None
+    host = mocker.Mock()
+    host.vars.return_value = dict(inventory_hostname='host1', goodplay_image='centos:7')
+    ctx.inventory.hosts.return_value = [host]
+
+    first_runner = DockerRunner(ctx)
+    list(first_runner.start_containers())
+    first_runner.teardown()
+
+    second_runner = DockerRunner(ctx)
+    list(second_runner.start_containers())
+
+    assert second_runner.running_containers == [dict(Id='container1')]
+    assert client.create_container.call_count == 1
+    assert not client.remove_container.called
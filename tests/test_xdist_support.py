@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from goodplay_helpers import smart_create
+
+pytest.importorskip('xdist')
+
+from goodplay.plugin import register_xdist_support  # noqa: E402
+from goodplay.xdist_support import GoodplayScheduling, scope_of  # noqa: E402
+
+
+class MockGateway(object):
+    id = 'gw'
+
+
+class MockNode(object):
+    def __init__(self):
+        self.gateway = MockGateway()
+        self.sent = []
+        self.shutting_down = False
+
+    def send_runtest_some(self, indices):
+        self.sent.extend(indices)
+
+    def shutdown(self):
+        self.shutting_down = True
+
+
+class MockConfig(object):
+    def __init__(self, batch=False):
+        self.batch = batch
+
+    def getoption(self, name):
+        return dict(tx=['popen', 'popen'], numprocesses=None, dist='load',
+                    goodplay_batch=self.batch)[name]
+
+    def getvalue(self, name):
+        return self.getoption(name)
+
+
+def test_distribution_fails_without_scheduler_hook_support():
+    config = MockConfig()
+    config.hook = object()
+
+    with pytest.raises(pytest.UsageError) as excinfo:
+        register_xdist_support(config)
+
+    assert 'pytest-xdist 1.16 or later' in str(excinfo.value)
+
+
+@pytest.mark.parametrize('nodeid,scope', [
+    ('test_playbook.yml::task1', 'test_playbook.yml'),
+    ('tests/test_playbook.yml::EL:7::task1', 'tests/test_playbook.yml::EL:7'),
+    ('tests/test_module.py::test_func', 'tests/test_module.py::test_func'),
+])
+def test_scope_of(nodeid, scope):
+    assert scope_of(nodeid) == scope
+
+
+@pytest.mark.parametrize('nodeid,scope', [
+    ('tests/test_playbook.yml::task1', 'tests'),
+    ('tests/test_playbook.yml::EL:7::task1', 'tests/test_playbook.yml::EL:7'),
+    ('tests/test_module.py::test_func', 'tests/test_module.py::test_func'),
+])
+def test_scope_of_batched_playbooks(nodeid, scope):
+    assert scope_of(nodeid, batch=True) == scope
+
+
+def test_scheduling_sends_whole_playbook_platform_groups():
+    collection = [
+        'test_playbook1.yml::EL:6::task1',
+        'test_playbook1.yml::EL:6::task2',
+        'test_playbook1.yml::EL:7::task1',
+        'test_playbook1.yml::EL:7::task2',
+        'test_playbook2.yml::task1',
+    ]
+    scheduling = GoodplayScheduling(MockConfig())
+    first_node, second_node = add_node(scheduling, collection), add_node(scheduling, collection)
+
+    scheduling.schedule()
+
+    assert sorted([first_node.sent, second_node.sent]) == [[0, 1], [2, 3]]
+
+    node = first_node if first_node.sent == [0, 1] else second_node
+    scheduling.mark_test_complete(node, 0)
+
+    assert node.sent == [0, 1, 4]
+    assert not scheduling.pending
+
+
+def add_node(scheduling, collection):
+    node = MockNode()
+    scheduling.add_node(node)
+    scheduling.add_node_collection(node, collection)
+
+    return node
+
+
+@pytest.mark.integration
+def test_tests_of_playbook_are_run_by_same_xdist_worker(testdir):
+    smart_create(testdir.tmpdir, '''
+    ## inventory
+    127.0.0.1 ansible_connection=local
+
+    ## test_playbook1.yml
+    - hosts: 127.0.0.1
+      gather_facts: no
+      tasks:
+        - name: task1
+          ping:
+          tags: test
+        - name: task2
+          ping:
+          tags: test
+
+    ## test_playbook2.yml
+    - hosts: 127.0.0.1
+      gather_facts: no
+      tasks:
+        - name: task1
+          ping:
+          tags: test
+        - name: task2
+          ping:
+          tags: test
+    ''')
+
+    result = testdir.runpytest('-n', '2', '-v')
+
+    result.assert_outcomes(passed=4)
+    assert len(workers_running(result, 'test_playbook1.yml')) == 1
+    assert len(workers_running(result, 'test_playbook2.yml')) == 1
+
+
+def workers_running(result, playbook_name):
+    return set(line.split()[0] for line in result.outlines
+               if line.startswith('[gw') and playbook_name in line)